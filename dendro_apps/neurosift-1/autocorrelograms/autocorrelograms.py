@@ -1,5 +1,6 @@
 from dendro.sdk import ProcessorBase, InputFile, OutputFile
 from dendro.sdk import BaseModel, Field
+from typing import List
 import numpy as np
 import time
 
@@ -7,6 +8,14 @@ import time
 class AutocorrelogramsContext(BaseModel):
     input: InputFile = Field(description="Input .nwb.lindi.json file")
     output: OutputFile = Field(description="Output .nwb.lindi.json file")
+    num_workers: int = Field(default=1, description="Number of worker processes for computing the autocorrelograms (0 means use all CPUs allocated to the job)")
+    memory_budget_mb: int = Field(default=0, description="If greater than 0, stream the spike times in unit-aligned chunks so that peak memory for the spike data stays within about this many MB (0 means load all spike times at once)")
+    attach_run_metrics: bool = Field(default=False, description="If true, store the per-stage timing and memory summary of the run in the run_metrics attribute of the autocorrelogram dataset")
+    num_upload_threads: int = Field(default=4, description="Number of blobs of the output uploaded at the same time")
+    window_sizes_msec: List[float] = Field(default=[100], description="Window sizes in milliseconds of the autocorrelograms, one per resolution. The first resolution is stored in the autocorrelogram column and the others in autocorrelogram_<window>ms_<bin>ms columns")
+    bin_sizes_msec: List[float] = Field(default=[1], description="Bin sizes in milliseconds of the autocorrelograms, one per entry of window_sizes_msec. Each must be an odd multiple of the smallest one, since all the resolutions are derived from a single pass at the finest one")
+    chunk_cache_dir: str = Field(default='', description="If set, the chunks of the input that are read from remote storage are cached in this directory (which can be shared by the jobs running on a node), so that other jobs on the same asset or a rerun don't download them again")
+    chunk_cache_max_mb: int = Field(default=10000, description="Size cap of the chunk cache in MB; the least recently used chunks are removed beyond it")
 
 
 class AutocorrelogramsProcessor(ProcessorBase):
@@ -18,79 +27,58 @@ class AutocorrelogramsProcessor(ProcessorBase):
 
     @staticmethod
     def run(context: AutocorrelogramsContext):
+        import os
         import shutil
-        import h5py
-        import uuid
         import lindi
         import kachery_cloud as kcl
-        from .helpers.compute_correlogram_data import compute_correlogram_data
+        from .helpers.rebin_correlograms import get_finest_resolution
+        from common.instrumentation import RunMetrics
+        from common.blob_upload import BlobUploader, upload_staging_store
+        from common.lindi_inputs import open_lindi_input
+        from common.chunk_cache import ChunkCache
+        from common.nwb_index import NwbIndex
+
+        metrics = RunMetrics(processor_name=AutocorrelogramsProcessor.name)
+
+        if len(context.window_sizes_msec) != len(context.bin_sizes_msec):
+            raise ValueError('window_sizes_msec and bin_sizes_msec must have the same length')
+        resolutions = list(zip(context.window_sizes_msec, context.bin_sizes_msec))
+        # all the resolutions are derived from the histogram at the finest one
+        finest_resolution = get_finest_resolution(resolutions)
 
         # Load the h5py-like client from remote nwb .zarr.json file
 
         with lindi.StagingArea.create('staging') as staging_area:
-            client = lindi.LindiH5pyFile.from_reference_file_system(context.input.get_url(), mode='r+', staging_area=staging_area)
-            # Load the spike times from the units group
-            units_group = client['/units']
-            assert isinstance(units_group, h5py.Group)
-            print('Loading spike times')
-            spike_times = units_group['spike_times'][()]  # type: ignore
-            spike_times_index = units_group['spike_times_index'][()]  # type: ignore
-            num_units = len(spike_times_index)
-            total_num_spikes = len(spike_times)
-            print(f'Loaded {num_units} units with {total_num_spikes} total spikes')
-
-            # Compute autocorrelograms for all the units
-            print('Computing autocorrelograms')
-            auto_correlograms = []
-            p = 0
-            timer = time.time()
-            for i in range(num_units):
-                spike_train = spike_times[p:spike_times_index[i]]
-                elapsed = time.time() - timer
-                if elapsed > 2:
-                    print(f'Computing autocorrelogram for unit {i + 1} of {num_units} ({len(spike_train)} spikes)')
-                    timer = time.time()
-                r = compute_correlogram_data(
-                    spike_train_1=spike_train,
-                    spike_train_2=None,
-                    window_size_msec=100,
-                    bin_size_msec=1
-                )
-                bin_edges_sec = r['bin_edges_sec']
-                bin_counts = r['bin_counts']
-                auto_correlograms.append({
-                    'bin_edges_sec': bin_edges_sec,
-                    'bin_counts': bin_counts
-                })
-                p = spike_times_index[i]
-            autocorrelograms_array = np.zeros(
-                (num_units, len(auto_correlograms[0]['bin_counts'])),
-                dtype=np.uint32
-            )
-            for i, ac in enumerate(auto_correlograms):
-                autocorrelograms_array[i, :] = ac['bin_counts']
-
-            # Create a new dataset in the units group to store the autocorrelograms
-            print('Writing autocorrelograms to output file')
-            ds = units_group.create_dataset('autocorrelogram', data=autocorrelograms_array)
-            ds.attrs['bin_edges_sec'] = auto_correlograms[0]['bin_edges_sec'].tolist()
-            ds.attrs['description'] = 'the autocorrelogram for each spike unit'
-            ds.attrs['namespace'] = 'hdmf-common'
-            ds.attrs['neurodata_type'] = 'VectorData'
-            ds.attrs['object_id'] = str(uuid.uuid4())
-
-            # Update the colnames attribute of the units group
-            colnames = units_group.attrs['colnames']
-            assert isinstance(colnames, np.ndarray)
-            colnames = colnames.tolist()
-            colnames.append('autocorrelogram')
-            units_group.attrs['colnames'] = colnames
+            # remote chunks of the input are read through the cache, if enabled
+            chunk_cache = ChunkCache(directory=context.chunk_cache_dir, max_size_bytes=context.chunk_cache_max_mb * 1024 * 1024) if context.chunk_cache_dir else None
+            with metrics.stage('read'):
+                client = open_lindi_input(context.input.get_url(), staging_area=staging_area, local_cache=chunk_cache)
+            # The units tables are found from the zarr metadata, so those
+            # outside of /units (e.g. in processing modules) are included
+            nwb_index = NwbIndex.from_lindi_file(client)
+            units_paths = [
+                obj.path for obj in nwb_index.find('Units')
+                if nwb_index.get_child(obj, 'spike_times') is not None and nwb_index.get_child(obj, 'spike_times_index') is not None
+            ]
+            if len(units_paths) == 0:
+                raise Exception('No units table with spike times found')
+            datasets = []
+            for units_path in units_paths:
+                print(f'Processing units table: {units_path}')
+                datasets.append(_add_autocorrelograms(
+                    client=client,
+                    units_path=units_path,
+                    context=context,
+                    metrics=metrics,
+                    resolutions=resolutions,
+                    finest_resolution=finest_resolution
+                ))
 
-            output_path = 'output.lindi.json'
+            if context.attach_run_metrics:
+                for ds in datasets:
+                    metrics.attach(ds.attrs)
 
-            def on_store_blob(filename: str):
-                url = kcl.store_file(filename)
-                return url
+            output_path = 'output.lindi.json'
 
             def on_store_main(filename: str):
                 shutil.copyfile(filename, output_path)
@@ -99,10 +87,167 @@ class AutocorrelogramsProcessor(ProcessorBase):
             staging_store = client.staging_store
             assert staging_store is not None
             print('Uploading supporting files')
-            staging_store.upload(
-                on_store_blob=on_store_blob,
-                on_store_main=on_store_main
-            )
+            with metrics.stage('staging'), BlobUploader(store_file=kcl.store_file, num_threads=context.num_upload_threads, metrics=metrics) as uploader:
+                upload_staging_store(
+                    staging_store,
+                    staging_directory=staging_area.directory,
+                    uploader=uploader,
+                    on_store_main=on_store_main
+                )
 
             print('Uploading output file')
-            context.output.upload(output_path)
+            with metrics.stage('main_upload') as s:
+                context.output.upload(output_path)
+                s.bytes_written += os.path.getsize(output_path)
+
+            if chunk_cache is not None:
+                chunk_cache.report()
+
+        metrics.emit()
+
+
+def _add_autocorrelograms(*, client, units_path: str, context: AutocorrelogramsContext, metrics, resolutions: list, finest_resolution: tuple):
+    # adds the autocorrelogram columns to a units table and returns the
+    # dataset of the first resolution
+    import h5py
+    import uuid
+    from .helpers.compute_autocorrelograms_batch import compute_autocorrelograms_batch, get_unit_shards
+    from .helpers.compute_autocorrelograms_parallel import AutocorrelogramsPool, compute_autocorrelograms_parallel, get_num_available_cpus
+    from .helpers.compute_correlogram_data import _get_bin_edges_msec
+    from .helpers.stream_spike_times import get_max_spikes_per_chunk, iter_spike_times_chunks
+    from .helpers.rebin_correlograms import rebin_correlograms
+
+    window_size_msec, bin_size_msec = finest_resolution
+    # the bins are centred on 0, so their number is odd and is that of the
+    # computed bin edges rather than window_size_msec / bin_size_msec
+    num_fine_bins = len(_get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)) - 1
+
+    # Load the spike times from the units table
+    units_group = client[units_path]
+    assert isinstance(units_group, h5py.Group)
+    spike_times_dataset = units_group['spike_times']
+    assert isinstance(spike_times_dataset, h5py.Dataset)
+    # reads of the spike times (also in the streaming prefetch
+    # thread) are recorded in the read stage
+    spike_times_dataset = metrics.timed_reads(spike_times_dataset)
+    spike_times_index = metrics.timed_reads(units_group['spike_times_index'])[()]
+    num_units = len(spike_times_index)
+    total_num_spikes = spike_times_dataset.shape[0]
+    num_workers = context.num_workers if context.num_workers > 0 else get_num_available_cpus()
+    if context.memory_budget_mb > 0:
+        # read the spike times in unit-aligned chunks, prefetching the next one;
+        # the fixed overhead is the index arrays and the output matrix, and
+        # with worker processes the shared memory also holds a copy of the
+        # chunk being computed with its index and output rows
+        fixed_overhead_bytes = spike_times_index.nbytes * 2 + num_units * 4 * num_fine_bins * (len(resolutions) + 1)
+        extra_bytes_per_spike = 0
+        if num_workers > 1:
+            fixed_overhead_bytes += AutocorrelogramsPool.get_shared_memory_bytes(max_num_spikes=0, max_num_units=num_units, num_bins=num_fine_bins)
+            extra_bytes_per_spike = AutocorrelogramsPool.get_shared_memory_bytes(max_num_spikes=1, max_num_units=0, num_bins=num_fine_bins)
+        max_spikes_per_chunk = get_max_spikes_per_chunk(
+            memory_budget_bytes=context.memory_budget_mb * 1024 * 1024,
+            fixed_overhead_bytes=fixed_overhead_bytes,
+            extra_bytes_per_spike=extra_bytes_per_spike
+        )
+        print(f'Streaming spike times for {num_units} units with {total_num_spikes} total spikes (up to {max_spikes_per_chunk} spikes per chunk)')
+        spike_times = spike_times_dataset
+    else:
+        print('Loading spike times')
+        spike_times = spike_times_dataset[()]
+        print(f'Loaded {num_units} units with {total_num_spikes} total spikes')
+        max_spikes_per_chunk = total_num_spikes if num_workers > 1 else 10_000_000
+    chunks = get_unit_shards(spike_times_index=spike_times_index, max_spikes_per_shard=max(max_spikes_per_chunk, 1))
+
+    # Compute autocorrelograms for all the units, a chunk of units at a time
+    print('Computing autocorrelograms')
+    if num_workers > 1:
+        print(f'Using {num_workers} worker processes')
+    bin_edges_sec = None
+    autocorrelograms_array = None
+    # the worker processes and their shared memory are reused for all the
+    # chunks
+    pool = None
+    if num_workers > 1 and len(chunks) > 0:
+        pool = AutocorrelogramsPool(
+            num_workers=num_workers,
+            max_num_spikes=max(int(spike_times_index[u2 - 1] - (spike_times_index[u1 - 1] if u1 > 0 else 0)) for u1, u2 in chunks),
+            max_num_units=max(u2 - u1 for u1, u2 in chunks),
+            window_size_msec=window_size_msec,
+            bin_size_msec=bin_size_msec
+        )
+    try:
+        timer = time.time()
+        for u1, u2, spike_times_chunk in iter_spike_times_chunks(spike_times=spike_times, spike_times_index=spike_times_index, shards=chunks):
+            elapsed = time.time() - timer
+            if elapsed > 2:
+                print(f'Computing autocorrelogram for unit {u1 + 1} of {num_units}')
+                timer = time.time()
+            p1 = spike_times_index[u1 - 1] if u1 > 0 else 0
+            with metrics.stage('compute'):
+                if pool is not None:
+                    r = compute_autocorrelograms_parallel(
+                        spike_times=spike_times_chunk,
+                        spike_times_index=spike_times_index[u1:u2] - p1,
+                        window_size_msec=window_size_msec,
+                        bin_size_msec=bin_size_msec,
+                        num_workers=num_workers,
+                        pool=pool
+                    )
+                else:
+                    r = compute_autocorrelograms_batch(
+                        spike_times=spike_times_chunk,
+                        spike_times_index=spike_times_index[u1:u2] - p1,
+                        window_size_msec=window_size_msec,
+                        bin_size_msec=bin_size_msec
+                    )
+            if autocorrelograms_array is None:
+                bin_edges_sec = r['bin_edges_sec']
+                autocorrelograms_array = np.zeros((num_units, len(bin_edges_sec) - 1), dtype=np.uint32)
+            autocorrelograms_array[u1:u2, :] = r['bin_counts']
+    finally:
+        if pool is not None:
+            # shut down within the compute stage so that the CPU time of the
+            # workers is counted there
+            with metrics.stage('compute'):
+                pool.close()
+    assert autocorrelograms_array is not None and bin_edges_sec is not None
+
+    # Create a new dataset in the units table to store the autocorrelograms
+    # at each resolution
+    print('Writing autocorrelograms to output file')
+    colnames = units_group.attrs['colnames']
+    assert isinstance(colnames, np.ndarray)
+    colnames = colnames.tolist()
+    datasets = []
+    for i, (resolution_window_size_msec, resolution_bin_size_msec) in enumerate(resolutions):
+        r = rebin_correlograms(
+            bin_counts=autocorrelograms_array,
+            bin_edges_sec=bin_edges_sec,
+            window_size_msec=resolution_window_size_msec,
+            bin_size_msec=resolution_bin_size_msec
+        )
+        if i == 0:
+            name = 'autocorrelogram'
+            description = 'the autocorrelogram for each spike unit'
+        else:
+            name = f'autocorrelogram_{_format_msec(resolution_window_size_msec)}ms_{_format_msec(resolution_bin_size_msec)}ms'
+            description = f'the autocorrelogram for each spike unit ({resolution_window_size_msec:g} ms window, {resolution_bin_size_msec:g} ms bins)'
+        with metrics.stage('write'):
+            ds = units_group.create_dataset(name, data=r['bin_counts'])
+        ds.attrs['bin_edges_sec'] = r['bin_edges_sec'].tolist()
+        ds.attrs['description'] = description
+        ds.attrs['namespace'] = 'hdmf-common'
+        ds.attrs['neurodata_type'] = 'VectorData'
+        ds.attrs['object_id'] = str(uuid.uuid4())
+        colnames.append(name)
+        datasets.append(ds)
+
+    # Update the colnames attribute of the units table
+    units_group.attrs['colnames'] = colnames
+
+    return datasets[0]
+
+
+def _format_msec(x: float) -> str:
+    # 500.0 -> '500', 0.5 -> '0p5' (for column names)
+    return f'{x:g}'.replace('.', 'p')
@@ -0,0 +1,114 @@
+from typing import List, Tuple, Union
+import numpy as np
+from .compute_correlogram_data import _get_bin_edges_msec, _get_half_bin_edges_msec, _get_half_bin_inds
+
+
+def compute_autocorrelograms_batch(
+    *,
+    spike_times: np.ndarray,
+    spike_times_index: np.ndarray,
+    window_size_msec: float = 100,
+    bin_size_msec: float = 1,
+    out: Union[np.ndarray, None] = None,
+    max_keys_per_bincount: int = 1 << 22
+):
+    """Compute the autocorrelograms of all units in a ragged spike_times array.
+
+    spike_times and spike_times_index use the NWB ragged encoding: the spikes
+    of unit i are spike_times[spike_times_index[i - 1]:spike_times_index[i]]
+    (starting at 0 for the first unit) and are assumed to be sorted.
+
+    All units are processed together, one lag offset at a time. At offset k
+    the spike pairs (j, j + k) are only kept while j + k stays within the
+    unit of j and the delta is within the window, so each pass only touches
+    pairs that still contribute. Deltas are accumulated into a single
+    (unit, bin) histogram with np.bincount.
+
+    The result is written to out (shape (num_units, num_bins), uint32) if
+    provided. The bin counts are identical to calling
+    compute_correlogram_data for each unit separately.
+    """
+    bin_edges_msec = _get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+    num_bins = len(bin_edges_msec) - 1
+    num_bins_half = int((num_bins + 1) / 2)
+    half_bin_edges_msec = _get_half_bin_edges_msec(bin_edges_msec)
+    max_delta_msec = half_bin_edges_msec[-1]
+
+    unit_ends = np.asarray(spike_times_index, dtype=np.int64)
+    num_units = len(unit_ends)
+    if out is None:
+        out = np.zeros((num_units, num_bins), dtype=np.uint32)
+    else:
+        assert out.shape == (num_units, num_bins)
+    unit_starts = np.concatenate(([0], unit_ends[:-1])).astype(np.int64)
+    unit_counts = unit_ends - unit_starts
+    spike_unit_inds = np.repeat(np.arange(num_units, dtype=np.int64), unit_counts)
+    spike_unit_ends = np.repeat(unit_ends, unit_counts)
+
+    half_counts = np.zeros((num_units * num_bins_half,), dtype=np.int64)
+    pending_keys: List[np.ndarray] = []
+    num_pending_keys = 0
+    inds = np.arange(len(spike_unit_inds), dtype=np.int64)
+    offset = 1
+    while len(inds) > 0:
+        # stay within the unit of each spike
+        inds = inds[inds + offset < spike_unit_ends[inds]]
+        deltas_msec = (spike_times[inds + offset] - spike_times[inds]) * 1000
+        # deltas only grow with the offset, so drop spikes whose window is exhausted
+        in_window = deltas_msec < max_delta_msec
+        inds = inds[in_window]
+        deltas_msec = deltas_msec[in_window]
+        # the deltas are within the edges, so every bin index is valid
+        bin_inds = _get_half_bin_inds(deltas_msec, half_bin_edges_msec)
+        pending_keys.append(spike_unit_inds[inds] * num_bins_half + bin_inds)
+        num_pending_keys += len(inds)
+        if num_pending_keys >= max_keys_per_bincount:
+            half_counts += np.bincount(np.concatenate(pending_keys), minlength=len(half_counts))
+            pending_keys = []
+            num_pending_keys = 0
+        offset = offset + 1
+    if num_pending_keys > 0:
+        half_counts += np.bincount(np.concatenate(pending_keys), minlength=len(half_counts))
+    half_counts = half_counts.reshape((num_units, num_bins_half))
+
+    out[:, :] = 0
+    out[:, num_bins_half - 1:] += half_counts.astype(np.uint32)
+    out[:, :num_bins_half] += half_counts[:, ::-1].astype(np.uint32)
+    return {
+        "bin_edges_sec": (bin_edges_msec / 1000).astype(np.float32),
+        "bin_counts": out
+    }
+
+
+def get_unit_shards(*, spike_times_index: np.ndarray, max_spikes_per_shard: int) -> List[Tuple[int, int]]:
+    """Split the units into contiguous (unit_start, unit_end) ranges.
+
+    Each range holds at most max_spikes_per_shard spikes, except for single
+    units that are larger than that on their own.
+    """
+    unit_ends = np.asarray(spike_times_index, dtype=np.int64)
+    num_units = len(unit_ends)
+    shards: List[Tuple[int, int]] = []
+    u = 0
+    while u < num_units:
+        p = unit_ends[u - 1] if u > 0 else 0
+        u2 = int(np.searchsorted(unit_ends, p + max_spikes_per_shard, side='right'))
+        u2 = max(u2, u + 1)
+        shards.append((u, u2))
+        u = u2
+    return shards
+
+
+def get_balanced_unit_shards(*, spike_times_index: np.ndarray, num_shards: int) -> List[Tuple[int, int]]:
+    """Split the units into at most num_shards contiguous (unit_start, unit_end)
+    ranges with roughly equal numbers of spikes.
+    """
+    unit_ends = np.asarray(spike_times_index, dtype=np.int64)
+    num_units = len(unit_ends)
+    if num_units == 0:
+        return []
+    total_num_spikes = unit_ends[-1]
+    targets = total_num_spikes * np.arange(1, num_shards) / num_shards
+    boundaries = np.searchsorted(unit_ends, targets, side='left') + 1
+    boundaries = np.unique(np.concatenate(([0], np.minimum(boundaries, num_units), [num_units])))
+    return [(int(u1), int(u2)) for u1, u2 in zip(boundaries[:-1], boundaries[1:])]
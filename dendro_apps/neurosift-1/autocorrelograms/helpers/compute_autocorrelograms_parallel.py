@@ -0,0 +1,191 @@
+from typing import Union
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from .compute_autocorrelograms_batch import compute_autocorrelograms_batch, get_balanced_unit_shards
+from .compute_correlogram_data import _get_bin_edges_msec
+
+
+def compute_autocorrelograms_parallel(
+    *,
+    spike_times: np.ndarray,
+    spike_times_index: np.ndarray,
+    window_size_msec: float = 100,
+    bin_size_msec: float = 1,
+    num_workers: int,
+    num_shards_per_worker: int = 8,
+    pool: Union['AutocorrelogramsPool', None] = None
+):
+    """Same as compute_autocorrelograms_batch, but the units are split into
+    shards with roughly equal spike counts that are computed by a pool of
+    num_workers processes.
+
+    The spike times and the output matrix live in shared memory, so the
+    workers only receive (unit_start, unit_end) ranges and write their rows
+    in place. When successive chunks of units are computed, pass an
+    AutocorrelogramsPool so that the worker processes and the shared memory
+    are created once rather than for every chunk.
+    """
+    if pool is not None:
+        if (pool.window_size_msec, pool.bin_size_msec) != (window_size_msec, bin_size_msec):
+            raise ValueError('The pool was created for a different correlogram resolution')
+        return pool.compute(spike_times=spike_times, spike_times_index=spike_times_index)
+    with AutocorrelogramsPool(
+        num_workers=num_workers,
+        max_num_spikes=len(spike_times),
+        max_num_units=len(spike_times_index),
+        window_size_msec=window_size_msec,
+        bin_size_msec=bin_size_msec,
+        num_shards_per_worker=num_shards_per_worker
+    ) as pool:
+        return pool.compute(spike_times=spike_times, spike_times_index=spike_times_index)
+
+
+class AutocorrelogramsPool:
+    """Worker processes and shared memory for computing autocorrelograms of
+    chunks of up to max_num_spikes spikes and max_num_units units.
+
+    The shared memory holds a copy of the spike times of the chunk being
+    computed (8 bytes per spike), its index and its output rows, so its size
+    is get_shared_memory_bytes(...) for the whole lifetime of the pool.
+    """
+    def __init__(
+        self,
+        *,
+        num_workers: int,
+        max_num_spikes: int,
+        max_num_units: int,
+        window_size_msec: float,
+        bin_size_msec: float,
+        num_shards_per_worker: int = 8
+    ):
+        self.num_workers = num_workers
+        self.max_num_spikes = max_num_spikes
+        self.max_num_units = max_num_units
+        self.window_size_msec = window_size_msec
+        self.bin_size_msec = bin_size_msec
+        self.num_shards_per_worker = num_shards_per_worker
+        self.bin_edges_msec = _get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+        self.num_bins = len(self.bin_edges_msec) - 1
+        self._shm_spike_times = SharedMemory(create=True, size=max(max_num_spikes * 8, 1))
+        self._shm_index = SharedMemory(create=True, size=max(max_num_units * 8, 1))
+        self._shm_out = SharedMemory(create=True, size=max(max_num_units * self.num_bins * 4, 1))
+        self._executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_worker,
+            initargs=(
+                self._shm_spike_times.name, self._shm_index.name, self._shm_out.name,
+                window_size_msec, bin_size_msec
+            )
+        )
+
+    @staticmethod
+    def get_shared_memory_bytes(*, max_num_spikes: int, max_num_units: int, num_bins: int) -> int:
+        return max_num_spikes * 8 + max_num_units * 8 + max_num_units * num_bins * 4
+
+    def compute(self, *, spike_times: np.ndarray, spike_times_index: np.ndarray):
+        spike_times_index = np.asarray(spike_times_index, dtype=np.int64)
+        num_spikes = len(spike_times)
+        num_units = len(spike_times_index)
+        if num_spikes > self.max_num_spikes or num_units > self.max_num_units or spike_times.dtype.itemsize > 8:
+            raise ValueError(f'Chunk of {num_units} units and {num_spikes} spikes ({spike_times.dtype}) does not fit in the pool')
+        shards = get_balanced_unit_shards(
+            spike_times_index=spike_times_index,
+            num_shards=self.num_workers * self.num_shards_per_worker
+        )
+        # largest shards first so that the last ones to finish are small
+        shards.sort(key=lambda s: -_get_num_spikes_in_shard(spike_times_index, s))
+
+        spike_times_shared = np.ndarray((num_spikes,), dtype=spike_times.dtype, buffer=self._shm_spike_times.buf)
+        spike_times_shared[:] = spike_times
+        index_shared = np.ndarray((num_units,), dtype=np.int64, buffer=self._shm_index.buf)
+        index_shared[:] = spike_times_index
+        out_shared = np.ndarray((num_units, self.num_bins), dtype=np.uint32, buffer=self._shm_out.buf)
+        out_shared[:] = 0
+        try:
+            futures = [
+                self._executor.submit(_compute_shard, u1, u2, num_spikes, num_units, spike_times.dtype.str)
+                for u1, u2 in shards
+            ]
+            num_units_completed = 0
+            timer = time.time()
+            for future in as_completed(futures):
+                u1, u2 = future.result()
+                num_units_completed += u2 - u1
+                elapsed = time.time() - timer
+                if elapsed > 2:
+                    print(f'Computed autocorrelograms for unit {num_units_completed} of {num_units}')
+                    timer = time.time()
+            bin_counts = out_shared.copy()
+        finally:
+            # the views must be released before the shared memory is closed
+            del spike_times_shared, index_shared, out_shared
+        return {
+            "bin_edges_sec": (self.bin_edges_msec / 1000).astype(np.float32),
+            "bin_counts": bin_counts
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for shm in [self._shm_spike_times, self._shm_index, self._shm_out]:
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def get_num_available_cpus() -> int:
+    """Number of CPUs this process may use, taking CPU affinity and any cgroup
+    (container) CPU quota into account."""
+    if hasattr(os, 'sched_getaffinity'):
+        num_cpus = len(os.sched_getaffinity(0))
+    else:
+        num_cpus = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            num_cpus = min(num_cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(num_cpus, 1)
+
+
+def _get_num_spikes_in_shard(spike_times_index: np.ndarray, shard):
+    u1, u2 = shard
+    p1 = spike_times_index[u1 - 1] if u1 > 0 else 0
+    return int(spike_times_index[u2 - 1] - p1)
+
+
+_worker_state = {}
+
+
+def _init_worker(spike_times_name, index_name, out_name, window_size_msec, bin_size_msec):
+    _worker_state['shm'] = [SharedMemory(name=name) for name in [spike_times_name, index_name, out_name]]
+    _worker_state['window_size_msec'] = window_size_msec
+    _worker_state['bin_size_msec'] = bin_size_msec
+    _worker_state['num_bins'] = len(_get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)) - 1
+
+
+def _compute_shard(u1: int, u2: int, num_spikes: int, num_units: int, spike_times_dtype: str):
+    # the chunk being computed is at the start of the shared memory blocks
+    shm_spike_times, shm_index, shm_out = _worker_state['shm']
+    spike_times = np.ndarray((num_spikes,), dtype=np.dtype(spike_times_dtype), buffer=shm_spike_times.buf)
+    spike_times_index = np.ndarray((num_units,), dtype=np.int64, buffer=shm_index.buf)
+    out = np.ndarray((num_units, _worker_state['num_bins']), dtype=np.uint32, buffer=shm_out.buf)
+    p1 = spike_times_index[u1 - 1] if u1 > 0 else 0
+    p2 = spike_times_index[u2 - 1]
+    compute_autocorrelograms_batch(
+        spike_times=spike_times[p1:p2],
+        spike_times_index=spike_times_index[u1:u2] - p1,
+        window_size_msec=_worker_state['window_size_msec'],
+        bin_size_msec=_worker_state['bin_size_msec'],
+        out=out[u1:u2]
+    )
+    return u1, u2
@@ -7,18 +7,164 @@ def compute_correlogram_data(
     spike_train_1: np.ndarray,
     spike_train_2: Union[np.ndarray, None] = None,
     window_size_msec: float = 100,
-    bin_size_msec: float = 1
+    bin_size_msec: float = 1,
+    method: str = 'vectorized',
+    max_pairs_per_block: int = 1 << 22
 ):
-    times1 = spike_train_1
+    """Compute an auto- or cross-correlogram for sorted spike trains (in seconds).
+
+    method='vectorized' (default) histograms the deltas of all the spike
+    pairs within the window with np.bincount, computing the bin of each delta
+    arithmetically. For an autocorrelogram the pairs are visited by offset,
+    keeping only the spikes whose previous offset was still within the
+    window, so the cost is O(n + P) where P is the number of spike pairs
+    within the window. For a cross-correlogram the range of partner spikes
+    of every spike is found with np.searchsorted and the pairs are expanded
+    in blocks of at most max_pairs_per_block to bound memory.
+
+    method='reference' is the original offset loop, kept for verification.
+    Both methods produce identical bin counts.
+    """
+    bin_edges_msec = _get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+    if method == 'vectorized':
+        bin_counts = _compute_bin_counts_vectorized(
+            times1=spike_train_1,
+            times2=spike_train_2,
+            bin_edges_msec=bin_edges_msec,
+            max_pairs_per_block=max_pairs_per_block
+        )
+    elif method == 'reference':
+        bin_counts = _compute_bin_counts_reference(
+            times1=spike_train_1,
+            times2=spike_train_2,
+            bin_edges_msec=bin_edges_msec
+        )
+    else:
+        raise ValueError(f'Unexpected correlogram method: {method}')
+    return {
+        "bin_edges_sec": (bin_edges_msec / 1000).astype(np.float32),
+        "bin_counts": bin_counts.astype(np.int32),
+    }
+
+
+def _get_bin_edges_msec(*, window_size_msec: float, bin_size_msec: float):
     num_bins = int(window_size_msec / bin_size_msec)
     if num_bins % 2 == 0:
         num_bins = num_bins - 1  # odd number of bins
-    num_bins_half = int((num_bins + 1) / 2)
-    bin_edges_msec = np.array(
+    return np.array(
         (np.arange(num_bins + 1) - num_bins / 2) * bin_size_msec, dtype=np.float32
     )
+
+
+def _get_half_bin_edges_msec(bin_edges_msec: np.ndarray):
+    # edges of the center bin and the positive-lag bins, in float64 so that
+    # comparisons match those against the float32 edges in the reference
+    num_bins = len(bin_edges_msec) - 1
+    num_bins_half = int((num_bins + 1) / 2)
+    return bin_edges_msec[num_bins_half - 1:].astype(np.float64)
+
+
+def _get_max_lag_sec(half_bin_edges_msec: np.ndarray):
+    # one extra bin of slack so that rounding in the seconds domain never
+    # drops a pair; out-of-window deltas are discarded when binning
+    bin_size_msec = half_bin_edges_msec[1] - half_bin_edges_msec[0]
+    return float(half_bin_edges_msec[-1] + bin_size_msec) / 1000
+
+
+def _get_half_bin_inds(abs_deltas_msec: np.ndarray, half_bin_edges_msec: np.ndarray):
+    # bin i holds the deltas with edges[i] <= delta < edges[i + 1]; the bin
+    # is computed arithmetically and then corrected by one where rounding
+    # puts a delta next to an edge on the wrong side. Deltas outside of the
+    # edges get -1 or num_bins_half.
+    num_bins_half = len(half_bin_edges_msec) - 1
+    e0 = half_bin_edges_msec[0]
+    bin_size_msec = half_bin_edges_msec[1] - half_bin_edges_msec[0]
+    inds = np.floor((abs_deltas_msec - e0) / bin_size_msec).astype(np.int64)
+    np.clip(inds, 0, num_bins_half - 1, out=inds)
+    inds -= abs_deltas_msec < half_bin_edges_msec[inds]
+    inds += abs_deltas_msec >= half_bin_edges_msec[inds + 1]
+    return inds
+
+
+def _half_bin_counts(abs_deltas_msec: np.ndarray, half_bin_edges_msec: np.ndarray):
+    num_bins_half = len(half_bin_edges_msec) - 1
+    inds = _get_half_bin_inds(abs_deltas_msec, half_bin_edges_msec)
+    inds = inds[(inds >= 0) & (inds < num_bins_half)]
+    return np.bincount(inds, minlength=num_bins_half)
+
+
+def _iter_pair_blocks(*, starts: np.ndarray, ends: np.ndarray, max_pairs_per_block: int):
+    # yields (i_inds, j_inds) covering all pairs i, j with starts[i] <= j < ends[i]
+    counts = np.maximum(ends - starts, 0)
+    cumulative_counts = np.cumsum(counts)
+    n = len(counts)
+    row_begin = 0
+    while row_begin < n:
+        base = cumulative_counts[row_begin - 1] if row_begin > 0 else 0
+        row_end = int(np.searchsorted(cumulative_counts, base + max_pairs_per_block, side='right'))
+        row_end = max(row_end, row_begin + 1)
+        block_counts = counts[row_begin:row_end]
+        num_pairs = int(np.sum(block_counts))
+        if num_pairs > 0:
+            i_inds = np.repeat(np.arange(row_begin, row_end), block_counts)
+            block_offsets = np.cumsum(block_counts) - block_counts
+            j_inds = np.repeat(starts[row_begin:row_end] - block_offsets, block_counts) + np.arange(num_pairs)
+            yield i_inds, j_inds
+        row_begin = row_end
+
+
+def _compute_bin_counts_vectorized(
+    *,
+    times1: np.ndarray,
+    times2: Union[np.ndarray, None],
+    bin_edges_msec: np.ndarray,
+    max_pairs_per_block: int
+):
+    num_bins = len(bin_edges_msec) - 1
+    num_bins_half = int((num_bins + 1) / 2)
+    half_bin_edges_msec = _get_half_bin_edges_msec(bin_edges_msec)
+    max_lag_sec = _get_max_lag_sec(half_bin_edges_msec)
+    pos_counts = np.zeros((num_bins_half,), dtype=np.int64)
+    neg_counts = np.zeros((num_bins_half,), dtype=np.int64)
+    if times2 is None:
+        # autocorrelogram: every pair i < i + offset within the window; the
+        # deltas grow with the offset, so a spike whose delta is beyond the
+        # window is dropped from the following offsets
+        active = np.arange(len(times1) - 1)
+        offset = 1
+        while len(active) > 0:
+            deltas_msec = (times1[active + offset] - times1[active]) * 1000
+            within = deltas_msec <= max_lag_sec * 1000
+            pos_counts += _half_bin_counts(deltas_msec[within], half_bin_edges_msec)
+            offset += 1
+            active = active[within]
+            active = active[active + offset < len(times1)]
+        neg_counts = pos_counts
+    else:
+        # cross-correlogram: every pair (i in times1, j in times2) within the window
+        starts = np.searchsorted(times2, times1 - max_lag_sec, side='left')
+        ends = np.searchsorted(times2, times1 + max_lag_sec, side='right')
+        for i_inds, j_inds in _iter_pair_blocks(starts=starts, ends=ends, max_pairs_per_block=max_pairs_per_block):
+            deltas_msec = (times2[j_inds] - times1[i_inds]) * 1000
+            nonneg = deltas_msec >= 0
+            pos_counts += _half_bin_counts(deltas_msec[nonneg], half_bin_edges_msec)
+            neg_counts += _half_bin_counts(-deltas_msec[~nonneg], half_bin_edges_msec)
+    bin_counts = np.zeros((num_bins,), dtype=np.int64)
+    bin_counts[num_bins_half - 1:] += pos_counts
+    bin_counts[:num_bins_half] += neg_counts[::-1]
+    return bin_counts
+
+
+def _compute_bin_counts_reference(
+    *,
+    times1: np.ndarray,
+    times2: Union[np.ndarray, None],
+    bin_edges_msec: np.ndarray
+):
+    num_bins = len(bin_edges_msec) - 1
+    num_bins_half = int((num_bins + 1) / 2)
     bin_counts = np.zeros((num_bins,), dtype=np.int32)
-    if spike_train_2 is None:
+    if times2 is None:
         # autocorrelogram
         offset = 1
         while True:
@@ -39,7 +185,6 @@ def compute_correlogram_data(
             offset = offset + 1
     else:
         # cross-correlogram
-        times2 = spike_train_2
         all_times = np.concatenate((times1, times2))
         all_labels = np.concatenate(
             (1 * np.ones(times1.shape), 2 * np.ones(times2.shape))
@@ -90,7 +235,4 @@ def compute_correlogram_data(
                 bin_counts[num_bins_half - 1 + i] += ct12
                 bin_counts[num_bins_half - 1 - i] += ct21
             offset = offset + 1
-    return {
-        "bin_edges_sec": (bin_edges_msec / 1000).astype(np.float32),
-        "bin_counts": bin_counts.astype(np.int32),
-    }
+    return bin_counts
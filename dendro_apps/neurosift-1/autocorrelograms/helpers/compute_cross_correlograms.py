@@ -0,0 +1,300 @@
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
+import numpy as np
+from .compute_correlogram_data import (
+    _compute_bin_counts_vectorized,
+    _get_bin_edges_msec,
+    _get_half_bin_edges_msec,
+    _get_half_bin_inds,
+    _get_max_lag_sec,
+    _iter_pair_blocks
+)
+
+
+def compute_cross_correlograms(
+    *,
+    spike_times: np.ndarray,
+    spike_times_index: np.ndarray,
+    partner_unit_indices: Union[np.ndarray, None] = None,
+    window_size_msec: float = 100,
+    bin_size_msec: float = 1,
+    max_pairs_per_block: int = 1 << 22
+):
+    """Compute cross-correlograms between units of a ragged spike_times array.
+
+    partner_unit_indices has shape (num_units, num_partners). Row u lists the
+    units v for which the cross-correlogram of u (reference) against v is
+    computed, with -1 for unused slots. If None, all pairs are computed
+    (num_partners = num_units, partner v in column v).
+
+    Returns bin_counts with shape (num_units, num_partners, num_bins). Entry
+    [u, c] equals compute_correlogram_data(spike_train_1=train_u,
+    spike_train_2=train_v) for v = partner_unit_indices[u, c], except that
+    the entry of a unit with itself is its autocorrelogram.
+
+    The whole output is held in memory; use iter_cross_correlograms to
+    process it a block of units at a time.
+    """
+    num_units = len(spike_times_index)
+    num_partners = num_units if partner_unit_indices is None else partner_unit_indices.shape[1]
+    bin_edges_sec = get_bin_edges_sec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+    bin_counts = np.zeros((num_units, num_partners, len(bin_edges_sec) - 1), dtype=np.uint32)
+    for u1, u2, block_bin_counts in iter_cross_correlograms(
+        spike_times=spike_times,
+        spike_times_index=spike_times_index,
+        partner_unit_indices=partner_unit_indices,
+        window_size_msec=window_size_msec,
+        bin_size_msec=bin_size_msec,
+        max_pairs_per_block=max_pairs_per_block
+    ):
+        bin_counts[u1:u2] = block_bin_counts
+    return {
+        "bin_edges_sec": bin_edges_sec,
+        "bin_counts": bin_counts
+    }
+
+
+def iter_cross_correlograms(
+    *,
+    spike_times: np.ndarray,
+    spike_times_index: np.ndarray,
+    partner_unit_indices: Union[np.ndarray, None] = None,
+    window_size_msec: float = 100,
+    bin_size_msec: float = 1,
+    num_units_per_block: int = 1,
+    max_pairs_per_block: int = 1 << 22
+) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """Yield (u1, u2, bin_counts) for consecutive blocks of at most
+    num_units_per_block reference units, where bin_counts are the rows u1:u2
+    of the output of compute_cross_correlograms.
+
+    With partner_unit_indices, the spikes of each unit are matched against
+    the spike train of each of its partners with np.searchsorted, so only
+    the requested pairs are visited. For all pairs, all the spikes are merged
+    into one time-sorted array and the spikes within the window of each
+    spike of the reference unit are found with np.searchsorted in it, their
+    unit being the column of the output. In both cases the memory is that
+    of the spike times plus one block of the output.
+    """
+    bin_edges_msec = _get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+    num_bins = len(bin_edges_msec) - 1
+    unit_ends = np.asarray(spike_times_index, dtype=np.int64)
+    unit_starts = np.concatenate(([0], unit_ends[:-1])).astype(np.int64)
+    num_units = len(unit_ends)
+    if partner_unit_indices is None:
+        compute_row = _AllPartnersRows(
+            spike_times=spike_times,
+            unit_starts=unit_starts,
+            unit_ends=unit_ends,
+            bin_edges_msec=bin_edges_msec,
+            max_pairs_per_block=max_pairs_per_block
+        )
+        num_partners = num_units
+    else:
+        partner_unit_indices = np.asarray(partner_unit_indices, dtype=np.int64)
+        assert partner_unit_indices.shape[0] == num_units
+        compute_row = _RequestedPartnersRows(
+            get_train=lambda v: spike_times[unit_starts[v]:unit_ends[v]],
+            partner_unit_indices=partner_unit_indices,
+            bin_edges_msec=bin_edges_msec,
+            max_pairs_per_block=max_pairs_per_block
+        )
+        num_partners = partner_unit_indices.shape[1]
+    for u1 in range(0, num_units, num_units_per_block):
+        u2 = min(u1 + num_units_per_block, num_units)
+        bin_counts = np.zeros((u2 - u1, num_partners, num_bins), dtype=np.uint32)
+        for u in range(u1, u2):
+            bin_counts[u - u1] = compute_row(u)
+        yield u1, u2, bin_counts
+
+
+def iter_cross_correlograms_streamed(
+    *,
+    spike_times: Any,
+    spike_times_index: np.ndarray,
+    partner_unit_indices: np.ndarray,
+    window_size_msec: float = 100,
+    bin_size_msec: float = 1,
+    max_spikes_per_block: int,
+    num_units_per_block: int = 1,
+    max_pairs_per_block: int = 1 << 22
+) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """Same as iter_cross_correlograms with partner_unit_indices, but
+    spike_times can be an h5py-like dataset of which only the spike trains
+    needed by a block of reference units (the units and their partners) are
+    held, at most max_spikes_per_block spikes except for a block of a single
+    unit, and at most num_units_per_block units. The blocks are from
+    get_partner_unit_blocks. The trains still
+    needed by the next block are kept, and consecutive units that are
+    missing are read with one slice."""
+    bin_edges_msec = _get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+    num_bins = len(bin_edges_msec) - 1
+    unit_ends = np.asarray(spike_times_index, dtype=np.int64)
+    unit_starts = np.concatenate(([0], unit_ends[:-1])).astype(np.int64)
+    partner_unit_indices = np.asarray(partner_unit_indices, dtype=np.int64)
+    assert partner_unit_indices.shape[0] == len(unit_ends)
+    trains: Dict[int, np.ndarray] = {}
+    compute_row = _RequestedPartnersRows(
+        get_train=lambda v: trains[v],
+        partner_unit_indices=partner_unit_indices,
+        bin_edges_msec=bin_edges_msec,
+        max_pairs_per_block=max_pairs_per_block
+    )
+    for u1, u2 in get_partner_unit_blocks(
+        spike_times_index=spike_times_index,
+        partner_unit_indices=partner_unit_indices,
+        max_spikes_per_block=max_spikes_per_block,
+        max_units_per_block=num_units_per_block
+    ):
+        needed = _get_needed_units(partner_unit_indices, u1, u2)
+        for v in list(trains.keys()):
+            if v not in needed:
+                del trains[v]
+        missing = sorted(v for v in needed if v not in trains)
+        for run in _get_consecutive_runs(missing):
+            p1 = unit_starts[run[0]]
+            data = np.asarray(spike_times[p1:unit_ends[run[-1]]])
+            for v in run:
+                trains[v] = data[unit_starts[v] - p1:unit_ends[v] - p1].copy()
+        bin_counts = np.zeros((u2 - u1, partner_unit_indices.shape[1], num_bins), dtype=np.uint32)
+        for u in range(u1, u2):
+            bin_counts[u - u1] = compute_row(u)
+        yield u1, u2, bin_counts
+
+
+def get_partner_unit_blocks(*, spike_times_index: np.ndarray, partner_unit_indices: np.ndarray, max_spikes_per_block: int, max_units_per_block: int) -> List[Tuple[int, int]]:
+    """Split the reference units into contiguous (unit_start, unit_end)
+    ranges of at most max_units_per_block units such that the units of a
+    range and their partners have at most max_spikes_per_block spikes,
+    except for ranges of a single unit."""
+    unit_ends = np.asarray(spike_times_index, dtype=np.int64)
+    unit_counts = np.diff(np.concatenate(([0], unit_ends)))
+    blocks: List[Tuple[int, int]] = []
+    u1 = 0
+    needed: set = set()
+    num_spikes = 0
+    for u in range(len(unit_ends)):
+        new_units = _get_needed_units(partner_unit_indices, u, u + 1) - needed
+        num_new_spikes = int(sum(unit_counts[v] for v in new_units))
+        if u > u1 and (num_spikes + num_new_spikes > max_spikes_per_block or u - u1 >= max_units_per_block):
+            blocks.append((u1, u))
+            u1 = u
+            needed = set()
+            new_units = _get_needed_units(partner_unit_indices, u, u + 1)
+            num_new_spikes = int(sum(unit_counts[v] for v in new_units))
+            num_spikes = 0
+        needed |= new_units
+        num_spikes += num_new_spikes
+    if u1 < len(unit_ends):
+        blocks.append((u1, len(unit_ends)))
+    return blocks
+
+
+def _get_needed_units(partner_unit_indices: np.ndarray, u1: int, u2: int) -> set:
+    partners = partner_unit_indices[u1:u2].ravel()
+    return set(int(v) for v in partners[partners >= 0]) | set(range(u1, u2))
+
+
+def _get_consecutive_runs(units: List[int]) -> List[List[int]]:
+    runs: List[List[int]] = []
+    for v in units:
+        if len(runs) > 0 and runs[-1][-1] == v - 1:
+            runs[-1].append(v)
+        else:
+            runs.append([v])
+    return runs
+
+
+def get_bin_edges_sec(*, window_size_msec: float, bin_size_msec: float) -> np.ndarray:
+    bin_edges_msec = _get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+    return (bin_edges_msec / 1000).astype(np.float32)
+
+
+class _RequestedPartnersRows:
+    # one row of the output: the reference unit against each of its
+    # partners; get_train returns the spike train of a unit
+    def __init__(self, *, get_train: Callable[[int], np.ndarray], partner_unit_indices: np.ndarray, bin_edges_msec: np.ndarray, max_pairs_per_block: int):
+        self.get_train = get_train
+        self.partner_unit_indices = partner_unit_indices
+        self.bin_edges_msec = bin_edges_msec
+        self.max_pairs_per_block = max_pairs_per_block
+
+    def __call__(self, u: int) -> np.ndarray:
+        num_bins = len(self.bin_edges_msec) - 1
+        row = np.zeros((self.partner_unit_indices.shape[1], num_bins), dtype=np.uint32)
+        times1 = self.get_train(u)
+        for c, v in enumerate(self.partner_unit_indices[u]):
+            if v < 0 or len(times1) == 0:
+                continue
+            times2 = None if v == u else self.get_train(int(v))
+            row[c] = _compute_bin_counts_vectorized(
+                times1=times1,
+                times2=times2,
+                bin_edges_msec=self.bin_edges_msec,
+                max_pairs_per_block=self.max_pairs_per_block
+            )
+        return row
+
+
+class _AllPartnersRows:
+    # one row of the output: the reference unit against every unit, from the
+    # pairs of its spikes with the spikes of all units within the window
+    def __init__(self, *, spike_times: np.ndarray, unit_starts: np.ndarray, unit_ends: np.ndarray, bin_edges_msec: np.ndarray, max_pairs_per_block: int):
+        self.spike_times = spike_times
+        self.unit_starts = unit_starts
+        self.unit_ends = unit_ends
+        self.bin_edges_msec = bin_edges_msec
+        self.half_bin_edges_msec = _get_half_bin_edges_msec(bin_edges_msec)
+        self.max_lag_sec = _get_max_lag_sec(self.half_bin_edges_msec)
+        self.max_pairs_per_block = max_pairs_per_block
+        num_units = len(unit_ends)
+        spike_unit_inds = np.repeat(np.arange(num_units, dtype=np.int32), unit_ends - unit_starts)
+        sort_inds = np.argsort(spike_times, kind='stable')
+        self.all_times = spike_times[sort_inds]
+        self.all_labels = spike_unit_inds[sort_inds]
+        # position of each spike in the merged array, to leave out the pair
+        # of a spike with itself
+        self.merged_positions = np.empty((len(sort_inds),), dtype=np.int64)
+        self.merged_positions[sort_inds] = np.arange(len(sort_inds), dtype=np.int64)
+
+    def __call__(self, u: int) -> np.ndarray:
+        num_units = len(self.unit_ends)
+        num_bins = len(self.bin_edges_msec) - 1
+        num_bins_half = int((num_bins + 1) / 2)
+        bin_counts = np.zeros((num_units * num_bins,), dtype=np.int64)
+        times1 = self.spike_times[self.unit_starts[u]:self.unit_ends[u]]
+        self_positions = self.merged_positions[self.unit_starts[u]:self.unit_ends[u]]
+        starts = np.searchsorted(self.all_times, times1 - self.max_lag_sec, side='left')
+        ends = np.searchsorted(self.all_times, times1 + self.max_lag_sec, side='right')
+        for i_inds, j_inds in _iter_pair_blocks(starts=starts, ends=ends, max_pairs_per_block=self.max_pairs_per_block):
+            keep = j_inds != self_positions[i_inds]
+            i_inds = i_inds[keep]
+            j_inds = j_inds[keep]
+            deltas_msec = (self.all_times[j_inds] - times1[i_inds]) * 1000
+            nonneg = deltas_msec >= 0
+            # the center bin is shared by the positive and negative halves
+            bin_inds = np.empty((len(deltas_msec),), dtype=np.int64)
+            half_inds = _get_half_bin_inds(deltas_msec[nonneg], self.half_bin_edges_msec)
+            bin_inds[nonneg] = np.where(half_inds < num_bins_half, num_bins_half - 1 + half_inds, -1)
+            half_inds = _get_half_bin_inds(-deltas_msec[~nonneg], self.half_bin_edges_msec)
+            bin_inds[~nonneg] = np.where(half_inds < num_bins_half, num_bins_half - 1 - half_inds, -1)
+            valid = bin_inds >= 0
+            keys = self.all_labels[j_inds[valid]].astype(np.int64) * num_bins + bin_inds[valid]
+            bin_counts += np.bincount(keys, minlength=num_units * num_bins)
+        return bin_counts.reshape((num_units, num_bins))
+
+
+def get_nearest_partner_unit_indices(*, unit_locations: np.ndarray, num_nearest_units: int, num_units_per_block: int = 256):
+    """For each unit, the unit itself followed by its num_nearest_units
+    nearest units by location (shape (num_units, num_nearest_units + 1))."""
+    unit_locations = np.asarray(unit_locations, dtype=np.float64)
+    num_units = unit_locations.shape[0]
+    num_partners = min(num_nearest_units + 1, num_units)
+    partner_unit_indices = np.zeros((num_units, num_partners), dtype=np.int64)
+    # the distances are computed for blocks of units, so that there is no
+    # num_units x num_units matrix
+    for u1 in range(0, num_units, num_units_per_block):
+        u2 = min(u1 + num_units_per_block, num_units)
+        dists = np.sqrt(np.sum((unit_locations[u1:u2, None, :] - unit_locations[None, :, :]) ** 2, axis=2))
+        dists[np.arange(u2 - u1), np.arange(u1, u2)] = -1  # the unit itself always comes first
+        partner_unit_indices[u1:u2] = np.argsort(dists, axis=1, kind='stable')[:, :num_partners]
+    return partner_unit_indices
@@ -0,0 +1,59 @@
+from typing import List, Tuple
+import numpy as np
+from .compute_correlogram_data import _get_bin_edges_msec
+
+
+def get_finest_resolution(resolutions: List[Tuple[float, float]]) -> Tuple[float, float]:
+    """(window_size_msec, bin_size_msec) of a correlogram from which all the
+    given resolutions can be derived with rebin_correlograms.
+
+    The bins are centered on zero lag, so the edges of a coarse resolution
+    only line up with those of the finest one if its bin size is an odd
+    multiple of the finest bin size. The window is the smallest one covering
+    all the resolutions.
+    """
+    if len(resolutions) == 0:
+        raise ValueError('No correlogram resolutions')
+    fine_bin_size_msec = min(b for _, b in resolutions)
+    max_half_window_msec = 0.0
+    for window_size_msec, bin_size_msec in resolutions:
+        ratio = bin_size_msec / fine_bin_size_msec
+        if abs(ratio - round(ratio)) > 1e-6 or round(ratio) % 2 == 0:
+            raise ValueError(f'Bin size {bin_size_msec} ms is not an odd multiple of the finest bin size {fine_bin_size_msec} ms')
+        bin_edges_msec = _get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+        max_half_window_msec = max(max_half_window_msec, float(bin_edges_msec[-1]))
+    # odd number of fine bins covering the widest window; the extra half bin
+    # keeps the bin count from being rounded down
+    num_fine_bins = 2 * int(np.ceil(max_half_window_msec / fine_bin_size_msec - 0.5 - 1e-6)) + 1
+    return (num_fine_bins + 0.5) * fine_bin_size_msec, fine_bin_size_msec
+
+
+def rebin_correlograms(
+    *,
+    bin_counts: np.ndarray,
+    bin_edges_sec: np.ndarray,
+    window_size_msec: float,
+    bin_size_msec: float
+):
+    """Derive correlograms at a coarser resolution by summing adjacent bins.
+
+    bin_counts has shape (..., num_fine_bins) with bin edges bin_edges_sec,
+    as returned by the compute functions for the resolution given by
+    get_finest_resolution. The result is the same as computing the coarse
+    correlograms directly.
+    """
+    fine_edges_msec = np.asarray(bin_edges_sec, dtype=np.float64) * 1000
+    fine_bin_size_msec = fine_edges_msec[1] - fine_edges_msec[0]
+    bin_edges_msec = _get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+    num_bins = len(bin_edges_msec) - 1
+    factor = int(round(bin_size_msec / fine_bin_size_msec))
+    i0 = int(round((bin_edges_msec[0] - fine_edges_msec[0]) / fine_bin_size_msec))
+    i1 = i0 + num_bins * factor
+    if i0 < 0 or i1 > bin_counts.shape[-1] or abs(fine_edges_msec[i0] - bin_edges_msec[0]) > fine_bin_size_msec * 1e-3:
+        raise ValueError(f'Resolution {window_size_msec}/{bin_size_msec} ms cannot be derived from the given bins')
+    x = bin_counts[..., i0:i1]
+    coarse = x.reshape(x.shape[:-1] + (num_bins, factor)).sum(axis=-1, dtype=bin_counts.dtype)
+    return {
+        "bin_edges_sec": (bin_edges_msec / 1000).astype(np.float32),
+        "bin_counts": coarse
+    }
@@ -0,0 +1,52 @@
+from typing import Any, Iterator, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+# Approximate peak bytes per spike while a chunk is being histogrammed by
+# compute_autocorrelograms_batch (the times plus the index, unit and delta
+# arrays of the first offset pass), and per spike of the prefetched chunk
+_compute_bytes_per_spike = 64
+_prefetch_bytes_per_spike = 8
+
+
+def get_max_spikes_per_chunk(*, memory_budget_bytes: int, fixed_overhead_bytes: int = 0, extra_bytes_per_spike: int = 0) -> int:
+    """Largest chunk size (in spikes) for which streaming with one chunk being
+    computed and the next one prefetched stays within the memory budget.
+    extra_bytes_per_spike is held per spike of the chunk being computed on
+    top of that (e.g. its copy in shared memory for the worker processes)."""
+    available = memory_budget_bytes - fixed_overhead_bytes
+    max_spikes = available // (_compute_bytes_per_spike + _prefetch_bytes_per_spike + extra_bytes_per_spike)
+    if max_spikes < 1:
+        raise ValueError(f'Memory budget of {memory_budget_bytes} bytes is too small')
+    return int(max_spikes)
+
+
+def iter_spike_times_chunks(
+    *,
+    spike_times: Any,
+    spike_times_index: np.ndarray,
+    shards: List[Tuple[int, int]]
+) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """Yield (unit_start, unit_end, spike_times_chunk) for each unit shard.
+
+    spike_times can be an in-memory array or an h5py-like dataset (for example
+    on a remote LindiH5pyFile), in which case only one chunk is held while
+    the next one is read in a background thread.
+    """
+    if len(shards) == 0:
+        return
+
+    def read_shard(shard: Tuple[int, int]):
+        u1, u2 = shard
+        p1 = spike_times_index[u1 - 1] if u1 > 0 else 0
+        p2 = spike_times_index[u2 - 1]
+        return np.asarray(spike_times[p1:p2])
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(read_shard, shards[0])
+        for i, shard in enumerate(shards):
+            chunk = future.result()
+            if i + 1 < len(shards):
+                future = executor.submit(read_shard, shards[i + 1])
+            yield shard[0], shard[1], chunk
@@ -0,0 +1,204 @@
+"""Run many processor jobs in one long-lived process.
+
+    python main.py batch jobs.jsonl [--work-dir DIR] [--results results.jsonl]
+    producer | python main.py batch -
+
+Each line of the job queue (a .jsonl file, or stdin with -, read as jobs
+arrive) is one job:
+
+    {"processor": "neurosift-1.autocorrelograms", "input": "<url or local path of .nwb.lindi.json>",
+     "output": "<local path for the output .nwb.lindi.json>", "parameters": {...}}
+
+Relative paths are relative to the directory the worker was started in. A
+line that is not a valid job is reported as a failed job.
+
+The heavy modules are imported and the codecs registered once (with an
+import-time profile printed at startup), remote reference file systems are
+fetched over a shared HTTP session and cached between jobs, and blobs are
+stored with kcl.store_file as in a regular job. Each job runs in its own
+directory under the work directory; one JSON result line is written per job.
+"""
+
+from typing import Any, Dict, Iterable, Iterator, Tuple
+import argparse
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+import types
+import typing
+
+warm_modules = ['numpy', 'h5py', 'zarr', 'numcodecs', 'requests', 'lindi', 'kachery_cloud', 'neurosift.codecs']
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='main.py batch', description='Run neurosift-1 jobs from a queue in one process')
+    parser.add_argument('jobs', help='.jsonl file with one job per line, or - for stdin')
+    parser.add_argument('--work-dir', default=None, help='Directory for the job directories (default: a temporary directory)')
+    parser.add_argument('--results', default=None, help='Append one JSON result line per job to this file (default: stdout)')
+    parser.add_argument('--cache-size', type=int, default=8, help='Number of input reference file systems kept in memory')
+    parser.add_argument('--keep-job-dirs', action='store_true')
+    args = parser.parse_args(argv)
+
+    from common.lindi_inputs import enable_reference_file_system_cache
+    print(json.dumps({'import_profile': warm_up()}), flush=True)
+    enable_reference_file_system_cache(max_entries=args.cache_size)
+
+    jobs = _iter_jobs(sys.stdin) if args.jobs == '-' else _iter_jobs_from_file(args.jobs)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='neurosift-1-batch-')
+    os.makedirs(work_dir, exist_ok=True)
+    results_file = open(args.results, 'a') if args.results is not None else None
+    num_failed = 0
+    try:
+        for result in run_jobs(jobs, work_dir=work_dir, keep_job_dirs=args.keep_job_dirs):
+            num_failed += result['status'] != 'completed'
+            line = json.dumps({'job_result': result})
+            if results_file is not None:
+                results_file.write(line + '\n')
+                results_file.flush()
+            else:
+                print(line, flush=True)
+    finally:
+        if results_file is not None:
+            results_file.close()
+        if args.work_dir is None and not args.keep_job_dirs:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if num_failed > 0:
+        sys.exit(1)
+
+
+def warm_up() -> Dict[str, float]:
+    """Import the modules used by the processors and register the codecs.
+    Returns the seconds taken by each step (0 for modules that were already
+    imported)."""
+    profile = {}
+    for name in warm_modules:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f'Unable to import {name}: {e}')
+            continue
+        profile[name] = time.perf_counter() - t0
+    if 'neurosift.codecs' in sys.modules:
+        t0 = time.perf_counter()
+        from neurosift.codecs import MP4AVCCodec
+        MP4AVCCodec.register_codec()
+        profile['register_codecs'] = time.perf_counter() - t0
+    return profile
+
+
+def run_jobs(jobs: Iterable[dict], *, work_dir: str, keep_job_dirs: bool = False) -> Iterator[dict]:
+    processors = _get_processors()
+    for job_index, job in enumerate(jobs):
+        t0 = time.time()
+        result: Dict[str, Any] = {'job_index': job_index, 'processor': job.get('processor'), 'output': job.get('output')}
+        job_dir = os.path.join(work_dir, f'job_{job_index}')
+        os.makedirs(job_dir, exist_ok=True)
+        cwd = os.getcwd()
+        try:
+            if isinstance(job, _MalformedJob):
+                raise ValueError(job.error)
+            if job.get('processor') not in processors:
+                raise ValueError(f'Unknown processor: {job.get("processor")}')
+            processor_class, context_class = processors[job['processor']]
+            context = _create_context(context_class, job)
+            # the processors write their staging area and output file to
+            # the current directory
+            os.chdir(job_dir)
+            try:
+                processor_class.run(context)
+            finally:
+                os.chdir(cwd)
+            result['status'] = 'completed'
+        except Exception as e:
+            traceback.print_exc()
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        result['elapsed_sec'] = time.time() - t0
+        if not keep_job_dirs:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        yield result
+
+
+class _BatchInputFile:
+    def __init__(self, url: str):
+        # a local path is made absolute, since the job runs in its own
+        # directory
+        self.url = url if '://' in url else os.path.abspath(url)
+
+    def get_url(self) -> str:
+        return self.url
+
+
+class _BatchOutputFile:
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+
+    def upload(self, local_file_name: str):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        shutil.copyfile(local_file_name, self.path)
+
+
+def _create_context(context_class: Any, job: dict):
+    # the parameters are checked by the pydantic model; the input and output
+    # are replaced by local stand-ins for the dendro files
+    fields: Dict[str, Any] = getattr(context_class, 'model_fields', None) or getattr(context_class, '__fields__')
+    parameters = dict(job.get('parameters', {}))
+    for name in parameters.keys():
+        if name not in fields or name in ['input', 'output']:
+            raise ValueError(f'Unexpected parameter for {job["processor"]}: {name}')
+    parameter_fields = {name: (typing.get_type_hints(context_class)[name], field) for name, field in fields.items() if name not in ['input', 'output']}
+    import pydantic
+    model = pydantic.create_model('BatchParameters', **parameter_fields)  # type: ignore
+    values = model(**parameters)
+    values = values.model_dump() if hasattr(values, 'model_dump') else values.dict()
+    return types.SimpleNamespace(
+        input=_BatchInputFile(job['input']),
+        output=_BatchOutputFile(job['output']),
+        **values
+    )
+
+
+def _get_processors() -> Dict[str, Tuple[Any, Any]]:
+    from autocorrelograms.autocorrelograms import AutocorrelogramsProcessor
+    from compressed_videos.compressed_videos import CompressedVideosProcessor
+    from cross_correlograms.cross_correlograms import CrossCorrelogramsProcessor
+    ret = {}
+    for processor_class in [AutocorrelogramsProcessor, CompressedVideosProcessor, CrossCorrelogramsProcessor]:
+        context_class = typing.get_type_hints(processor_class.run)['context']
+        ret[processor_class.name] = (processor_class, context_class)
+    return ret
+
+
+class _MalformedJob(dict):
+    # a line of the job queue that is not a job, reported as a failed job so
+    # that the worker goes on with the next lines
+    def __init__(self, error: str):
+        super().__init__()
+        self.error = error
+
+
+def _iter_jobs(lines: Iterable[str]) -> Iterator[dict]:
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            yield _MalformedJob(f'Malformed job line: {e}')
+            continue
+        if not isinstance(job, dict):
+            yield _MalformedJob(f'Malformed job line: expected a JSON object, got {type(job).__name__}')
+            continue
+        yield job
+
+
+def _iter_jobs_from_file(path: str) -> Iterator[dict]:
+    with open(path) as f:
+        yield from _iter_jobs(f)
@@ -0,0 +1,535 @@
+#!/usr/bin/env python
+
+"""Benchmarks for the neurosift-1 processors.
+
+    python benchmarks/run_benchmarks.py run --scale small --output results.json
+    python benchmarks/run_benchmarks.py compare base.json results.json
+
+The compute benchmarks only need numpy. The processor benchmarks run
+AutocorrelogramsProcessor and CompressedVideosProcessor end to end on
+synthetic local HDF5/lindi files (they need dendro, h5py, lindi and, for
+the videos, neurosift), with kcl.store_file and context.output.upload
+replaced by local stubs, and record the per-stage summary that the
+processor prints with RunMetrics.emit() (common/instrumentation.py). The
+chunk cache benchmarks read their input from a local HTTP server standing
+in for remote storage. The results file records the commit it was produced
+from, and compare reports the ratio of the best times of the benchmarks
+present in both files.
+"""
+
+from typing import Any, Callable, Dict, List, Union
+import argparse
+import contextlib
+import datetime
+import fnmatch
+import functools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+this_directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(this_directory))
+sys.path.insert(0, this_directory)
+
+from synthetic_data import generate_spike_trains, generate_twophotonseries_data, write_synthetic_nwb  # noqa: E402
+from stubs import capture_run_metrics, create_stub_context, local_kachery_store, serve_directory, write_served_reference_file_system  # noqa: E402
+
+results_format_version = 2
+
+# (kind of spike trains, number of units, total number of spikes)
+scales: Dict[str, dict] = {
+    'small': {
+        'spike_trains': [('poisson', 10, 100_000), ('bursty', 10, 100_000), ('poisson', 100, 1_000_000)],
+        'single_train_num_spikes': [10_000, 100_000],
+        'twophotonseries_shape': (600, 128, 128),
+        'nwb_num_groups': 2_000
+    },
+    'medium': {
+        'spike_trains': [('poisson', 10, 1_000_000), ('bursty', 100, 1_000_000), ('poisson', 500, 10_000_000), ('bursty', 500, 10_000_000)],
+        'single_train_num_spikes': [10_000, 100_000, 1_000_000],
+        'twophotonseries_shape': (2000, 256, 256),
+        'nwb_num_groups': 20_000
+    },
+    'large': {
+        'spike_trains': [('poisson', 100, 10_000_000), ('bursty', 2000, 10_000_000), ('poisson', 2000, 100_000_000)],
+        'single_train_num_spikes': [100_000, 1_000_000, 10_000_000],
+        'twophotonseries_shape': (5000, 512, 512),
+        'nwb_num_groups': 100_000
+    }
+}
+
+# the reference correlogram is quadratic in the window, so it is only run
+# for trains up to this size
+max_reference_num_spikes = 100_000
+firing_rate_hz = 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for the neurosift-1 processors')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='Run the benchmarks and write the results as JSON')
+    run_parser.add_argument('--scale', choices=list(scales.keys()), default='small')
+    run_parser.add_argument('--output', default=None, help='Results file (default: print only)')
+    run_parser.add_argument('--only', default='*', help='Only run benchmarks whose name matches this glob pattern')
+    run_parser.add_argument('--repeats', type=int, default=3, help='Number of timed repeats of the compute benchmarks')
+    run_parser.add_argument('--num-workers', type=int, default=4, help='Number of workers for the parallel benchmarks')
+    run_parser.add_argument('--work-dir', default=None, help='Directory for the synthetic files (default: a temporary directory)')
+    compare_parser = subparsers.add_parser('compare', help='Compare two results files')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='Relative slowdown reported as a regression')
+    compare_parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        if args.work_dir is not None:
+            os.makedirs(args.work_dir, exist_ok=True)
+            results = run_benchmarks(scale=args.scale, only=args.only, repeats=args.repeats, num_workers=args.num_workers, work_dir=args.work_dir)
+        else:
+            with tempfile.TemporaryDirectory() as work_dir:
+                results = run_benchmarks(scale=args.scale, only=args.only, repeats=args.repeats, num_workers=args.num_workers, work_dir=work_dir)
+        if args.output is not None:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f'Wrote {args.output}')
+    elif args.command == 'compare':
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        num_regressions = compare_results(base, new, threshold=args.threshold)
+        if args.fail_on_regression and num_regressions > 0:
+            sys.exit(1)
+
+
+def run_benchmarks(*, scale: str, only: str, repeats: int, num_workers: int, work_dir: str) -> dict:
+    config = scales[scale]
+    benchmarks: List[Callable[..., Any]] = [
+        bench_correlogram_data,
+        bench_autocorrelograms_batch,
+        bench_autocorrelograms_parallel,
+        bench_cross_correlograms,
+        bench_normalize_frames,
+        bench_downsample_frames,
+        bench_intensity_statistics,
+        bench_chunk_cache,
+        bench_nwb_index,
+        bench_autocorrelograms_processor,
+        bench_compressed_videos_processor
+    ]
+    results = []
+    for benchmark in benchmarks:
+        name = benchmark.__name__[len('bench_'):]
+        if not fnmatch.fnmatch(name, only):
+            continue
+        for result in benchmark(config=config, repeats=repeats, num_workers=num_workers, work_dir=work_dir):
+            result = {'name': name, **result}
+            _print_result(result)
+            results.append(result)
+    return {
+        'format_version': results_format_version,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'git': _get_git_info(),
+        'machine': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpu_count': os.cpu_count()
+        },
+        'scale': scale,
+        'results': results
+    }
+
+
+def compare_results(base: dict, new: dict, *, threshold: float) -> int:
+    """Print the ratio new/base of the best times of the benchmarks present
+    in both results and return the number of regressions."""
+    print(f'base: {_describe_results(base)}')
+    print(f'new:  {_describe_results(new)}')
+    base_by_key = {_result_key(r): r for r in base['results'] if 'min_sec' in r}
+    num_regressions = 0
+    for r in new['results']:
+        b = base_by_key.get(_result_key(r), None)
+        if b is None or 'min_sec' not in r:
+            continue
+        ratio = r['min_sec'] / b['min_sec'] if b['min_sec'] > 0 else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            num_regressions += 1
+        elif ratio < 1 - threshold:
+            flag = 'improvement'
+        print(f'{_result_label(r):<90} {b["min_sec"]:10.4f} {r["min_sec"]:10.4f} {ratio:7.2f}x {flag}')
+        for stage, s in get_result_stages(r).items():
+            bs = get_result_stages(b).get(stage, None)
+            if bs is not None:
+                print(f'    {stage:<86} {bs["wall_sec"]:10.4f} {s["wall_sec"]:10.4f}')
+    return num_regressions
+
+
+# compute benchmarks (numpy only)
+
+
+def bench_correlogram_data(*, config: dict, repeats: int, **kwargs):
+    from autocorrelograms.helpers.compute_correlogram_data import compute_correlogram_data
+    for kind in ['poisson', 'bursty']:
+        for num_spikes in config['single_train_num_spikes']:
+            spike_times, _ = _get_spike_trains(kind, 1, num_spikes)
+            for method in ['vectorized', 'reference']:
+                params = {'kind': kind, 'num_spikes': len(spike_times), 'method': method}
+                if method == 'reference' and num_spikes > max_reference_num_spikes:
+                    continue
+                yield _time_repeats(
+                    lambda: compute_correlogram_data(spike_train_1=spike_times, window_size_msec=100, bin_size_msec=1, method=method),
+                    repeats=repeats,
+                    params=params,
+                    num_items=('spikes', len(spike_times))
+                )
+
+
+def bench_autocorrelograms_batch(*, config: dict, repeats: int, **kwargs):
+    from autocorrelograms.helpers.compute_autocorrelograms_batch import compute_autocorrelograms_batch
+    for kind, num_units, total_num_spikes in config['spike_trains']:
+        spike_times, spike_times_index = _get_spike_trains(kind, num_units, total_num_spikes)
+        yield _time_repeats(
+            lambda: compute_autocorrelograms_batch(spike_times=spike_times, spike_times_index=spike_times_index, window_size_msec=100, bin_size_msec=1),
+            repeats=repeats,
+            params={'kind': kind, 'num_units': num_units, 'num_spikes': len(spike_times)},
+            num_items=('spikes', len(spike_times))
+        )
+
+
+def bench_autocorrelograms_parallel(*, config: dict, repeats: int, num_workers: int, **kwargs):
+    from autocorrelograms.helpers.compute_autocorrelograms_parallel import compute_autocorrelograms_parallel
+    for kind, num_units, total_num_spikes in config['spike_trains']:
+        spike_times, spike_times_index = _get_spike_trains(kind, num_units, total_num_spikes)
+        yield _time_repeats(
+            lambda: compute_autocorrelograms_parallel(spike_times=spike_times, spike_times_index=spike_times_index, window_size_msec=100, bin_size_msec=1, num_workers=num_workers),
+            repeats=repeats,
+            params={'kind': kind, 'num_units': num_units, 'num_spikes': len(spike_times), 'num_workers': num_workers},
+            num_items=('spikes', len(spike_times))
+        )
+
+
+def bench_cross_correlograms(*, config: dict, repeats: int, **kwargs):
+    from autocorrelograms.helpers.compute_cross_correlograms import compute_cross_correlograms
+    # all pairs of the smallest units table
+    kind, num_units, total_num_spikes = config['spike_trains'][0]
+    spike_times, spike_times_index = _get_spike_trains(kind, num_units, total_num_spikes)
+    yield _time_repeats(
+        lambda: compute_cross_correlograms(spike_times=spike_times, spike_times_index=spike_times_index, window_size_msec=100, bin_size_msec=1),
+        repeats=repeats,
+        params={'kind': kind, 'num_units': num_units, 'num_spikes': len(spike_times)},
+        num_items=('spikes', len(spike_times))
+    )
+
+
+def bench_normalize_frames(*, config: dict, repeats: int, **kwargs):
+    from compressed_videos.helpers.normalize_frames import FrameNormalizer
+    data = _get_twophotonseries_data(tuple(config['twophotonseries_shape']))
+    chunk_size = 500
+    max_value = float(np.max(data))
+
+    def run_float64():
+        # the original conversion, for reference
+        for i in range(0, data.shape[0], chunk_size):
+            (data[i:i + chunk_size].astype(np.float64) / max_value * 255).astype(np.uint8)
+
+    def run_normalizer():
+        normalizer = FrameNormalizer(scale=255 / max_value)
+        for i in range(0, data.shape[0], chunk_size):
+            normalizer.normalize(data[i:i + chunk_size])
+
+    for method, fn in [('float64', run_float64), ('normalizer', run_normalizer)]:
+        yield _time_repeats(
+            fn,
+            repeats=repeats,
+            params={'shape': list(data.shape), 'method': method},
+            num_items=('pixels', data.size)
+        )
+
+
+def bench_downsample_frames(*, config: dict, repeats: int, **kwargs):
+    from compressed_videos.helpers.downsample_frames import downsample_frames
+    data = _get_twophotonseries_data(tuple(config['twophotonseries_shape']))
+    chunk_size = 500
+    chunks = [(data[i:i + chunk_size] % 256).astype(np.uint8) for i in range(0, data.shape[0], chunk_size)]
+
+    def run():
+        # the 4x level is derived from the 2x level, as in the processor
+        for chunk in chunks:
+            downsample_frames(downsample_frames(chunk, 2), 2)
+
+    yield _time_repeats(
+        run,
+        repeats=repeats,
+        params={'shape': list(data.shape), 'factors': [2, 4]},
+        num_items=('pixels', data.size)
+    )
+
+
+def bench_intensity_statistics(*, config: dict, repeats: int, **kwargs):
+    from compressed_videos.helpers.intensity_statistics import compute_intensity_statistics, default_percentiles
+    data = _get_twophotonseries_data(tuple(config['twophotonseries_shape']))
+    yield _time_repeats(
+        lambda: compute_intensity_statistics(data, percentiles=default_percentiles),
+        repeats=repeats,
+        params={'shape': list(data.shape)}
+    )
+
+
+def bench_chunk_cache(*, config: dict, repeats: int, work_dir: str, **kwargs):
+    # 1 MB ranges of a file served over local HTTP, fetched directly and
+    # through the chunk cache (empty, and filled beforehand)
+    import urllib.request
+    from common.chunk_cache import ChunkCache
+    data = _get_twophotonseries_data(tuple(config['twophotonseries_shape']))
+    blob_path = os.path.join(work_dir, 'chunk_cache_blob.bin')
+    with open(blob_path, 'wb') as f:
+        f.write(data.tobytes())
+    chunk_size = 1024 * 1024
+    ranges = [(offset, min(chunk_size, data.nbytes - offset)) for offset in range(0, data.nbytes, chunk_size)]
+    max_size_bytes = 2 * data.nbytes
+    with serve_directory(work_dir) as base_url:
+        url = base_url + '/chunk_cache_blob.bin'
+
+        def read_all(cache):
+            for offset, size in ranges:
+                x = cache.get_remote_chunk(url=url, offset=offset, size=size) if cache is not None else None
+                if x is None:
+                    request = urllib.request.Request(url, headers={'Range': f'bytes={offset}-{offset + size - 1}'})
+                    with urllib.request.urlopen(request) as response:
+                        x = response.read()
+                    if cache is not None:
+                        cache.put_remote_chunk(url=url, offset=offset, size=size, data=x)
+
+        def read_all_cold():
+            cache_dir = tempfile.mkdtemp(dir=work_dir, prefix='chunk_cache_')
+            try:
+                read_all(ChunkCache(directory=cache_dir, max_size_bytes=max_size_bytes))
+            finally:
+                shutil.rmtree(cache_dir)
+
+        warm_cache_dir = tempfile.mkdtemp(dir=work_dir, prefix='chunk_cache_')
+        read_all(ChunkCache(directory=warm_cache_dir, max_size_bytes=max_size_bytes))
+        for cache_state, fn in [
+            ('none', lambda: read_all(None)),
+            ('cold', read_all_cold),
+            ('warm', lambda: read_all(ChunkCache(directory=warm_cache_dir, max_size_bytes=max_size_bytes)))
+        ]:
+            yield _time_repeats(
+                fn,
+                repeats=repeats,
+                params={'num_bytes': data.nbytes, 'chunk_size': chunk_size, 'cache': cache_state},
+                num_items=('bytes', data.nbytes)
+            )
+        shutil.rmtree(warm_cache_dir)
+
+
+def bench_nwb_index(*, config: dict, repeats: int, **kwargs):
+    # a reference file system with many groups (each with a data array of a
+    # few chunks), one in seven of them a TwoPhotonSeries
+    from common.nwb_index import NwbIndex
+    num_groups = config['nwb_num_groups']
+    refs: Dict[str, Any] = {}
+    for i in range(num_groups):
+        path = f'processing/module_{i % 50}/series_{i}'
+        refs[f'{path}/.zgroup'] = json.dumps({'zarr_format': 2})
+        refs[f'{path}/.zattrs'] = json.dumps({'neurodata_type': 'TwoPhotonSeries' if i % 7 == 0 else 'TimeSeries'})
+        refs[f'{path}/data/.zarray'] = json.dumps({'shape': [1000, 64, 64], 'dtype': '<u2', 'chunks': [250, 64, 64]})
+        for j in range(4):
+            refs[f'{path}/data/{j}.0.0'] = ['https://example.org/blob', j * 2_000_000, 2_000_000]
+    rfs = {'refs': refs}
+    yield _time_repeats(
+        lambda: NwbIndex(rfs).find('TwoPhotonSeries'),
+        repeats=repeats,
+        params={'num_groups': num_groups, 'num_refs': len(refs)},
+        num_items=('groups', num_groups)
+    )
+
+
+# processor benchmarks (need the full processor environment)
+
+
+def bench_autocorrelograms_processor(*, config: dict, num_workers: int, work_dir: str, **kwargs):
+    try:
+        import lindi  # noqa: F401
+        from autocorrelograms.autocorrelograms import AutocorrelogramsProcessor, AutocorrelogramsContext
+    except ImportError as e:
+        yield {'params': {}, 'skipped': f'Missing dependency: {e}'}
+        return
+    for kind, num_units, total_num_spikes in config['spike_trains']:
+        spike_times, spike_times_index = _get_spike_trains(kind, num_units, total_num_spikes)
+        input_path = _get_synthetic_nwb(work_dir, f'units_{kind}_{num_units}_{total_num_spikes}.nwb', spike_times=spike_times, spike_times_index=spike_times_index)
+        for parameters in [{'num_workers': 1}, {'num_workers': num_workers}, {'num_workers': num_workers, 'memory_budget_mb': 256}]:
+            yield _time_processor(
+                AutocorrelogramsProcessor,
+                AutocorrelogramsContext,
+                input_path=input_path,
+                work_dir=work_dir,
+                parameters=parameters,
+                params={'kind': kind, 'num_units': num_units, 'num_spikes': len(spike_times), **parameters},
+                num_items=('spikes', len(spike_times))
+            )
+
+
+def bench_compressed_videos_processor(*, config: dict, work_dir: str, **kwargs):
+    try:
+        import lindi  # noqa: F401
+        import neurosift.codecs  # noqa: F401
+        from compressed_videos.compressed_videos import CompressedVideosProcessor, CompressedVideosContext
+    except ImportError as e:
+        yield {'params': {}, 'skipped': f'Missing dependency: {e}'}
+        return
+    shape = tuple(config['twophotonseries_shape'])
+    data = _get_twophotonseries_data(shape)
+    input_path = _get_synthetic_nwb(work_dir, f'twophotonseries_{"x".join(str(s) for s in shape)}.nwb', twophotonseries_data=data)
+    for parameters in [{'num_prefetch_chunks': 0}, {'num_prefetch_chunks': 2}, {'num_prefetch_chunks': 2, 'num_preview_levels': 2}]:
+        yield _time_processor(
+            CompressedVideosProcessor,
+            CompressedVideosContext,
+            input_path=input_path,
+            work_dir=work_dir,
+            parameters=parameters,
+            params={'shape': list(shape), **parameters},
+            num_items=('pixels', data.size)
+        )
+    # the input read over HTTP through the chunk cache, first empty and then
+    # filled by the previous run
+    cache_dir = tempfile.mkdtemp(dir=work_dir, prefix='chunk_cache_')
+    for cache_state in ['cold', 'warm']:
+        yield _time_processor(
+            CompressedVideosProcessor,
+            CompressedVideosContext,
+            input_path=input_path,
+            work_dir=work_dir,
+            parameters={'num_prefetch_chunks': 2, 'chunk_cache_dir': cache_dir},
+            params={'shape': list(shape), 'num_prefetch_chunks': 2, 'input': 'http', 'chunk_cache': cache_state},
+            num_items=('pixels', data.size),
+            serve_input=True
+        )
+
+
+def _time_processor(processor_class, context_class, *, input_path: str, work_dir: str, parameters: dict, params: dict, num_items, serve_input: bool = False):
+    """Run a processor once in a fresh directory with local stubs for the
+    blob store and the output upload. The run_metrics of the result are the
+    summary printed by the processor (RunMetrics.emit()), with the time of
+    each of its stages. With serve_input, the chunks of the input are read
+    from a local HTTP server standing in for remote storage."""
+    run_dir = tempfile.mkdtemp(dir=work_dir, prefix='run_')
+    cwd = os.getcwd()
+    with contextlib.ExitStack() as stack:
+        if serve_input:
+            input_directory = os.path.dirname(os.path.abspath(input_path))
+            base_url = stack.enter_context(serve_directory(input_directory))
+            input_path = write_served_reference_file_system(input_path, directory=input_directory, base_url=base_url)
+        context = create_stub_context(
+            context_class,
+            input_path=input_path,
+            output_directory=os.path.join(run_dir, 'uploaded'),
+            **parameters
+        )
+        os.chdir(run_dir)
+        try:
+            with local_kachery_store(directory=os.path.join(run_dir, 'blobs')), capture_run_metrics() as run_metrics:
+                t0 = time.perf_counter()
+                processor_class.run(context)
+                elapsed = time.perf_counter() - t0
+        finally:
+            os.chdir(cwd)
+    result = _create_result(params=params, seconds=[elapsed], num_items=num_items)
+    if len(run_metrics) > 0:
+        result['run_metrics'] = run_metrics[-1]
+    return result
+
+
+def get_result_stages(result: dict) -> Dict[str, dict]:
+    """The stages of the run_metrics of a processor benchmark result, by
+    name, each with its wall_sec, cpu_sec, num_calls, peak_rss_mb,
+    bytes_read and bytes_written (see common/instrumentation.py)."""
+    return (result.get('run_metrics') or {}).get('stages', {})
+
+
+def _time_repeats(fn: Callable[[], Any], *, repeats: int, params: dict, num_items=None):
+    fn()  # warm up
+    seconds = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - t0)
+    return _create_result(params=params, seconds=seconds, num_items=num_items)
+
+
+def _create_result(*, params: dict, seconds: List[float], num_items=None):
+    result: Dict[str, Any] = {
+        'params': params,
+        'seconds': seconds,
+        'min_sec': min(seconds),
+        'median_sec': float(np.median(seconds))
+    }
+    if num_items is not None:
+        item_name, n = num_items
+        result[f'{item_name}_per_sec'] = n / result['min_sec'] if result['min_sec'] > 0 else None
+    return result
+
+
+@functools.lru_cache(maxsize=4)
+def _get_spike_trains(kind: str, num_units: int, total_num_spikes: int):
+    duration_sec = total_num_spikes / (num_units * firing_rate_hz)
+    return generate_spike_trains(num_units=num_units, duration_sec=duration_sec, firing_rate_hz=firing_rate_hz, kind=kind)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_twophotonseries_data(shape: tuple):
+    return generate_twophotonseries_data(num_frames=shape[0], height=shape[1], width=shape[2])
+
+
+def _get_synthetic_nwb(work_dir: str, fname: str, **kwargs) -> str:
+    path = os.path.join(work_dir, fname)
+    lindi_path = path + '.lindi.json'
+    if not os.path.exists(lindi_path):
+        print(f'Writing {path}')
+        write_synthetic_nwb(path, **kwargs)
+    return lindi_path
+
+
+def _get_git_info() -> Union[dict, None]:
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=this_directory, stderr=subprocess.DEVNULL).decode().strip()
+        status = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=this_directory, stderr=subprocess.DEVNULL).decode()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return {'commit': commit, 'dirty': len(status.strip()) > 0}
+
+
+def _result_key(result: dict):
+    return result['name'] + ' ' + json.dumps(result['params'], sort_keys=True)
+
+
+def _result_label(result: dict):
+    return result['name'] + ' ' + ' '.join(f'{k}={v}' for k, v in result['params'].items())
+
+
+def _describe_results(results: dict):
+    git = results.get('git') or {}
+    commit = git.get('commit', 'unknown')[:10] + (' (dirty)' if git.get('dirty') else '')
+    return f'{commit} {results.get("timestamp", "")} scale={results.get("scale")}'
+
+
+def _print_result(result: dict):
+    if 'skipped' in result:
+        print(f'{result["name"]}: skipped ({result["skipped"]})')
+        return
+    print(f'{_result_label(result)}: {result["min_sec"]:.4f} sec')
+    for stage, s in get_result_stages(result).items():
+        print(f'    {stage}: {s["wall_sec"]:.4f} sec in {s["num_calls"]} calls')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+from typing import Any, Dict
+import contextlib
+import hashlib
+import http.server
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import types
+
+
+class LocalInputFile:
+    """Stand-in for dendro InputFile pointing at a local .lindi.json file."""
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+
+    def get_url(self) -> str:
+        return self.path
+
+
+class LocalOutputFile:
+    """Stand-in for dendro OutputFile that copies the output into a local
+    directory instead of uploading it."""
+    def __init__(self, *, directory: str):
+        self.directory = directory
+        self.uploaded_path = None
+
+    def upload(self, path: str):
+        os.makedirs(self.directory, exist_ok=True)
+        self.uploaded_path = os.path.join(self.directory, os.path.basename(path))
+        shutil.copyfile(path, self.uploaded_path)
+
+
+class LocalBlobStore:
+    """Directory-backed stand-in for kachery storage. store_file copies the
+    file to <directory>/<sha1> (once per content) and returns its path."""
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def store_file(self, filename: str, *args, **kwargs) -> str:
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            while True:
+                b = f.read(1 << 20)
+                if not b:
+                    break
+                sha1.update(b)
+        path = os.path.join(self.directory, sha1.hexdigest())
+        if not os.path.exists(path):
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            shutil.copyfile(filename, tmp_path)
+            os.replace(tmp_path, path)
+        return path
+
+
+def create_stub_context(context_class: Any, *, input_path: str, output_directory: str, **kwargs):
+    """A context object with the default parameters of context_class and the
+    given overrides. It is not validated, so the local stand-ins can be used
+    for the input and output files."""
+    fields: Dict[str, Any] = getattr(context_class, 'model_fields', None) or getattr(context_class, '__fields__')
+    values = {}
+    for name, field in fields.items():
+        if name in ['input', 'output']:
+            continue
+        values[name] = field.default
+    for k, v in kwargs.items():
+        if k not in fields:
+            raise ValueError(f'Unexpected parameter for {context_class.__name__}: {k}')
+        values[k] = v
+    return types.SimpleNamespace(
+        input=LocalInputFile(input_path),
+        output=LocalOutputFile(directory=output_directory),
+        **values
+    )
+
+
+@contextlib.contextmanager
+def local_kachery_store(*, directory: str):
+    """Replace kcl.store_file with a content-addressed copy into directory.
+    If kachery_cloud is not installed, a module providing only store_file is
+    installed for the duration."""
+    try:
+        import kachery_cloud as kcl
+        installed = False
+    except ImportError:
+        kcl = types.ModuleType('kachery_cloud')
+        sys.modules['kachery_cloud'] = kcl
+        installed = True
+
+    blob_store = LocalBlobStore(directory)
+    original = getattr(kcl, 'store_file', None)
+    kcl.store_file = blob_store.store_file  # type: ignore
+    try:
+        yield
+    finally:
+        if installed:
+            del sys.modules['kachery_cloud']
+        else:
+            kcl.store_file = original  # type: ignore
+
+
+@contextlib.contextmanager
+def serve_directory(directory: str):
+    """Serve the files of directory over HTTP on localhost, with support for
+    the Range requests that lindi makes for remote chunks, as a stand-in for
+    DANDI storage. Yields the base URL."""
+    directory = os.path.abspath(directory)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = os.path.join(directory, self.path.split('?')[0].lstrip('/'))
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            file_size = os.path.getsize(path)
+            start, end = 0, file_size - 1
+            m = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+            if m is not None:
+                start = int(m.group(1))
+                end = min(int(m.group(2)), file_size - 1) if m.group(2) else file_size - 1
+            with open(path, 'rb') as f:
+                f.seek(start)
+                data = f.read(end - start + 1)
+            self.send_response(206 if m is not None else 200)
+            if m is not None:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{file_size}')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def write_served_reference_file_system(lindi_path: str, *, directory: str, base_url: str) -> str:
+    """Write a copy of a .lindi.json file whose references to files in
+    directory point to base_url instead (see serve_directory). Returns the
+    path of the copy, which is in directory too."""
+    directory = os.path.abspath(directory)
+    with open(lindi_path) as f:
+        rfs = json.load(f)
+    for v in rfs['refs'].values():
+        if isinstance(v, list) and os.path.abspath(v[0]).startswith(directory + os.sep):
+            v[0] = base_url + '/' + os.path.relpath(os.path.abspath(v[0]), directory)
+    served_path = os.path.join(directory, os.path.basename(lindi_path)[:-len('.lindi.json')] + '.served.lindi.json')
+    with open(served_path, 'w') as f:
+        json.dump(rfs, f)
+    return served_path
+
+
+@contextlib.contextmanager
+def capture_run_metrics():
+    """Collect the summaries that processors print with RunMetrics.emit()
+    while the output is still printed. Yields the list of summaries, filled
+    in as they are printed."""
+    summaries: list = []
+    stdout = sys.stdout
+
+    class Writer:
+        def __init__(self):
+            # the processors print from several threads
+            self._lock = threading.Lock()
+            self._line = ''
+
+        def write(self, text: str):
+            with self._lock:
+                stdout.write(text)
+                lines = (self._line + text).split('\n')
+                self._line = lines.pop()
+                for line in lines:
+                    if line.startswith('{"run_metrics"'):
+                        summaries.append(json.loads(line)['run_metrics'])
+            return len(text)
+
+        def flush(self):
+            stdout.flush()
+
+    sys.stdout = Writer()  # type: ignore
+    try:
+        yield summaries
+    finally:
+        sys.stdout = stdout
@@ -0,0 +1,133 @@
+from typing import Tuple, Union
+import json
+import numpy as np
+
+
+def generate_spike_trains(
+    *,
+    num_units: int,
+    duration_sec: float,
+    firing_rate_hz: float,
+    kind: str = 'poisson',
+    seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Generate sorted spike trains in the NWB ragged encoding.
+
+    kind='poisson' gives homogeneous Poisson trains. kind='bursty' gives
+    trains with the same mean rate where spikes come in bursts of a few
+    spikes about 3 ms apart, which is the worst case for correlograms.
+
+    Returns (spike_times, spike_times_index).
+    """
+    rng = np.random.default_rng(seed)
+    trains = []
+    for _ in range(num_units):
+        if kind == 'poisson':
+            train = _poisson_train(rng, rate_hz=firing_rate_hz, duration_sec=duration_sec)
+        elif kind == 'bursty':
+            mean_spikes_per_burst = 5
+            burst_times = _poisson_train(rng, rate_hz=firing_rate_hz / mean_spikes_per_burst, duration_sec=duration_sec)
+            num_spikes_per_burst = rng.geometric(1 / mean_spikes_per_burst, size=len(burst_times))
+            # offsets within each burst: cumulative intervals restarted at
+            # the first spike of the burst
+            intervals = np.cumsum(rng.uniform(0.002, 0.004, size=int(np.sum(num_spikes_per_burst))))
+            first_spike_indices = np.repeat(np.cumsum(num_spikes_per_burst) - num_spikes_per_burst, num_spikes_per_burst)
+            offsets = intervals - intervals[first_spike_indices]
+            train = np.repeat(burst_times, num_spikes_per_burst) + offsets
+            train = np.sort(train[train < duration_sec])
+        else:
+            raise ValueError(f'Unexpected spike train kind: {kind}')
+        trains.append(train)
+    spike_times = np.concatenate(trains) if trains else np.zeros((0,))
+    spike_times_index = np.cumsum([len(t) for t in trains]).astype(np.int64)
+    return spike_times, spike_times_index
+
+
+def generate_twophotonseries_data(
+    *,
+    num_frames: int,
+    height: int,
+    width: int,
+    seed: int = 0
+) -> np.ndarray:
+    """Generate int16 frames: a static background with a few blinking cells
+    plus noise, with occasional bright frames."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    background = (200 + 100 * np.sin(xx / 17) * np.cos(yy / 23)).astype(np.float32)
+    num_cells = 20
+    cells = np.empty((num_cells, height * width), dtype=np.float32)
+    for j in range(num_cells):
+        cy, cx = rng.uniform(0, height), rng.uniform(0, width)
+        cells[j] = np.exp(-((yy - cy) ** 2 + (xx - cx) ** 2) / (2 * 4 ** 2)).ravel()
+    data = np.empty((num_frames, height, width), dtype=np.int16)
+    chunk_size = 100
+    for i1 in range(0, num_frames, chunk_size):
+        i2 = min(i1 + chunk_size, num_frames)
+        cell_activity = rng.exponential(1, size=(i2 - i1, num_cells)).astype(np.float32) * 300
+        frames = (cell_activity @ cells).reshape((i2 - i1, height, width))
+        frames += background
+        frames += rng.normal(0, 20, size=frames.shape).astype(np.float32)
+        # occasional bright frames
+        frames[(np.arange(i1, i2) % 997) == 0] *= 3
+        data[i1:i2] = np.clip(frames, 0, 32767).astype(np.int16)
+    return data
+
+
+def write_synthetic_nwb(
+    path: str,
+    *,
+    spike_times: Union[np.ndarray, None] = None,
+    spike_times_index: Union[np.ndarray, None] = None,
+    twophotonseries_data: Union[np.ndarray, None] = None,
+    twophotonseries_rate: float = 30,
+    twophotonseries_chunks: Union[Tuple[int, int, int], None] = None
+):
+    """Write a minimal NWB-like HDF5 file with a units table and/or a
+    TwoPhotonSeries, and a .lindi.json reference file system next to it.
+    Returns the path of the .lindi.json file."""
+    import h5py
+    import lindi
+    with h5py.File(path, 'w') as f:
+        f.attrs['neurodata_type'] = 'NWBFile'
+        f.attrs['namespace'] = 'core'
+        if spike_times is not None:
+            assert spike_times_index is not None
+            units = f.create_group('units')
+            units.attrs['neurodata_type'] = 'Units'
+            units.attrs['namespace'] = 'core'
+            units.attrs.create('colnames', ['spike_times'], dtype=h5py.string_dtype())
+            units.attrs['description'] = 'synthetic units'
+            ds = units.create_dataset('spike_times', data=spike_times, chunks=True)
+            ds.attrs['neurodata_type'] = 'VectorData'
+            ds = units.create_dataset('spike_times_index', data=spike_times_index)
+            ds.attrs['neurodata_type'] = 'VectorIndex'
+            units.create_dataset('id', data=np.arange(len(spike_times_index)))
+        if twophotonseries_data is not None:
+            acquisition = f.create_group('acquisition')
+            tps = acquisition.create_group('TwoPhotonSeries')
+            tps.attrs['neurodata_type'] = 'TwoPhotonSeries'
+            tps.attrs['namespace'] = 'core'
+            chunks = twophotonseries_chunks or (min(100, twophotonseries_data.shape[0]),) + twophotonseries_data.shape[1:]
+            ds = tps.create_dataset('data', data=twophotonseries_data, chunks=chunks)
+            ds.attrs['conversion'] = 1.0
+            ds.attrs['resolution'] = -1.0
+            ds.attrs['unit'] = 'n.a.'
+            st = tps.create_dataset('starting_time', data=0.0)
+            st.attrs['rate'] = twophotonseries_rate
+            st.attrs['unit'] = 'seconds'
+    lindi_path = path + '.lindi.json'
+    client = lindi.LindiH5pyFile.from_hdf5_file(path)
+    rfs = client.to_reference_file_system()
+    with open(lindi_path, 'w') as f:
+        json.dump(rfs, f)
+    return lindi_path
+
+
+def _poisson_train(rng: np.random.Generator, *, rate_hz: float, duration_sec: float):
+    expected = rate_hz * duration_sec
+    n = int(expected + 5 * np.sqrt(expected) + 10)
+    times = np.cumsum(rng.exponential(1 / rate_hz, size=n))
+    while times[-1] < duration_sec:
+        times = np.concatenate([times, times[-1] + np.cumsum(rng.exponential(1 / rate_hz, size=n))])
+    return times[times < duration_sec]
@@ -0,0 +1,208 @@
+from typing import Any, Callable, Dict, List, Set, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import inspect
+import os
+import threading
+import time
+
+
+class BlobUploader:
+    """Uploads the blobs of a lindi staging area on a bounded thread pool.
+
+    Files can be submitted with submit() as soon as they are final (e.g.
+    while later chunks are still being encoded). store_blob() is the
+    on_store_blob callback for the staging store: it returns the URL of a
+    blob with the same content if one was submitted, waiting for it if
+    needed, and uploads the file otherwise. Blobs are identified by the
+    SHA-1 of their content, so identical blobs are only uploaded once and a
+    file that changed after it was submitted is uploaded again. A file is
+    hashed again after its upload, and if it changed meanwhile the upload
+    fails and its URL is not reused for the hashed content.
+
+    Use it as a context manager, or call shutdown(), so that the upload
+    threads are stopped also on errors.
+    """
+    def __init__(self, *, store_file: Callable[[str], str], num_threads: int = 4, metrics: Any = None):
+        self._store_file = store_file
+        self._metrics = metrics
+        self._executor = ThreadPoolExecutor(max_workers=max(1, num_threads))
+        self._lock = threading.Lock()
+        # content hash -> future of the URL
+        self._uploads: Dict[str, Future] = {}
+        # (path, content hash) already submitted
+        self._submitted: Set[Tuple[str, str]] = set()
+        # path -> (size, mtime_ns, content hash)
+        self._file_hashes: Dict[str, Tuple[int, int, str]] = {}
+        # time during which at least one upload was in progress
+        self._num_active = 0
+        self._active_since = 0.0
+        self._active_sec = 0.0
+        self.num_uploaded = 0
+        self.bytes_uploaded = 0
+        self.num_skipped = 0
+        self.bytes_skipped = 0
+
+    def submit(self, filename: str) -> Future:
+        sha1, size = self._get_file_hash(filename)
+        with self._lock:
+            is_new = (filename, sha1) not in self._submitted
+            self._submitted.add((filename, sha1))
+            future = self._uploads.get(sha1, None)
+            if future is not None:
+                if is_new:
+                    self.num_skipped += 1
+                    self.bytes_skipped += size
+                return future
+            future = self._executor.submit(self._upload, filename, size, sha1)
+            self._uploads[sha1] = future
+            return future
+
+    def submit_new_files(self, directory: str) -> List[str]:
+        """Submit the files in directory (recursively) that were not seen
+        before or changed since they were submitted, and return them."""
+        submitted = []
+        for root, _, fnames in os.walk(directory):
+            for fname in fnames:
+                path = os.path.join(root, fname)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                with self._lock:
+                    h = self._file_hashes.get(path, None)
+                if h is not None and h[0] == st.st_size and h[1] == st.st_mtime_ns:
+                    continue
+                self.submit(path)
+                submitted.append(path)
+        return submitted
+
+    def store_blob(self, filename: str) -> str:
+        future = self.submit(filename)
+        try:
+            return future.result()
+        except Exception as e:
+            # an early upload can fail if the file was replaced while it was
+            # being read; upload the current content again
+            print(f'Retrying upload of {filename} ({e})')
+            sha1, size = self._get_file_hash(filename)
+            future = self._executor.submit(self._upload, filename, size, sha1)
+            with self._lock:
+                self._uploads[sha1] = future
+            return future.result()
+
+    def wait(self):
+        """Wait for the submitted uploads. Failed early uploads are ignored
+        here (store_blob retries them)."""
+        with self._lock:
+            futures = list(self._uploads.values())
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def report(self):
+        with self._lock:
+            active_sec = self._active_sec
+        mb = self.bytes_uploaded / 1e6
+        print(
+            f'Uploaded {self.num_uploaded} blobs ({mb:.1f} MB) in {active_sec:.1f} sec of upload time '
+            f'({mb / active_sec if active_sec > 0 else 0:.2f} MB/s); '
+            f'skipped {self.num_skipped} duplicates ({self.bytes_skipped / 1e6:.1f} MB)'
+        )
+
+    def _upload(self, filename: str, size: int, sha1: str) -> str:
+        with self._lock:
+            if self._num_active == 0:
+                self._active_since = time.time()
+            self._num_active += 1
+        try:
+            if self._metrics is not None:
+                with self._metrics.stage('blob_upload') as s:
+                    url = self._store_file(filename)
+                    s.bytes_written += size
+            else:
+                url = self._store_file(filename)
+        finally:
+            with self._lock:
+                self._num_active -= 1
+                if self._num_active == 0:
+                    self._active_sec += time.time() - self._active_since
+        if _hash_file(filename) != sha1:
+            # the uploaded content may not be the hashed one, so the URL is
+            # not kept for it (store_blob uploads the file again)
+            with self._lock:
+                self._uploads.pop(sha1, None)
+                self._file_hashes.pop(filename, None)
+            raise RuntimeError(f'{filename} changed while it was being uploaded')
+        with self._lock:
+            self.num_uploaded += 1
+            self.bytes_uploaded += size
+        return url
+
+    def _get_file_hash(self, filename: str) -> Tuple[str, int]:
+        st = os.stat(filename)
+        with self._lock:
+            h = self._file_hashes.get(filename, None)
+        if h is not None and h[0] == st.st_size and h[1] == st.st_mtime_ns:
+            return h[2], h[0]
+        sha1_hex = _hash_file(filename)
+        with self._lock:
+            self._file_hashes[filename] = (st.st_size, st.st_mtime_ns, sha1_hex)
+        return sha1_hex, st.st_size
+
+
+def _hash_file(filename: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            b = f.read(1 << 20)
+            if not b:
+                break
+            sha1.update(b)
+    return sha1.hexdigest()
+
+
+def upload_staging_store(
+    staging_store: Any,
+    *,
+    staging_directory: str,
+    uploader: BlobUploader,
+    on_store_main: Callable[[str], str],
+    consolidate_chunks: bool = True
+):
+    """Upload the blobs of a lindi staging store through the uploader and
+    then store the main file.
+
+    All the blob files are submitted before the staging store walks them
+    (one on_store_blob call at a time), so that they upload concurrently.
+    If consolidate_chunks is False, the chunk files are uploaded as they are,
+    which is required when some of them were submitted while encoding.
+    """
+    upload_kwargs = {}
+    if 'consolidate_chunks' in inspect.signature(staging_store.upload).parameters:
+        if consolidate_chunks and hasattr(staging_store, 'consolidate_chunks'):
+            # consolidate first so that the consolidated files are the ones
+            # submitted (the chunk files are removed)
+            uploader.wait()
+            staging_store.consolidate_chunks()
+        upload_kwargs['consolidate_chunks'] = False
+    # the blob files that were not submitted while they were written
+    remaining_files = uploader.submit_new_files(staging_directory)
+    print(f'Submitted {len(remaining_files)} remaining blob files ({sum(os.path.getsize(f) for f in remaining_files) / 1e6:.1f} MB)')
+    staging_store.upload(
+        on_store_blob=uploader.store_blob,
+        on_store_main=on_store_main,
+        **upload_kwargs
+    )
+    uploader.report()
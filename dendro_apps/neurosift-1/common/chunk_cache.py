@@ -0,0 +1,153 @@
+from typing import Union
+import hashlib
+import mmap
+import os
+import threading
+import time
+
+
+class ChunkCache:
+    """On-disk cache of byte ranges of remote files, shared between processes.
+
+    It is passed as the local_cache of LindiH5pyFile.from_reference_file_system
+    (see open_lindi_input), so lindi looks up each remote chunk by URL, offset
+    and size before downloading it. Each range is stored in its own file,
+    named by the hash of the key, and read back through a memory mapping, so
+    the jobs on a node that read the same asset share the files and the page
+    cache.
+
+    Files are written under a temporary name and renamed into place, so a
+    reader never sees a partial chunk, and a file that is evicted while it is
+    being read stays readable by that reader. A hit refreshes the
+    modification time of the file, which gives the least-recently-used order
+    for eviction: when the total size exceeds max_size_bytes, the oldest
+    files are removed until the cache is back to 90% of the cap. Eviction
+    scans the directory under an exclusive lock on a lock file, so
+    concurrent jobs don't evict at the same time. Between scans each process
+    only counts its own writes, and it scans again after writing a tenth of
+    the cap, so the cap can be exceeded by about a tenth of it per process
+    writing at the same time.
+    """
+    def __init__(self, *, directory: str, max_size_bytes: int):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # total size of the cache as of the last scan plus what this process
+        # wrote since (None until the first write)
+        self._size_estimate: Union[int, None] = None
+        self._bytes_since_scan = 0
+        self.num_hits = 0
+        self.bytes_hit = 0
+        self.num_misses = 0
+        self.bytes_stored = 0
+        self.num_evicted = 0
+
+    def get_remote_chunk(self, *, url: str, offset: int, size: int) -> Union[bytes, None]:
+        path = self._chunk_path(url, offset, size)
+        data = None
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == size:
+                    if size == 0:
+                        data = b''
+                    else:
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                            data = m[:]
+        except FileNotFoundError:
+            pass
+        if data is None:
+            with self._lock:
+                self.num_misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # evicted in the meantime
+            pass
+        with self._lock:
+            self.num_hits += 1
+            self.bytes_hit += size
+        return data
+
+    def put_remote_chunk(self, *, url: str, offset: int, size: int, data: bytes):
+        if len(data) != size:
+            raise ValueError('data size does not match size')
+        if size > self.max_size_bytes:
+            return
+        path = self._chunk_path(url, offset, size)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.bytes_stored += size
+            self._bytes_since_scan += size
+            if self._size_estimate is not None:
+                self._size_estimate += size
+            if self._size_estimate is None:
+                needs_scan = True
+            else:
+                needs_scan = self._size_estimate > self.max_size_bytes or self._bytes_since_scan > self.max_size_bytes // 10
+        if needs_scan:
+            self._evict()
+
+    def report(self):
+        with self._lock:
+            print(
+                f'Chunk cache: {self.num_hits} hits ({self.bytes_hit / 1e6:.1f} MB), {self.num_misses} misses, '
+                f'stored {self.bytes_stored / 1e6:.1f} MB, evicted {self.num_evicted} chunks'
+            )
+
+    def _chunk_path(self, url: str, offset: int, size: int) -> str:
+        h = hashlib.sha1(f'{url} {offset} {size}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, h[:2], h + '.chunk')
+
+    def _evict(self):
+        import fcntl
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                entries = []
+                total_size = 0
+                now = time.time()
+                for root, _, fnames in os.walk(self.directory):
+                    for fname in fnames:
+                        path = os.path.join(root, fname)
+                        try:
+                            st = os.stat(path)
+                        except FileNotFoundError:
+                            continue
+                        if fname.endswith('.tmp'):
+                            # left behind by a process that was killed while
+                            # writing
+                            if now - st.st_mtime > 3600:
+                                _remove(path)
+                            continue
+                        if not fname.endswith('.chunk'):
+                            continue
+                        entries.append((st.st_mtime_ns, st.st_size, path))
+                        total_size += st.st_size
+                num_evicted = 0
+                if total_size > self.max_size_bytes:
+                    target_size = int(self.max_size_bytes * 0.9)
+                    for _, size, path in sorted(entries):
+                        if total_size <= target_size:
+                            break
+                        _remove(path)
+                        total_size -= size
+                        num_evicted += 1
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        with self._lock:
+            self._size_estimate = total_size
+            self._bytes_since_scan = 0
+            self.num_evicted += num_evicted
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
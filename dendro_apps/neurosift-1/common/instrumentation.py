@@ -0,0 +1,125 @@
+from typing import Any, Dict
+import contextlib
+import json
+import resource
+import sys
+import threading
+import time
+
+
+class RunMetrics:
+    """Per-stage wall time, CPU time, peak RSS and bytes for a processor run.
+
+    Each stage is entered with `with metrics.stage('name') as s:` and may be
+    entered any number of times, from any thread; the calls are summed.
+    Stages can be nested (for example read within statistics), in which
+    case the time of the inner stage is also counted in the outer one.
+
+    The CPU time of a stage is that of the calling thread plus that of child
+    processes reaped during the stage (e.g. a process pool shut down within
+    it). The peak RSS of a stage is the high-water mark of the process at
+    the end of the stage.
+    """
+    def __init__(self, *, processor_name: str):
+        self.processor_name = processor_name
+        self._lock = threading.Lock()
+        self._stages: Dict[str, dict] = {}
+        self._start_time = time.time()
+        self._start_cpu = _process_and_children_cpu_sec()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        s = _StageCounters()
+        t0 = time.time()
+        c0 = time.thread_time()
+        cc0 = _children_cpu_sec()
+        try:
+            yield s
+        finally:
+            cpu_sec = time.thread_time() - c0 + _children_cpu_sec() - cc0
+            self._add(name, wall_sec=time.time() - t0, cpu_sec=cpu_sec, bytes_read=s.bytes_read, bytes_written=s.bytes_written)
+
+    def timed_reads(self, dataset: Any, stage: str = 'read'):
+        """Wrap an h5py-like dataset so that its slicing is recorded in the
+        given stage, with the number of bytes read."""
+        return _TimedReads(dataset, metrics=self, stage=stage)
+
+    def summary(self) -> dict:
+        with self._lock:
+            stages = {k: dict(v) for k, v in self._stages.items()}
+        return {
+            'processor': self.processor_name,
+            'wall_sec': time.time() - self._start_time,
+            'cpu_sec': _process_and_children_cpu_sec() - self._start_cpu,
+            'peak_rss_mb': _get_peak_rss_mb(resource.RUSAGE_SELF),
+            'peak_child_rss_mb': _get_peak_rss_mb(resource.RUSAGE_CHILDREN),
+            'stages': stages
+        }
+
+    def emit(self):
+        """Print the summary as a single JSON line."""
+        print(json.dumps({'run_metrics': self.summary()}), flush=True)
+
+    def attach(self, attrs: Any):
+        """Store the summary so far as a JSON string in the run_metrics
+        attribute of an output group or dataset. Stages that run after this
+        (the uploads of the output) are not included."""
+        attrs['run_metrics'] = json.dumps(self.summary())
+
+    def _add(self, name: str, *, wall_sec: float, cpu_sec: float, bytes_read: int, bytes_written: int):
+        peak_rss_mb = _get_peak_rss_mb(resource.RUSAGE_SELF)
+        with self._lock:
+            s = self._stages.setdefault(name, {
+                'wall_sec': 0.0,
+                'cpu_sec': 0.0,
+                'num_calls': 0,
+                'peak_rss_mb': 0.0,
+                'bytes_read': 0,
+                'bytes_written': 0
+            })
+            s['wall_sec'] += wall_sec
+            s['cpu_sec'] += cpu_sec
+            s['num_calls'] += 1
+            s['peak_rss_mb'] = max(s['peak_rss_mb'], peak_rss_mb)
+            s['bytes_read'] += bytes_read
+            s['bytes_written'] += bytes_written
+
+
+class _StageCounters:
+    def __init__(self):
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+
+class _TimedReads:
+    def __init__(self, dataset: Any, *, metrics: RunMetrics, stage: str):
+        self._dataset = dataset
+        self._metrics = metrics
+        self._stage = stage
+
+    def __getitem__(self, selection):
+        with self._metrics.stage(self._stage) as s:
+            ret = self._dataset[selection]
+            s.bytes_read += getattr(ret, 'nbytes', 0)
+        return ret
+
+    def __len__(self):
+        return len(self._dataset)
+
+    def __getattr__(self, name: str):
+        return getattr(self._dataset, name)
+
+
+def _children_cpu_sec() -> float:
+    r = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return r.ru_utime + r.ru_stime
+
+
+def _process_and_children_cpu_sec() -> float:
+    return time.process_time() + _children_cpu_sec()
+
+
+def _get_peak_rss_mb(who: int) -> float:
+    maxrss = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss / 1024 if sys.platform != 'darwin' else maxrss / (1024 * 1024)
@@ -0,0 +1,59 @@
+from typing import Any, Union
+import collections
+import copy
+import json
+import threading
+
+_cache_lock = threading.Lock()
+_cache: Union['collections.OrderedDict[str, dict]', None] = None
+_cache_max_entries = 0
+_session: Any = None
+
+
+def enable_reference_file_system_cache(*, max_entries: int = 8):
+    """Keep the reference file systems of the last max_entries inputs in
+    memory, and fetch remote ones over a shared HTTP session, so that jobs
+    run one after another in the same process (see batch_worker.py) do not
+    download the same .lindi.json again."""
+    global _cache, _cache_max_entries
+    with _cache_lock:
+        _cache = collections.OrderedDict()
+        _cache_max_entries = max_entries
+
+
+def open_lindi_input(url: str, *, staging_area: Any, local_cache: Any = None):
+    """Open an input .lindi.json for reading and writing to the staging area.
+    Without the cache this is LindiH5pyFile.from_reference_file_system(url).
+    The remote chunks are looked up in local_cache (for example a ChunkCache)
+    if given."""
+    import lindi
+    kwargs = {'local_cache': local_cache} if local_cache is not None else {}
+    if _cache is None:
+        return lindi.LindiH5pyFile.from_reference_file_system(url, mode='r+', staging_area=staging_area, **kwargs)
+    with _cache_lock:
+        rfs = _cache.get(url, None)
+        if rfs is not None:
+            _cache.move_to_end(url)
+    if rfs is None:
+        rfs = _load_reference_file_system(url)
+        with _cache_lock:
+            _cache[url] = rfs
+            while len(_cache) > _cache_max_entries:
+                _cache.popitem(last=False)
+    # the file is opened for writing, so it gets its own copy
+    return lindi.LindiH5pyFile.from_reference_file_system(copy.deepcopy(rfs), mode='r+', staging_area=staging_area, **kwargs)
+
+
+def _load_reference_file_system(url: str) -> dict:
+    global _session
+    if not (url.startswith('http://') or url.startswith('https://')):
+        with open(url) as f:
+            return json.load(f)
+    import requests
+    with _cache_lock:
+        if _session is None:
+            _session = requests.Session()
+        session = _session
+    response = session.get(url, timeout=120)
+    response.raise_for_status()
+    return json.loads(response.content)
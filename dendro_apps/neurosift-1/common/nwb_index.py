@@ -0,0 +1,115 @@
+from typing import Any, Dict, List, Union
+import base64
+import json
+import numpy as np
+
+
+class NwbObject:
+    """A group or dataset of an NWB file as described by the zarr metadata of
+    its reference file system. shape, dtype and chunks are None for groups."""
+    def __init__(self, path: str):
+        self.path = path
+        self.is_group = False
+        self.attrs: Dict[str, Any] = {}
+        self.shape: Union[List[int], None] = None
+        self.dtype: Union[str, None] = None
+        self.chunks: Union[List[int], None] = None
+
+    @property
+    def neurodata_type(self) -> Union[str, None]:
+        return self.attrs.get('neurodata_type', None)
+
+    @property
+    def nbytes(self) -> int:
+        """Uncompressed size of a dataset (0 for groups)."""
+        if self.shape is None or self.dtype is None:
+            return 0
+        return int(np.prod(self.shape, dtype=np.int64)) * np.dtype(self.dtype).itemsize
+
+    @property
+    def num_chunks(self) -> int:
+        if self.shape is None or self.chunks is None:
+            return 0
+        return int(np.prod([-(-n // c) for n, c in zip(self.shape, self.chunks)], dtype=np.int64))
+
+
+class NwbIndex:
+    """Paths of the groups and datasets of an NWB file, with their
+    attributes, shapes, dtypes and chunking, built in a single pass over the
+    .zgroup/.zarray/.zattrs entries of a lindi reference file system.
+
+    This replaces walking the tree of a LindiH5pyFile (one h5py-like object
+    per node) to find objects: find('TwoPhotonSeries') returns all the
+    TwoPhotonSeries groups, wherever they are, with a dictionary lookup. No
+    array data is read, so the shapes can also be used to estimate the cost
+    of processing a file. Paths have no leading slash, as the keys of the
+    reference file system.
+    """
+    def __init__(self, rfs: dict):
+        self.objects: Dict[str, NwbObject] = {}
+        self._paths_by_neurodata_type: Dict[str, List[str]] = {}
+        for key, value in rfs['refs'].items():
+            parent, _, name = key.rpartition('/')
+            if name not in ['.zgroup', '.zarray', '.zattrs']:
+                continue
+            meta = _parse_meta(value)
+            if meta is None:
+                continue
+            obj = self.objects.get(parent, None)
+            if obj is None:
+                obj = NwbObject(parent)
+                self.objects[parent] = obj
+            if name == '.zgroup':
+                obj.is_group = True
+            elif name == '.zarray':
+                obj.shape = list(meta.get('shape', []))
+                obj.dtype = meta.get('dtype', None)
+                obj.chunks = list(meta.get('chunks', obj.shape))
+            else:
+                obj.attrs = meta
+        for path in sorted(self.objects.keys()):
+            neurodata_type = self.objects[path].neurodata_type
+            if neurodata_type is not None:
+                self._paths_by_neurodata_type.setdefault(neurodata_type, []).append(path)
+
+    @staticmethod
+    def from_lindi_file(client: Any) -> 'NwbIndex':
+        """Index an open LindiH5pyFile. The reference file system of the
+        store is used directly rather than a copy. A file opened with a
+        staging area (or from a tar) has a store that wraps the reference
+        file system store in its _base_store."""
+        store = getattr(client, '_zarr_store', None)
+        while store is not None and not isinstance(getattr(store, 'rfs', None), dict):
+            store = getattr(store, '_base_store', None)
+        if store is None:
+            # e.g. an HDF5 file opened directly
+            return NwbIndex(client.to_reference_file_system())
+        return NwbIndex(store.rfs)
+
+    def get(self, path: str) -> Union[NwbObject, None]:
+        return self.objects.get(path.strip('/'), None)
+
+    def find(self, neurodata_type: str) -> List[NwbObject]:
+        """All the objects of the given neurodata_type (not including
+        subtypes), in order of path."""
+        return [self.objects[path] for path in self._paths_by_neurodata_type.get(neurodata_type, [])]
+
+    def get_child(self, obj: NwbObject, name: str) -> Union[NwbObject, None]:
+        return self.objects.get(obj.path + '/' + name if obj.path else name, None)
+
+
+def _parse_meta(value: Any) -> Union[dict, None]:
+    # the metadata is inline, either as a dict or as a JSON string; entries
+    # referring to external files are not metadata that lindi writes
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, str):
+        try:
+            if value.startswith('base64:'):
+                value = base64.b64decode(value[len('base64:'):]).decode('utf-8')
+            meta = json.loads(value)
+        except ValueError:
+            # also invalid base64 or UTF-8 (subclasses of ValueError)
+            return None
+        return meta if isinstance(meta, dict) else None
+    return None
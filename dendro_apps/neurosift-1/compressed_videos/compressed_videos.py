@@ -1,3 +1,4 @@
+from typing import List
 from dendro.sdk import ProcessorBase, InputFile, OutputFile
 from dendro.sdk import BaseModel, Field
 import numpy as np
@@ -6,6 +7,17 @@ import numpy as np
 class CompressedVideosContext(BaseModel):
     input: InputFile = Field(description="Input .nwb.lindi.json file")
     output: OutputFile = Field(description="Output .nwb.lindi.json file")
+    num_prefetch_chunks: int = Field(default=2, description="Number of chunks that may be read and normalized ahead of the chunk being encoded (0 means read, normalize and encode sequentially)")
+    normalization_method: str = Field(default='max', description="How intensities are scaled to 0-255: 'max' maps the maximum of frames sampled across the series to 255, 'percentile' maps normalization_percentile of the sampled frames to 255 (brighter values saturate)")
+    normalization_percentile: float = Field(default=99.9, description="Percentile mapped to 255 when normalization_method is 'percentile'")
+    num_parallel_series: int = Field(default=1, description="Number of TwoPhotonSeries to encode at the same time (0 means all of them)")
+    memory_budget_mb: int = Field(default=0, description="If greater than 0, series are only started while the estimated memory of the series in progress stays within this many MB")
+    checkpoint_dir: str = Field(default='', description="If set, the intensity statistics and each encoded chunk are recorded in this directory (which should outlive the job) and a rerun reuses the statistics and only encodes the chunks that are missing")
+    attach_run_metrics: bool = Field(default=False, description="If true, store the per-stage timing and memory summary of the run in the run_metrics attribute of each compressed series group")
+    num_upload_threads: int = Field(default=4, description="Number of blobs of the output uploaded at the same time; the encoded chunks start uploading while later chunks are still being encoded")
+    num_preview_levels: int = Field(default=0, description="Number of downsampled preview levels (at most 2) written next to each compressed series for scrubbing: level k, <key>_compressed_<f>x with f = 2^k, is block-averaged by f in time and space")
+    chunk_cache_dir: str = Field(default='', description="If set, the chunks of the input that are read from remote storage are cached in this directory (which can be shared by the jobs running on a node), so that other jobs on the same asset or a rerun don't download them again")
+    chunk_cache_max_mb: int = Field(default=10000, description="Size cap of the chunk cache in MB; the least recently used chunks are removed beyond it")
 
 
 class CompressedVideosProcessor(ProcessorBase):
@@ -17,109 +29,413 @@ class CompressedVideosProcessor(ProcessorBase):
 
     @staticmethod
     def run(context: CompressedVideosContext):
+        import os
         import shutil
+        import threading
         import h5py
-        import uuid
-        import time
         import lindi
         import kachery_cloud as kcl
+        from concurrent.futures import ThreadPoolExecutor
         from neurosift.codecs import MP4AVCCodec
+        from common.instrumentation import RunMetrics
+        from common.blob_upload import BlobUploader, upload_staging_store
+        from common.lindi_inputs import open_lindi_input
+        from common.chunk_cache import ChunkCache
+        from common.nwb_index import NwbIndex
         MP4AVCCodec.register_codec()
 
+        metrics = RunMetrics(processor_name=CompressedVideosProcessor.name)
+        preview_factors = _get_preview_factors(context.num_preview_levels)
+
         with lindi.StagingArea.create('staging') as staging_area:
-            client = lindi.LindiH5pyFile.from_reference_file_system(context.input.get_url(), mode='r+', staging_area=staging_area)
+            # remote chunks of the input are read through the cache, if enabled
+            chunk_cache = ChunkCache(directory=context.chunk_cache_dir, max_size_bytes=context.chunk_cache_max_mb * 1024 * 1024) if context.chunk_cache_dir else None
+            with metrics.stage('read'):
+                client = open_lindi_input(context.input.get_url(), staging_area=staging_area, local_cache=chunk_cache)
 
-            twophoton_group_keys = _get_twophotonseries_group_keys(client)
-            if twophoton_group_keys is None:
+            # the series are found from the zarr metadata, without walking
+            # the groups of the file; the compressed series and preview levels
+            # written by a previous run are TwoPhotonSeries too, and are not
+            # compressed again
+            nwb_index = NwbIndex.from_lindi_file(client)
+            twophoton_group_keys = [obj.path for obj in nwb_index.find('TwoPhotonSeries') if not _is_compressed_series(obj)]
+            if len(twophoton_group_keys) == 0:
                 print('No twophoton groups found')
 
-            for key in twophoton_group_keys:
-                new_key = key + '_compressed'
-                existing = client.get(new_key)
-                if existing is not None:
-                    print(f'Skipping: {new_key} already exists')
-                    continue
-                print(f'Processing twophoton group: {key}')
-                G = client[key]
-                assert isinstance(G, h5py.Group)
-                data = G['data']
-                assert isinstance(data, h5py.Dataset)
-                # conversion = data.attrs['conversion']
-                # resolution = data.attrs['resolution']
-                if 'starting_time' not in G:
-                    print(f'Skipping: {key} does not have a starting_time dataset')
-                    continue
-                starting_time_dataset = G['starting_time']
-                assert isinstance(starting_time_dataset, h5py.Dataset)
-                # starting_time = starting_time_dataset[()]
-                rate = starting_time_dataset.attrs['rate']
-                rate = float(rate)  # type: ignore
-                for k, v in data.attrs.items():
-                    print(f'{k}: {v}')
-                first_chunk = data[0:50]
-                assert isinstance(first_chunk, np.ndarray)
-                max_val = np.max(first_chunk)
-                max_val = float(max_val)  # type: ignore
-                normalization_factor = 255 / max_val
-                num_timepoints_per_chunk = 500
-                chunk_size = [num_timepoints_per_chunk, data.shape[1], data.shape[2]]
-                G2 = client.create_group(new_key)
-                for k, v in G.attrs.items():
-                    if k != 'object_id':
-                        G2.attrs[k] = v
-                G2.attrs['object_id'] = str(uuid.uuid4())
-                for k in G.keys():
-                    if k != 'data':
-                        client.copy(key + '/' + k, client, new_key + '/' + k)
-                codec = MP4AVCCodec(fps=rate)
-                G2.create_dataset_with_zarr_compressor('data', shape=data.shape, chunks=chunk_size, dtype=np.uint8, compressor=codec)
-                timer = 0
-                for i in range(0, data.shape[0], num_timepoints_per_chunk):
-                    elapsed = time.time() - timer
-                    if elapsed > 3:
-                        pct_complete = i / data.shape[0]
-                        timer = time.time()
-                        print(f'{pct_complete * 100:.1f}% complete')
-                    chunk = data[i:i + num_timepoints_per_chunk]
-                    G2['data'][i:i + num_timepoints_per_chunk] = (chunk * normalization_factor).astype(np.uint8)
-
-            output_path = 'output.lindi.json'
-
-            def on_store_blob(filename: str):
-                url = kcl.store_file(filename)
-                return url
-
-            def on_store_main(filename: str):
-                shutil.copyfile(filename, output_path)
-                return output_path
-
-            staging_store = client.staging_store
-            assert staging_store is not None
-            print('Uploading supporting files')
-            staging_store.upload(
-                on_store_blob=on_store_blob,
-                on_store_main=on_store_main
-            )
+            # Each series is an independent task. Reads, normalization and
+            # encoding of different series run concurrently, while all the
+            # writes to the shared file (groups, datasets, attributes and the
+            # encoded chunks) are made under client_lock.
+            num_parallel_series = context.num_parallel_series if context.num_parallel_series > 0 else len(twophoton_group_keys)
+            num_parallel_series = max(1, min(num_parallel_series, len(twophoton_group_keys)))
+            client_lock = threading.Lock()
+            # the chunk files in the staging area are final once written, so
+            # each series submits the files of the chunks it wrote while it
+            # encodes the next ones
+            with BlobUploader(store_file=kcl.store_file, num_threads=context.num_upload_threads, metrics=metrics) as uploader:
+
+                def on_chunk_written(keys: List[str]):
+                    # the staging area stores a chunk that is not inlined in
+                    # a file at its key; the final upload submits any other
+                    for k in keys:
+                        path = os.path.join(staging_area.directory, k)
+                        if os.path.exists(path):
+                            uploader.submit(path)
+
+                memory_budget = _MemoryBudget(context.memory_budget_mb * 1024 * 1024) if context.memory_budget_mb > 0 else None
+
+                def process_series(key: str):
+                    memory_bytes = _estimate_series_memory_bytes(nwb_index.get(key + '/data'), context, preview_factors=preview_factors)
+                    if memory_budget is not None:
+                        memory_budget.acquire(memory_bytes)
+                    try:
+                        return _compress_twophotonseries(client=client, key=key, context=context, preview_factors=preview_factors, client_lock=client_lock, metrics=metrics, on_chunk_written=on_chunk_written)
+                    finally:
+                        if memory_budget is not None:
+                            memory_budget.release(memory_bytes)
+
+                if num_parallel_series > 1:
+                    print(f'Processing {len(twophoton_group_keys)} twophoton groups, up to {num_parallel_series} at a time')
+                with ThreadPoolExecutor(max_workers=num_parallel_series) as executor:
+                    futures = [executor.submit(process_series, key) for key in twophoton_group_keys]
+                    new_keys = [future.result() for future in futures]
+
+                if context.attach_run_metrics:
+                    for new_key in new_keys:
+                        if new_key is not None:
+                            G2 = client[new_key]
+                            assert isinstance(G2, h5py.Group)
+                            metrics.attach(G2.attrs)
+
+                output_path = 'output.lindi.json'
+
+                def on_store_main(filename: str):
+                    shutil.copyfile(filename, output_path)
+                    return output_path
+
+                staging_store = client.staging_store
+                assert staging_store is not None
+                print('Uploading supporting files')
+                with metrics.stage('staging'):
+                    upload_staging_store(
+                        staging_store,
+                        staging_directory=staging_area.directory,
+                        uploader=uploader,
+                        on_store_main=on_store_main,
+                        # Consolidating would replace the chunk files, including
+                        # those already uploaded. Every chunk file of the
+                        # compressed series is submitted as it is written (the
+                        # blob files that were not are reported as remaining
+                        # by upload_staging_store), and they are MP4 chunks of
+                        # 500 frames (up to 64 for the preview levels), too
+                        # large for consolidation to save requests.
+                        consolidate_chunks=False
+                    )
 
             print('Uploading output file')
-            context.output.upload(output_path)
+            with metrics.stage('main_upload') as s:
+                context.output.upload(output_path)
+                s.bytes_written += os.path.getsize(output_path)
+
+            if chunk_cache is not None:
+                chunk_cache.report()
+
+        metrics.emit()
+
+
+num_timepoints_per_chunk = 500
+# the preview levels have shorter chunks, so that scrubbing to a random time
+# only fetches and decodes a few frames
+max_preview_num_timepoints_per_chunk = 64
+
+
+def _get_preview_factors(num_preview_levels: int) -> List[int]:
+    factors = [2 ** k for k in range(1, num_preview_levels + 1)]
+    for factor in factors:
+        # each chunk of the full resolution data covers whole chunks of the
+        # preview levels
+        if num_timepoints_per_chunk % factor != 0:
+            raise ValueError(f'Unsupported number of preview levels: {num_preview_levels}')
+    return factors
+
+
+def _is_compressed_series(obj) -> bool:
+    # the output groups are marked with the series they were compressed
+    # from; files written before the marker are recognized by their name
+    return 'compressed_from' in obj.attrs or obj.path.endswith('_compressed')
+
+
+def _get_preview_num_timepoints_per_chunk(factor: int) -> int:
+    # largest divisor of the number of preview frames per full resolution
+    # chunk that is within the maximum
+    n = num_timepoints_per_chunk // factor
+    return max(d for d in range(1, min(n, max_preview_num_timepoints_per_chunk) + 1) if n % d == 0)
 
 
-def _get_twophotonseries_group_keys(x, prefix: str = ''):
+def _compress_twophotonseries(*, client, key: str, context: CompressedVideosContext, preview_factors: List[int], client_lock, metrics, on_chunk_written):
+    # returns the key of the compressed series, or None if it was skipped
+    import os
     import h5py
-    grp: h5py.Group = x
-    keys = []
-    if grp.attrs.get('neurodata_type', None) == 'TwoPhotonSeries':
-        keys.append(prefix)
-    for key in grp.keys():
-        a = grp[key]
-        if isinstance(a, h5py.Group):
-            keys0 = _get_twophotonseries_group_keys(a, prefix=_join(prefix, key))
-            keys.extend(keys0)
-    return keys
-
-
-def _join(prefix: str, key: str):
-    if not prefix:
-        return key
-    return prefix + '/' + key
+    import uuid
+    import time
+    from neurosift.codecs import MP4AVCCodec
+    from .helpers.iter_pipelined import iter_pipelined
+    from .helpers.normalize_frames import create_frame_normalizer
+    from .helpers.downsample_frames import downsample_frames
+    from .helpers.intensity_statistics import compute_intensity_statistics, default_percentiles, get_percentile_value
+    from .helpers.chunk_checkpoint import ChunkCheckpoint
+    from .helpers.dataset_chunks import DatasetChunks
+
+    new_key = key + '_compressed'
+    with client_lock:
+        existing = client.get(new_key)
+    if existing is not None:
+        print(f'Skipping: {new_key} already exists')
+        return
+    print(f'Processing twophoton group: {key}')
+    G = client[key]
+    assert isinstance(G, h5py.Group)
+    data = G['data']
+    assert isinstance(data, h5py.Dataset)
+    # reads of the frames (also for the statistics) are recorded in the read stage
+    data = metrics.timed_reads(data)
+    # conversion = data.attrs['conversion']
+    # resolution = data.attrs['resolution']
+    if 'starting_time' not in G:
+        print(f'Skipping: {key} does not have a starting_time dataset')
+        return
+    starting_time_dataset = G['starting_time']
+    assert isinstance(starting_time_dataset, h5py.Dataset)
+    # starting_time = starting_time_dataset[()]
+    rate = starting_time_dataset.attrs['rate']
+    rate = float(rate)  # type: ignore
+    for k, v in data.attrs.items():
+        print(f'{key}: {k}: {v}')
+    # the statistics of a previous run are only available from the checkpoint,
+    # which is recorded before any chunk is encoded
+    cached_statistics = None
+    checkpoint = None
+    fingerprint = {
+        'url': context.input.get_url(),
+        'key': key,
+        'shape': list(data.shape),
+        'dtype': str(data.dtype),
+        'num_timepoints_per_chunk': num_timepoints_per_chunk,
+        'rate': rate,
+        'normalization_method': context.normalization_method,
+        'normalization_percentile': context.normalization_percentile
+    }
+    if context.checkpoint_dir:
+        checkpoint = ChunkCheckpoint(
+            directory=os.path.join(context.checkpoint_dir, key.replace('/', '__')),
+            fingerprint=fingerprint
+        )
+        cached_statistics = checkpoint.metadata.get('intensity_statistics', None)
+    percentiles = sorted(set(default_percentiles + [context.normalization_percentile]))
+    statistics = cached_statistics
+    if statistics is not None and get_percentile_value(statistics, context.normalization_percentile) is None:
+        statistics = None
+    if statistics is None:
+        print(f'{key}: Computing intensity statistics from a sample of frames')
+        with metrics.stage('statistics'):
+            statistics = compute_intensity_statistics(data, percentiles=percentiles)
+    else:
+        print(f'{key}: Using cached intensity statistics')
+    if checkpoint is not None and checkpoint.metadata.get('intensity_statistics', None) != statistics:
+        checkpoint.set_metadata('intensity_statistics', statistics)
+    print(f'{key}: Intensity statistics: max {statistics["max"]}, percentiles {statistics["percentiles"]}: {statistics["percentile_values"]}')
+    # the normalized chunks in flight are those in the queue, the
+    # one being encoded and the one being produced
+    num_buffers = context.num_prefetch_chunks + 2 if context.num_prefetch_chunks > 0 else 1
+    normalizer = create_frame_normalizer(
+        statistics=statistics,
+        method=context.normalization_method,
+        percentile=context.normalization_percentile,
+        num_buffers=num_buffers
+    )
+    chunk_size = [num_timepoints_per_chunk, data.shape[1], data.shape[2]]
+    with client_lock:
+        G2 = client.create_group(new_key)
+        for k, v in G.attrs.items():
+            if k != 'object_id':
+                G2.attrs[k] = v
+        G2.attrs['object_id'] = str(uuid.uuid4())
+        G2.attrs['compressed_from'] = key
+        for k in G.keys():
+            if k != 'data':
+                client.copy(key + '/' + k, client, new_key + '/' + k)
+        codec = MP4AVCCodec(fps=rate)
+        G2.create_dataset_with_zarr_compressor('data', shape=data.shape, chunks=chunk_size, dtype=np.uint8, compressor=codec)
+        # the chunks are encoded outside of client_lock and written to the
+        # store of the file under it
+        staging_store = client.staging_store
+        assert staging_store is not None
+        ds_chunks = DatasetChunks(store=staging_store, path=new_key + '/data')
+
+        # The preview levels are series of their own, with the rate divided
+        # by the downsampling factor and the number of pixels in dimension
+        # divided by it. They are computed from the normalized chunks of the
+        # full resolution data, so the source is read once. The field of view
+        # is the same physical extent and is kept, as is the imaging plane,
+        # whose grid spacing is that of the source pixels (a preview pixel
+        # spans downsampling_factor of them along each axis).
+        previews = []
+        for factor in preview_factors:
+            preview_key = f'{new_key}_{factor}x'
+            if client.get(preview_key) is not None:
+                print(f'Skipping: {preview_key} already exists')
+                continue
+            G3 = client.create_group(preview_key)
+            for k, v in G.attrs.items():
+                if k != 'object_id':
+                    G3.attrs[k] = v
+            G3.attrs['object_id'] = str(uuid.uuid4())
+            G3.attrs['compressed_from'] = key
+            G3.attrs['downsampling_factor'] = factor
+            for k in G.keys():
+                if k not in ['data', 'dimension']:
+                    client.copy(key + '/' + k, client, preview_key + '/' + k)
+            G3['starting_time'].attrs['rate'] = rate / factor
+            if 'dimension' in G:
+                _create_preview_dimension(G['dimension'], G3, factor=factor)
+            preview_shape = [_ceil_div(n, factor) for n in data.shape]
+            preview_num_timepoints_per_chunk = _get_preview_num_timepoints_per_chunk(factor)
+            G3.create_dataset_with_zarr_compressor(
+                'data',
+                shape=preview_shape,
+                chunks=[preview_num_timepoints_per_chunk, preview_shape[1], preview_shape[2]],
+                dtype=np.uint8,
+                compressor=MP4AVCCodec(fps=rate / factor)
+            )
+            preview_checkpoint = None
+            if checkpoint is not None:
+                preview_checkpoint = ChunkCheckpoint(
+                    directory=os.path.join(context.checkpoint_dir, key.replace('/', '__') + f'_{factor}x'),
+                    fingerprint={**fingerprint, 'downsampling_factor': factor, 'downsampled_from': 'full_resolution', 'preview_num_timepoints_per_chunk': preview_num_timepoints_per_chunk}
+                )
+            previews.append((DatasetChunks(store=staging_store, path=preview_key + '/data'), factor, preview_num_timepoints_per_chunk, preview_checkpoint))
+
+    # the datasets written for each chunk of the source, with the
+    # downsampling factor, chunk length and checkpoint of each
+    outputs = [(ds_chunks, 1, num_timepoints_per_chunk, checkpoint)] + previews
+
+    def get_chunk_indices(i: int, factor: int, num_timepoints: int):
+        # indices of the chunks of a dataset written for the source chunk at i
+        i1 = min(i + num_timepoints_per_chunk, data.shape[0])
+        return range(i // factor // num_timepoints, _ceil_div(_ceil_div(i1, factor), num_timepoints))
+
+    chunk_starts = list(range(0, data.shape[0], num_timepoints_per_chunk))
+    if checkpoint is not None:
+        # Restore the encoded chunks of a previous run directly into the
+        # store of the output datasets and only read and encode the source
+        # chunks for which something is missing
+        remaining_chunk_starts = []
+        for i in chunk_starts:
+            encoded_chunks = []
+            for chunks0, factor, num_timepoints, checkpoint0 in outputs:
+                for chunk_index in get_chunk_indices(i, factor, num_timepoints):
+                    encoded_chunks.append((chunks0, chunk_index, checkpoint0.get_chunk(chunk_index)))
+            if any(encoded is None for _, _, encoded in encoded_chunks):
+                remaining_chunk_starts.append(i)
+                continue
+            with client_lock:
+                for chunks0, chunk_index, encoded in encoded_chunks:
+                    chunks0.put((chunk_index, 0, 0), encoded)
+        print(f'{key}: Restored {len(chunk_starts) - len(remaining_chunk_starts)} of {len(chunk_starts)} chunks from checkpoint')
+        chunk_starts = remaining_chunk_starts
+
+    # Remote reads, normalization (with the downsampling of the preview
+    # levels) and encoding of successive chunks overlap in separate threads
+    def read_chunk(i: int):
+        return i, data[i:i + num_timepoints_per_chunk]
+
+    def normalize_chunk(x):
+        i, chunk = x
+        with metrics.stage('normalize'):
+            chunk_uint8 = normalizer.normalize(chunk)
+        # each level is block-averaged from the full resolution chunk, so
+        # that its values are rounded once
+        preview_chunks = []
+        if len(previews) > 0:
+            with metrics.stage('downsample'):
+                for _, factor, _, _ in previews:
+                    preview_chunks.append(downsample_frames(chunk_uint8, factor))
+        return i, chunk_uint8, preview_chunks
+
+    timer = 0
+    for i, chunk_uint8, preview_chunks in iter_pipelined(
+        chunk_starts,
+        [read_chunk, normalize_chunk],
+        queue_size=context.num_prefetch_chunks
+    ):
+        elapsed = time.time() - timer
+        if elapsed > 3:
+            pct_complete = i / data.shape[0]
+            timer = time.time()
+            print(f'{key}: {pct_complete * 100:.1f}% complete')
+        # the chunks are encoded concurrently with the other series, and
+        # only their writes to the shared file hold client_lock
+        encoded_chunks = []
+        with metrics.stage('encode'):
+            for (chunks0, factor, num_timepoints, checkpoint0), y in zip(outputs, [chunk_uint8] + preview_chunks):
+                for chunk_index in get_chunk_indices(i, factor, num_timepoints):
+                    j = chunk_index * num_timepoints - i // factor
+                    encoded_chunks.append((chunks0, chunk_index, checkpoint0, chunks0.encode(y[j:j + num_timepoints])))
+        with metrics.stage('write'):
+            with client_lock:
+                for chunks0, chunk_index, _, encoded in encoded_chunks:
+                    chunks0.put((chunk_index, 0, 0), encoded)
+        if checkpoint is not None:
+            for _, chunk_index, checkpoint0, encoded in encoded_chunks:
+                checkpoint0.put_chunk(chunk_index, encoded)
+        on_chunk_written([chunks0.get_key((chunk_index, 0, 0)) for chunks0, chunk_index, _, _ in encoded_chunks])
+    print(f'{key}: Done')
+    return new_key
+
+
+def _create_preview_dimension(dimension_dataset, G3, *, factor: int):
+    # the number of pixels along x and y (and z, which is not downsampled)
+    dimension = np.array(dimension_dataset[()])
+    dimension[:2] = [_ceil_div(int(n), factor) for n in dimension[:2]]
+    ds = G3.create_dataset('dimension', data=dimension)
+    for k, v in dimension_dataset.attrs.items():
+        ds.attrs[k] = v
+
+
+def _estimate_series_memory_bytes(data, context: CompressedVideosContext, *, preview_factors: List[int]):
+    # raw chunks being read or queued, the float32 scratch buffer and the
+    # uint8 buffers (with their preview levels), per series being processed;
+    # data is the NwbObject of the series data
+    if data is None or data.shape is None or len(data.shape) < 3:
+        return 0
+    frame_size = int(np.prod(data.shape[1:]))
+    chunk_num_pixels = min(num_timepoints_per_chunk, data.shape[0]) * frame_size
+    num_chunks_in_flight = context.num_prefetch_chunks + 2
+    preview_fraction = sum(1 / factor ** 3 for factor in preview_factors)
+    return int(chunk_num_pixels * (num_chunks_in_flight * np.dtype(data.dtype).itemsize + 4 + num_chunks_in_flight * (1 + preview_fraction)))
+
+
+class _MemoryBudget:
+    """Admit tasks while the sum of their estimated memory stays within the
+    budget. A task that is larger than the whole budget is admitted when
+    nothing else is running."""
+    def __init__(self, budget_bytes: int):
+        import threading
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, num_bytes: int):
+        with self._condition:
+            while self.used_bytes > 0 and self.used_bytes + num_bytes > self.budget_bytes:
+                self._condition.wait()
+            self.used_bytes += num_bytes
+
+    def release(self, num_bytes: int):
+        with self._condition:
+            self.used_bytes -= num_bytes
+            self._condition.notify_all()
+
+
+def _ceil_div(a: int, b: int):
+    return -(-a // b)
@@ -0,0 +1,104 @@
+from typing import Any, Dict, Union
+import hashlib
+import json
+import os
+import shutil
+
+
+class ChunkCheckpoint:
+    """On-disk record of the encoded chunks of one output dataset.
+
+    The directory holds one file per encoded chunk and an append-only
+    manifest.jsonl. The first line of the manifest is the fingerprint of the
+    encoding (input, shapes, normalization settings, ...). Each following
+    line either records a chunk with the sha1 of its file or sets a metadata
+    value. If the fingerprint does not match, the checkpoint is cleared. A
+    chunk is only returned by get_chunk if its file matches the recorded
+    hash, so a partially written chunk from a killed job is re-encoded.
+
+    The directory should be on storage that outlives the job (for example a
+    mounted persistent volume) for a rerun to be able to resume.
+    """
+    def __init__(self, *, directory: str, fingerprint: dict):
+        self.directory = directory
+        self.fingerprint = json.loads(json.dumps(fingerprint))
+        self.metadata: Dict[str, Any] = {}
+        self._chunks: Dict[int, dict] = {}
+        self._manifest_path = os.path.join(directory, 'manifest.jsonl')
+        os.makedirs(directory, exist_ok=True)
+        if not self._load():
+            self._reset()
+
+    @property
+    def num_chunks(self):
+        return len(self._chunks)
+
+    def get_chunk(self, chunk_index: int) -> Union[bytes, None]:
+        entry = self._chunks.get(chunk_index)
+        if entry is None:
+            return None
+        try:
+            with open(self._chunk_path(chunk_index), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) != entry['size'] or hashlib.sha1(data).hexdigest() != entry['sha1']:
+            return None
+        return data
+
+    def put_chunk(self, chunk_index: int, data: bytes):
+        path = self._chunk_path(chunk_index)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        entry = {'sha1': hashlib.sha1(data).hexdigest(), 'size': len(data)}
+        self._append({'chunk': chunk_index, **entry})
+        self._chunks[chunk_index] = entry
+
+    def set_metadata(self, name: str, value: Any):
+        self._append({'metadata': {name: value}})
+        self.metadata[name] = value
+
+    def _chunk_path(self, chunk_index: int):
+        return os.path.join(self.directory, f'chunk_{chunk_index}.bin')
+
+    def _append(self, record: dict):
+        with open(self._manifest_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _load(self):
+        if not os.path.exists(self._manifest_path):
+            return False
+        with open(self._manifest_path) as f:
+            text = f.read()
+        if text and not text.endswith('\n'):
+            # terminate an incomplete last line so that new records start on their own line
+            with open(self._manifest_path, 'a') as f:
+                f.write('\n')
+        lines = text.splitlines()
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # a line may be incomplete if the job was killed while writing it
+                continue
+        if len(records) == 0 or records[0].get('fingerprint') != self.fingerprint:
+            return False
+        for record in records[1:]:
+            if 'chunk' in record:
+                self._chunks[record['chunk']] = {'sha1': record['sha1'], 'size': record['size']}
+            elif 'metadata' in record:
+                self.metadata.update(record['metadata'])
+        return True
+
+    def _reset(self):
+        shutil.rmtree(self.directory)
+        os.makedirs(self.directory)
+        self.metadata = {}
+        self._chunks = {}
+        self._append({'fingerprint': self.fingerprint})
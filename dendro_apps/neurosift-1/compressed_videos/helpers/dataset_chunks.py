@@ -0,0 +1,60 @@
+from typing import Any, Tuple, Union
+import json
+import numpy as np
+
+
+class DatasetChunks:
+    """The encoded chunks of one dataset, read from and written to the zarr
+    store of the file (e.g. the staging store of a LindiH5pyFile) at the keys
+    the zarr array of the dataset uses.
+
+    Only the zarr v2 layout written by create_dataset_with_zarr_compressor is
+    supported (C order, a compressor and no filters); the .zarray metadata
+    is checked when the dataset is opened, so that a change of the layout
+    fails here rather than writing chunks that zarr cannot read.
+    """
+    def __init__(self, *, store: Any, path: str):
+        self.store = store
+        self.path = path.strip('/')
+        zarray = json.loads(store[self.path + '/.zarray'])
+        if zarray.get('zarr_format') != 2:
+            raise ValueError(f'Unsupported zarr format for {self.path}: {zarray.get("zarr_format")}')
+        if zarray.get('filters'):
+            raise ValueError(f'Unsupported filters for {self.path}: {zarray["filters"]}')
+        if zarray.get('order', 'C') != 'C':
+            raise ValueError(f'Unsupported order for {self.path}: {zarray["order"]}')
+        self.shape = tuple(zarray['shape'])
+        self.chunks = tuple(zarray['chunks'])
+        self.dtype = np.dtype(zarray['dtype'])
+        self.fill_value = zarray.get('fill_value', None)
+        self._dimension_separator = zarray.get('dimension_separator', None) or '.'
+        self._codec = None
+        if zarray.get('compressor', None) is not None:
+            import numcodecs
+            self._codec = numcodecs.get_codec(zarray['compressor'])
+
+    def get_key(self, chunk_index: Tuple[int, ...]) -> str:
+        return self.path + '/' + self._dimension_separator.join(str(i) for i in chunk_index)
+
+    def encode(self, data: np.ndarray) -> bytes:
+        """Encode the data of one chunk. A chunk at the end of the dataset
+        may be smaller than the chunk shape; like zarr, it is padded with
+        the fill value."""
+        data = np.asarray(data, dtype=self.dtype)
+        if data.shape != self.chunks:
+            chunk = np.full(self.chunks, self.fill_value if self.fill_value is not None else 0, dtype=self.dtype)
+            chunk[tuple(slice(0, n) for n in data.shape)] = data
+            data = chunk
+        data = np.ascontiguousarray(data)
+        if self._codec is None:
+            return data.tobytes()
+        return bytes(self._codec.encode(data))
+
+    def get(self, chunk_index: Tuple[int, ...]) -> Union[bytes, None]:
+        try:
+            return bytes(self.store[self.get_key(chunk_index)])
+        except KeyError:
+            return None
+
+    def put(self, chunk_index: Tuple[int, ...], encoded: bytes):
+        self.store[self.get_key(chunk_index)] = encoded
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+def downsample_frames(frames: np.ndarray, factor: int, *, num_frames_per_slab: int = 16) -> np.ndarray:
+    """Block-average uint8 frames of shape (T, H, W) by factor in time and in
+    both spatial dimensions, rounding to the nearest integer.
+
+    The output has shape (ceil(T / factor), ceil(H / factor), ceil(W / factor));
+    blocks at the end of an axis that are cut short are averaged over the
+    values they contain. The sums are accumulated in uint32 for
+    num_frames_per_slab output frames at a time, so the scratch memory stays
+    small compared to the input.
+    """
+    if frames.ndim != 3:
+        raise ValueError(f'Expected frames of shape (T, H, W), got {frames.shape}')
+    if factor < 1:
+        raise ValueError(f'Unexpected downsampling factor: {factor}')
+    T, H, W = frames.shape
+    t_starts, t_counts = _get_blocks(T, factor)
+    h_starts, h_counts = _get_blocks(H, factor)
+    w_starts, w_counts = _get_blocks(W, factor)
+    spatial_counts = h_counts[:, None] * w_counts[None, :]
+    out = np.empty((len(t_starts), len(h_starts), len(w_starts)), dtype=np.uint8)
+    for j0 in range(0, len(t_starts), num_frames_per_slab):
+        j1 = min(j0 + num_frames_per_slab, len(t_starts))
+        slab = frames[t_starts[j0]:t_starts[j1 - 1] + t_counts[j1 - 1]]
+        s = np.add.reduceat(slab, t_starts[j0:j1] - t_starts[j0], axis=0, dtype=np.uint32)
+        s = np.add.reduceat(s, h_starts, axis=1)
+        s = np.add.reduceat(s, w_starts, axis=2)
+        counts = t_counts[j0:j1, None, None] * spatial_counts[None, :, :]
+        out[j0:j1] = (s + counts // 2) // counts
+    return out
+
+
+def _get_blocks(n: int, factor: int):
+    starts = np.arange(0, n, factor)
+    counts = np.minimum(starts + factor, n) - starts
+    return starts, counts.astype(np.uint32)
@@ -0,0 +1,61 @@
+from typing import Any, List, Union
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+default_percentiles = [0.1, 1, 50, 99, 99.9]
+
+
+def compute_intensity_statistics(
+    data: Any,
+    *,
+    percentiles: List[float],
+    max_num_samples: int = 20,
+    frames_per_sample: int = 10,
+    num_threads: int = 4,
+    num_histogram_bins: int = 256
+):
+    """Estimate intensity statistics of a (time, ...) dataset from a sample.
+
+    Up to max_num_samples blocks of frames_per_sample frames are read, spread
+    evenly over the whole series. Each block starts at a chunk boundary (if
+    the dataset is chunked in time) so that it touches as few chunks as
+    possible, and the blocks are read by num_threads threads. The first
+    block always starts at frame 0.
+    """
+    num_frames = data.shape[0]
+    chunks = getattr(data, 'chunks', None)
+    time_chunk_size = chunks[0] if chunks else 1
+    frames_per_sample = max(1, min(frames_per_sample, num_frames))
+    num_time_chunks = (num_frames + time_chunk_size - 1) // time_chunk_size
+    num_samples = max(1, min(max_num_samples, num_time_chunks))
+    chunk_inds = np.unique(np.linspace(0, num_time_chunks - 1, num_samples).astype(np.int64))
+    sample_starts = sorted(set(min(int(c) * time_chunk_size, num_frames - frames_per_sample) for c in chunk_inds))
+
+    def read_sample(i: int):
+        return np.asarray(data[i:i + frames_per_sample])
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        samples = list(executor.map(read_sample, sample_starts))
+    sample = np.concatenate(samples, axis=0)
+
+    min_val = float(np.min(sample))
+    max_val = float(np.max(sample))
+    percentile_values = np.percentile(sample, percentiles)
+    histogram_counts, histogram_edges = np.histogram(sample, bins=num_histogram_bins, range=(min_val, max_val))
+    return {
+        'num_sampled_frames': int(sample.shape[0]),
+        'min': min_val,
+        'max': max_val,
+        'percentiles': [float(p) for p in percentiles],
+        'percentile_values': [float(v) for v in percentile_values],
+        'histogram_counts': [int(c) for c in histogram_counts],
+        'histogram_edges': [float(e) for e in histogram_edges]
+    }
+
+
+def get_percentile_value(statistics: dict, percentile: float) -> Union[float, None]:
+    for p, v in zip(statistics['percentiles'], statistics['percentile_values']):
+        if p == percentile:
+            return v
+    return None
@@ -0,0 +1,92 @@
+from typing import Any, Callable, Iterable, Iterator, List
+import queue
+import threading
+
+
+def iter_pipelined(
+    items: Iterable[Any],
+    stages: List[Callable[[Any], Any]],
+    *,
+    queue_size: int = 2
+) -> Iterator[Any]:
+    """Yield stages[-1](...stages[0](item)) for each item, in order.
+
+    Each stage runs in its own thread and hands its results to the next stage
+    through a queue holding at most queue_size items, so that different items
+    are in different stages at the same time while memory stays bounded. The
+    consumer of the generator acts as the final stage. If queue_size is 0 the
+    stages are run sequentially in the calling thread.
+
+    An exception raised by a stage is re-raised in the consumer.
+    """
+    if queue_size <= 0:
+        for item in items:
+            for stage in stages:
+                item = stage(item)
+            yield item
+        return
+
+    stop = threading.Event()
+    queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in stages]
+
+    def put(q: queue.Queue, x: Any):
+        while not stop.is_set():
+            try:
+                q.put(x, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(q: queue.Queue):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _done
+
+    def iter_source(k: int):
+        if k == 0:
+            yield from items
+        else:
+            while True:
+                x = get(queues[k - 1])
+                if x is _done:
+                    return
+                if isinstance(x, _Failure):
+                    raise x.exception
+                yield x
+
+    def run_stage(k: int):
+        try:
+            for x in iter_source(k):
+                if not put(queues[k], stages[k](x)):
+                    return
+            put(queues[k], _done)
+        except BaseException as e:
+            put(queues[k], _Failure(e))
+
+    threads = [threading.Thread(target=run_stage, args=(k,), daemon=True) for k in range(len(stages))]
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            x = get(queues[-1])
+            if x is _done:
+                return
+            if isinstance(x, _Failure):
+                raise x.exception
+            yield x
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+
+
+_done = object()
+
+
+class _Failure:
+    def __init__(self, exception: BaseException):
+        self.exception = exception
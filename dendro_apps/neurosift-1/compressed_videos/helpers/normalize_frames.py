@@ -0,0 +1,66 @@
+from typing import List, Union
+import numpy as np
+from .intensity_statistics import get_percentile_value
+
+
+class FrameNormalizer:
+    """Convert chunks of frames to uint8 as clip((x - offset) * scale, 0, 255).
+
+    The computation is done in place in a float32 scratch buffer and the
+    result is written to one of num_buffers preallocated uint8 buffers, used
+    in rotation, so no temporaries are allocated per chunk. Values outside of
+    the range saturate at 0 and 255 instead of wrapping around.
+
+    The array returned by normalize() is only valid until num_buffers more
+    chunks have been normalized, so num_buffers must be at least the number
+    of normalized chunks that can be alive at the same time.
+    """
+    def __init__(self, *, scale: float, offset: float = 0, num_buffers: int = 1):
+        self.scale = scale
+        self.offset = offset
+        self.num_buffers = num_buffers
+        self._scratch: Union[np.ndarray, None] = None
+        self._buffers: List[np.ndarray] = []
+        self._next_buffer = 0
+
+    def normalize(self, chunk: np.ndarray) -> np.ndarray:
+        if self._scratch is None or chunk.shape[1:] != self._scratch.shape[1:] or chunk.shape[0] > self._scratch.shape[0]:
+            self._scratch = np.empty(chunk.shape, dtype=np.float32)
+            self._buffers = [np.empty(chunk.shape, dtype=np.uint8) for _ in range(self.num_buffers)]
+        n = chunk.shape[0]
+        scratch = self._scratch[:n]
+        out = self._buffers[self._next_buffer][:n]
+        self._next_buffer = (self._next_buffer + 1) % self.num_buffers
+        np.multiply(chunk, self.scale, out=scratch, dtype=np.float32, casting='same_kind')
+        if self.offset != 0:
+            np.subtract(scratch, self.offset * self.scale, out=scratch)
+        np.clip(scratch, 0, 255, out=scratch)
+        np.copyto(out, scratch, casting='unsafe')
+        return out
+
+
+def create_frame_normalizer(
+    *,
+    statistics: dict,
+    method: str,
+    percentile: float = 99.9,
+    num_buffers: int = 1
+):
+    """Create a FrameNormalizer from intensity statistics (see
+    compute_intensity_statistics).
+
+    method='max' maps the maximum intensity to 255. method='percentile' maps
+    the given percentile (which must be in the statistics) to 255, so that a
+    few very bright pixels don't darken the whole movie.
+    """
+    if method == 'max':
+        max_val = statistics['max']
+    elif method == 'percentile':
+        max_val = get_percentile_value(statistics, percentile)
+        if max_val is None:
+            raise ValueError(f'Percentile {percentile} is not in the intensity statistics')
+    else:
+        raise ValueError(f'Unexpected normalization method: {method}')
+    if max_val <= 0:
+        max_val = 1
+    return FrameNormalizer(scale=255 / max_val, num_buffers=num_buffers)
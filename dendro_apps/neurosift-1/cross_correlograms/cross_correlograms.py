@@ -0,0 +1,264 @@
+from dendro.sdk import ProcessorBase, InputFile, OutputFile
+from dendro.sdk import BaseModel, Field
+import numpy as np
+
+
+# Approximate bytes per spike held by the streamed nearest-units path (the
+# spike trains of a block plus the slice read for them), per spike for all
+# pairs (the spike times plus the merged time, unit and sort arrays), and
+# per pair of spikes within the window while they are binned
+_streamed_bytes_per_spike = 16
+_all_pairs_bytes_per_spike = 40
+_bytes_per_pair = 64
+
+
+class CrossCorrelogramsContext(BaseModel):
+    input: InputFile = Field(description="Input .nwb.lindi.json file")
+    output: OutputFile = Field(description="Output .nwb.lindi.json file")
+    window_size_msec: float = Field(default=100, description="Size of the correlogram window in milliseconds")
+    bin_size_msec: float = Field(default=1, description="Size of the correlogram bins in milliseconds")
+    num_nearest_units: int = Field(default=10, description="Compute cross-correlograms between each unit and this many nearest units (by electrode location), when the electrode locations are available; 0 (or no electrode locations) means all pairs")
+    memory_budget_mb: int = Field(default=0, description="If greater than 0, stream the spike times so that only those of a block of units and their nearest units are held, within about this many MB; all pairs need all the spike times, and fail if their estimated memory exceeds this (0 means load all spike times at once)")
+    attach_run_metrics: bool = Field(default=False, description="If true, store the per-stage timing and memory summary of the run in the run_metrics attribute of the cross_correlogram dataset")
+    num_upload_threads: int = Field(default=4, description="Number of blobs of the output uploaded at the same time")
+    chunk_cache_dir: str = Field(default='', description="If set, the chunks of the input that are read from remote storage are cached in this directory (which can be shared by the jobs running on a node), so that other jobs on the same asset or a rerun don't download them again")
+    chunk_cache_max_mb: int = Field(default=10000, description="Size cap of the chunk cache in MB; the least recently used chunks are removed beyond it")
+
+
+class CrossCorrelogramsProcessor(ProcessorBase):
+    name = "neurosift-1.cross_correlograms"
+    description = "Create cross-correlograms"
+    label = "neurosift-1.cross_correlograms"
+    tags = []
+    attributes = {"wip": True}
+
+    @staticmethod
+    def run(context: CrossCorrelogramsContext):
+        import os
+        import shutil
+        import lindi
+        import kachery_cloud as kcl
+        from common.instrumentation import RunMetrics
+        from common.blob_upload import BlobUploader, upload_staging_store
+        from common.lindi_inputs import open_lindi_input
+        from common.chunk_cache import ChunkCache
+        from common.nwb_index import NwbIndex
+
+        metrics = RunMetrics(processor_name=CrossCorrelogramsProcessor.name)
+
+        with lindi.StagingArea.create('staging') as staging_area:
+            # remote chunks of the input are read through the cache, if enabled
+            chunk_cache = ChunkCache(directory=context.chunk_cache_dir, max_size_bytes=context.chunk_cache_max_mb * 1024 * 1024) if context.chunk_cache_dir else None
+            with metrics.stage('read'):
+                client = open_lindi_input(context.input.get_url(), staging_area=staging_area, local_cache=chunk_cache)
+            # The units tables are found from the zarr metadata, so those
+            # outside of /units (e.g. in processing modules) are included
+            nwb_index = NwbIndex.from_lindi_file(client)
+            units_paths = [
+                obj.path for obj in nwb_index.find('Units')
+                if nwb_index.get_child(obj, 'spike_times') is not None and nwb_index.get_child(obj, 'spike_times_index') is not None
+            ]
+            if len(units_paths) == 0:
+                raise Exception('No units table with spike times found')
+            datasets = []
+            for units_path in units_paths:
+                print(f'Processing units table: {units_path}')
+                datasets.append(_add_cross_correlograms(
+                    client=client,
+                    units_path=units_path,
+                    context=context,
+                    metrics=metrics
+                ))
+
+            if context.attach_run_metrics:
+                for ds in datasets:
+                    metrics.attach(ds.attrs)
+
+            output_path = 'output.lindi.json'
+
+            def on_store_main(filename: str):
+                shutil.copyfile(filename, output_path)
+                return output_path
+
+            staging_store = client.staging_store
+            assert staging_store is not None
+            print('Uploading supporting files')
+            with metrics.stage('staging'), BlobUploader(store_file=kcl.store_file, num_threads=context.num_upload_threads, metrics=metrics) as uploader:
+                upload_staging_store(
+                    staging_store,
+                    staging_directory=staging_area.directory,
+                    uploader=uploader,
+                    on_store_main=on_store_main
+                )
+
+            print('Uploading output file')
+            with metrics.stage('main_upload') as s:
+                context.output.upload(output_path)
+                s.bytes_written += os.path.getsize(output_path)
+
+            if chunk_cache is not None:
+                chunk_cache.report()
+
+        metrics.emit()
+
+
+def _add_cross_correlograms(*, client, units_path: str, context: CrossCorrelogramsContext, metrics):
+    # adds the cross_correlogram and cross_correlogram_partner columns to a
+    # units table and returns the cross_correlogram dataset
+    import h5py
+    import uuid
+    import numcodecs
+    from autocorrelograms.helpers.compute_cross_correlograms import get_bin_edges_sec, get_nearest_partner_unit_indices, iter_cross_correlograms, iter_cross_correlograms_streamed
+
+    units_group = client[units_path]
+    assert isinstance(units_group, h5py.Group)
+    spike_times_dataset = units_group['spike_times']
+    assert isinstance(spike_times_dataset, h5py.Dataset)
+    spike_times_dataset = metrics.timed_reads(spike_times_dataset)
+    spike_times_index = metrics.timed_reads(units_group['spike_times_index'])[()]
+    num_units = len(spike_times_index)
+    total_num_spikes = spike_times_dataset.shape[0]
+
+    # None means all pairs, with partner v in column v
+    partner_unit_indices = None
+    if context.num_nearest_units > 0:
+        unit_locations = _get_unit_locations(client, units_group)
+        if unit_locations is None:
+            print('Unable to determine unit locations; computing all pairs')
+        else:
+            partner_unit_indices = get_nearest_partner_unit_indices(
+                unit_locations=unit_locations,
+                num_nearest_units=context.num_nearest_units
+            )
+    num_partners = num_units if partner_unit_indices is None else partner_unit_indices.shape[1]
+    bin_edges_sec = get_bin_edges_sec(window_size_msec=context.window_size_msec, bin_size_msec=context.bin_size_msec)
+    num_bins = len(bin_edges_sec) - 1
+
+    # Create new datasets in the units table to store the cross-correlograms,
+    # chunked by rows of about 1 MB so that a unit can be loaded on its own.
+    # The rows are computed and written a block of chunks at a time, so the
+    # whole array is never held in memory.
+    num_rows_per_chunk = max(1, (1 << 20) // (max(num_partners, 1) * num_bins * 4))
+    num_units_per_block = num_rows_per_chunk * 16
+    max_pairs_per_block = 1 << 22
+    max_spikes_per_block = None
+    if context.memory_budget_mb > 0:
+        # the budget is split between the spike data and the binning of the
+        # pairs of spikes, after the index arrays and one block of the output
+        memory_budget_bytes = context.memory_budget_mb * 1024 * 1024
+        available = memory_budget_bytes - spike_times_index.nbytes * 2 - num_units_per_block * num_partners * (num_bins * 4 + 4)
+        max_pairs_per_block = max(1, min(max_pairs_per_block, available // 4 // _bytes_per_pair))
+        available -= max_pairs_per_block * _bytes_per_pair
+        if partner_unit_indices is None:
+            required = total_num_spikes * _all_pairs_bytes_per_spike
+            if required > available:
+                raise ValueError(
+                    f'Cross-correlograms of all pairs of {num_units} units need about {required // (1024 * 1024)} MB for the spike times, '
+                    f'more than the memory budget of {context.memory_budget_mb} MB; set num_nearest_units (with electrode locations) or increase memory_budget_mb'
+                )
+        else:
+            max_spikes_per_block = available // _streamed_bytes_per_spike
+            if max_spikes_per_block < 1:
+                raise ValueError(f'Memory budget of {context.memory_budget_mb} MB is too small')
+    ds = units_group.create_dataset_with_zarr_compressor(
+        'cross_correlogram',
+        shape=(num_units, num_partners, num_bins),
+        chunks=[num_rows_per_chunk, num_partners, num_bins],
+        dtype=np.uint32,
+        compressor=numcodecs.Zlib(level=5)
+    )
+    ds2 = units_group.create_dataset_with_zarr_compressor(
+        'cross_correlogram_partner',
+        shape=(num_units, num_partners),
+        chunks=[num_rows_per_chunk, num_partners],
+        dtype=np.int32,
+        compressor=numcodecs.Zlib(level=5)
+    )
+    if max_spikes_per_block is not None:
+        # only the spike trains of a block of units and their partners are
+        # read and held at a time
+        print(f'Streaming spike times for {num_units} units with {total_num_spikes} total spikes (up to {max_spikes_per_block} spikes per block)')
+        blocks = iter_cross_correlograms_streamed(
+            spike_times=spike_times_dataset,
+            spike_times_index=spike_times_index,
+            partner_unit_indices=partner_unit_indices,
+            window_size_msec=context.window_size_msec,
+            bin_size_msec=context.bin_size_msec,
+            max_spikes_per_block=max_spikes_per_block,
+            num_units_per_block=num_units_per_block,
+            max_pairs_per_block=max_pairs_per_block
+        )
+    else:
+        print('Loading spike times')
+        spike_times = spike_times_dataset[()]
+        print(f'Loaded {num_units} units with {total_num_spikes} total spikes')
+        blocks = iter_cross_correlograms(
+            spike_times=spike_times,
+            spike_times_index=spike_times_index,
+            partner_unit_indices=partner_unit_indices,
+            window_size_msec=context.window_size_msec,
+            bin_size_msec=context.bin_size_msec,
+            num_units_per_block=num_units_per_block,
+            max_pairs_per_block=max_pairs_per_block
+        )
+    print(f'Computing cross-correlograms ({num_partners} partners per unit)')
+    while True:
+        with metrics.stage('compute'):
+            block = next(blocks, None)
+        if block is None:
+            break
+        u1, u2, bin_counts = block
+        print(f'Writing cross-correlograms of units {u1 + 1} to {u2} of {num_units}')
+        with metrics.stage('write'):
+            ds[u1:u2] = bin_counts
+            if partner_unit_indices is None:
+                ds2[u1:u2] = np.tile(np.arange(num_units, dtype=np.int32), (u2 - u1, 1))
+            else:
+                ds2[u1:u2] = partner_unit_indices[u1:u2].astype(np.int32)
+    ds.attrs['bin_edges_sec'] = bin_edges_sec.tolist()
+    ds.attrs['description'] = 'the cross-correlogram of each spike unit against the units in cross_correlogram_partner'
+    ds.attrs['namespace'] = 'hdmf-common'
+    ds.attrs['neurodata_type'] = 'VectorData'
+    ds.attrs['object_id'] = str(uuid.uuid4())
+
+    ds2.attrs['description'] = 'the unit (row) index of the partner unit for each cross-correlogram'
+    ds2.attrs['namespace'] = 'hdmf-common'
+    ds2.attrs['neurodata_type'] = 'VectorData'
+    ds2.attrs['object_id'] = str(uuid.uuid4())
+
+    # Update the colnames attribute of the units table
+    colnames = units_group.attrs['colnames']
+    assert isinstance(colnames, np.ndarray)
+    colnames = colnames.tolist()
+    colnames.append('cross_correlogram')
+    colnames.append('cross_correlogram_partner')
+    units_group.attrs['colnames'] = colnames
+    return ds
+
+
+def _get_unit_locations(client, units_group):
+    # mean location of the electrodes of each unit, from the electrodes table
+    import h5py
+    if 'electrodes' not in units_group or 'electrodes_index' not in units_group:
+        return None
+    electrodes_table = client.get('/general/extracellular_ephys/electrodes')
+    if not isinstance(electrodes_table, h5py.Group):
+        return None
+    for coord_names in [('rel_x', 'rel_y', 'rel_z'), ('x', 'y', 'z')]:
+        coords = [electrodes_table[name][()] for name in coord_names if name in electrodes_table]
+        if len(coords) >= 2:
+            break
+    else:
+        return None
+    electrode_locations = np.stack(coords, axis=1).astype(np.float64)
+    unit_electrodes = units_group['electrodes'][()]
+    unit_electrodes_index = units_group['electrodes_index'][()]
+    unit_locations = np.zeros((len(unit_electrodes_index), electrode_locations.shape[1]))
+    p = 0
+    for i in range(len(unit_electrodes_index)):
+        inds = unit_electrodes[p:unit_electrodes_index[i]]
+        if len(inds) == 0:
+            return None
+        unit_locations[i] = np.mean(electrode_locations[inds], axis=0)
+        p = unit_electrodes_index[i]
+    return unit_locations
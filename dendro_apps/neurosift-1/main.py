@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 
 
+import sys
 from dendro.sdk import App
 from autocorrelograms.autocorrelograms import AutocorrelogramsProcessor
 from compressed_videos.compressed_videos import CompressedVideosProcessor
+from cross_correlograms.cross_correlograms import CrossCorrelogramsProcessor
 
 app = App(
     name="neurosift-1",
@@ -15,6 +17,12 @@ app = App(
 
 app.add_processor(AutocorrelogramsProcessor)
 app.add_processor(CompressedVideosProcessor)
+app.add_processor(CrossCorrelogramsProcessor)
 
 if __name__ == "__main__":
-    app.run()
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        # many jobs in one warm process (see batch_worker.py)
+        from batch_worker import main as batch_main
+        batch_main(sys.argv[2:])
+    else:
+        app.run()
@@ -0,0 +1,40 @@
+from typing import List
+import numpy as np
+
+
+def random_train(rng: np.random.Generator, *, num_spikes: int, duration_sec: float = 5) -> np.ndarray:
+    return np.sort(rng.uniform(0, duration_sec, num_spikes))
+
+
+def bursty_train(rng: np.random.Generator, *, num_bursts: int, duration_sec: float = 5) -> np.ndarray:
+    # bursts of a few spikes 1-4 ms apart, so most pairs fall in the window
+    burst_times = rng.uniform(0, duration_sec, num_bursts)
+    train = np.concatenate([t + np.cumsum(rng.uniform(0.001, 0.004, rng.integers(1, 8))) for t in burst_times]) if num_bursts > 0 else np.zeros((0,))
+    return np.sort(train)
+
+
+def quantized_train(rng: np.random.Generator, *, num_spikes: int, step_msec: float = 0.5, duration_sec: float = 1) -> np.ndarray:
+    # times on a grid of half a bin, so that deltas land exactly on bin edges,
+    # with repeated times
+    steps = rng.integers(0, int(duration_sec * 1000 / step_msec), num_spikes)
+    return np.sort(steps * step_msec / 1000)
+
+
+def make_trains(seed: int) -> List[np.ndarray]:
+    """Trains of every kind, including empty ones and single spikes."""
+    rng = np.random.default_rng(seed)
+    return [
+        random_train(rng, num_spikes=300),
+        bursty_train(rng, num_bursts=60),
+        quantized_train(rng, num_spikes=400),
+        quantized_train(rng, num_spikes=200, step_msec=2.5),
+        np.zeros((0,)),
+        np.array([0.25]),
+        random_train(rng, num_spikes=2),
+    ]
+
+
+def to_ragged(trains: List[np.ndarray]):
+    spike_times = np.concatenate(trains) if len(trains) > 0 else np.zeros((0,))
+    spike_times_index = np.cumsum([len(t) for t in trains]).astype(np.int64)
+    return spike_times, spike_times_index
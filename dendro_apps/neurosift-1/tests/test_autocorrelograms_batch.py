@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from autocorrelograms.helpers.compute_autocorrelograms_batch import compute_autocorrelograms_batch, get_balanced_unit_shards, get_unit_shards
+from autocorrelograms.helpers.compute_correlogram_data import compute_correlogram_data
+from spike_trains import make_trains, to_ragged
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('window_size_msec, bin_size_msec', [(100, 1), (50, 2.5), (20, 0.5)])
+def test_batch_matches_reference(seed, window_size_msec, bin_size_msec):
+    # includes units with 0 and 1 spikes
+    trains = make_trains(seed)
+    spike_times, spike_times_index = to_ragged(trains)
+    r = compute_autocorrelograms_batch(spike_times=spike_times, spike_times_index=spike_times_index, window_size_msec=window_size_msec, bin_size_msec=bin_size_msec, max_keys_per_bincount=1000)
+    for i, train in enumerate(trains):
+        expected = compute_correlogram_data(spike_train_1=train, window_size_msec=window_size_msec, bin_size_msec=bin_size_msec, method='reference')
+        np.testing.assert_array_equal(r['bin_counts'][i], expected['bin_counts'])
+        np.testing.assert_array_equal(r['bin_edges_sec'], expected['bin_edges_sec'])
+
+
+@pytest.mark.parametrize('num_shards', [1, 2, 3, 5, 20])
+def test_balanced_shards(num_shards):
+    trains = make_trains(3) + make_trains(4)
+    spike_times, spike_times_index = to_ragged(trains)
+    shards = get_balanced_unit_shards(spike_times_index=spike_times_index, num_shards=num_shards)
+    assert len(shards) <= num_shards
+    # contiguous and covering all the units
+    assert shards[0][0] == 0 and shards[-1][1] == len(trains)
+    assert all(u2 == v1 for (_, u2), (v1, _) in zip(shards[:-1], shards[1:]))
+    assert all(u1 < u2 for u1, u2 in shards)
+    # computing each shard on its own gives the same result as all at once
+    r = compute_autocorrelograms_batch(spike_times=spike_times, spike_times_index=spike_times_index)
+    for u1, u2 in shards:
+        p1 = spike_times_index[u1 - 1] if u1 > 0 else 0
+        r2 = compute_autocorrelograms_batch(spike_times=spike_times[p1:spike_times_index[u2 - 1]], spike_times_index=spike_times_index[u1:u2] - p1)
+        np.testing.assert_array_equal(r2['bin_counts'], r['bin_counts'][u1:u2])
+
+
+def test_unit_shards():
+    trains = make_trains(5)
+    _, spike_times_index = to_ragged(trains)
+    shards = get_unit_shards(spike_times_index=spike_times_index, max_spikes_per_shard=250)
+    assert shards[0][0] == 0 and shards[-1][1] == len(trains)
+    for u1, u2 in shards:
+        p1 = spike_times_index[u1 - 1] if u1 > 0 else 0
+        # only a single unit may be larger than the limit
+        assert spike_times_index[u2 - 1] - p1 <= 250 or u2 - u1 == 1
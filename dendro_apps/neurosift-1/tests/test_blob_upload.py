@@ -0,0 +1,46 @@
+from common.blob_upload import BlobUploader
+
+
+def _write(path: str, data: bytes):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_identical_blobs_uploaded_once(tmp_path):
+    uploaded = []
+
+    def store_file(filename: str):
+        uploaded.append(filename)
+        return f'url:{len(uploaded)}'
+
+    _write(str(tmp_path / 'a'), b'abc')
+    _write(str(tmp_path / 'b'), b'abc')
+    with BlobUploader(store_file=store_file, num_threads=2) as uploader:
+        assert uploader.store_blob(str(tmp_path / 'a')) == uploader.store_blob(str(tmp_path / 'b'))
+    assert len(uploaded) == 1
+    assert uploader.num_skipped == 1
+
+
+def test_file_changed_during_upload(tmp_path):
+    # a file submitted while it was empty is written before its upload
+    # reads it; the URL of that upload is not reused for empty blobs
+    path = str(tmp_path / 'chunk')
+    empty_path = str(tmp_path / 'empty')
+    _write(path, b'')
+    _write(empty_path, b'')
+    contents = {}
+
+    def store_file(filename: str):
+        if filename == path and len(contents) == 0:
+            _write(path, b'encoded chunk')
+        with open(filename, 'rb') as f:
+            data = f.read()
+        url = f'url:{len(contents)}'
+        contents[url] = data
+        return url
+
+    with BlobUploader(store_file=store_file, num_threads=1) as uploader:
+        uploader.submit(path)
+        uploader.wait()
+        assert contents[uploader.store_blob(empty_path)] == b''
+        assert contents[uploader.store_blob(path)] == b'encoded chunk'
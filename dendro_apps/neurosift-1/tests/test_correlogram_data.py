@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from autocorrelograms.helpers.compute_correlogram_data import compute_correlogram_data
+from spike_trains import make_trains
+
+resolutions = [(100, 1), (50, 2.5), (20, 0.5), (10, 1)]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('window_size_msec, bin_size_msec', resolutions)
+def test_autocorrelogram_matches_reference(seed, window_size_msec, bin_size_msec):
+    for train in make_trains(seed):
+        expected = compute_correlogram_data(spike_train_1=train, window_size_msec=window_size_msec, bin_size_msec=bin_size_msec, method='reference')
+        r = compute_correlogram_data(spike_train_1=train, window_size_msec=window_size_msec, bin_size_msec=bin_size_msec, method='vectorized')
+        np.testing.assert_array_equal(r['bin_counts'], expected['bin_counts'])
+        np.testing.assert_array_equal(r['bin_edges_sec'], expected['bin_edges_sec'])
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('window_size_msec, bin_size_msec', resolutions)
+def test_cross_correlogram_matches_reference(seed, window_size_msec, bin_size_msec):
+    trains = make_trains(seed)
+    for train1 in trains:
+        for train2 in trains:
+            expected = compute_correlogram_data(spike_train_1=train1, spike_train_2=train2, window_size_msec=window_size_msec, bin_size_msec=bin_size_msec, method='reference')
+            # small blocks, so that the pairs are split across blocks
+            r = compute_correlogram_data(spike_train_1=train1, spike_train_2=train2, window_size_msec=window_size_msec, bin_size_msec=bin_size_msec, method='vectorized', max_pairs_per_block=100)
+            np.testing.assert_array_equal(r['bin_counts'], expected['bin_counts'])
+
+
+def test_unexpected_method():
+    with pytest.raises(ValueError):
+        compute_correlogram_data(spike_train_1=np.array([0.1]), method='searchsorted')
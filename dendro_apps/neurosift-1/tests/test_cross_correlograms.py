@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from autocorrelograms.helpers.compute_cross_correlograms import compute_cross_correlograms, get_nearest_partner_unit_indices, get_partner_unit_blocks, iter_cross_correlograms_streamed
+from spike_trains import make_trains, to_ragged
+
+
+class _CountingDataset:
+    # the spike_times dataset, recording the number of spikes read
+    def __init__(self, data: np.ndarray):
+        self.data = data
+        self.num_spikes_read = 0
+
+    def __getitem__(self, s):
+        x = self.data[s]
+        self.num_spikes_read += len(x)
+        return x
+
+
+def _make_partner_unit_indices(num_units: int, num_nearest_units: int):
+    rng = np.random.default_rng(0)
+    return get_nearest_partner_unit_indices(unit_locations=rng.normal(size=(num_units, 2)), num_nearest_units=num_nearest_units)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('max_spikes_per_block', [1, 300, 10 ** 9])
+def test_streamed_matches_in_memory(seed, max_spikes_per_block):
+    trains = make_trains(seed) + make_trains(seed + 10)
+    spike_times, spike_times_index = to_ragged(trains)
+    partner_unit_indices = _make_partner_unit_indices(len(trains), 3)
+    expected = compute_cross_correlograms(spike_times=spike_times, spike_times_index=spike_times_index, partner_unit_indices=partner_unit_indices, window_size_msec=50, bin_size_msec=2)
+    dataset = _CountingDataset(spike_times)
+    bin_counts = np.zeros_like(expected['bin_counts'])
+    for u1, u2, block_bin_counts in iter_cross_correlograms_streamed(
+        spike_times=dataset,
+        spike_times_index=spike_times_index,
+        partner_unit_indices=partner_unit_indices,
+        window_size_msec=50,
+        bin_size_msec=2,
+        max_spikes_per_block=max_spikes_per_block,
+        num_units_per_block=4
+    ):
+        bin_counts[u1:u2] = block_bin_counts
+    np.testing.assert_array_equal(bin_counts, expected['bin_counts'])
+    if max_spikes_per_block == 10 ** 9:
+        # trains kept from one block to the next are not read again
+        assert dataset.num_spikes_read <= len(spike_times) * 2
+
+
+def test_partner_unit_blocks():
+    trains = make_trains(5) + make_trains(6)
+    _, spike_times_index = to_ragged(trains)
+    unit_counts = np.diff(np.concatenate(([0], spike_times_index)))
+    partner_unit_indices = _make_partner_unit_indices(len(trains), 2)
+    blocks = get_partner_unit_blocks(spike_times_index=spike_times_index, partner_unit_indices=partner_unit_indices, max_spikes_per_block=400, max_units_per_block=5)
+    assert blocks[0][0] == 0 and blocks[-1][1] == len(trains)
+    assert all(u2 == v1 for (_, u2), (v1, _) in zip(blocks[:-1], blocks[1:]))
+    for u1, u2 in blocks:
+        assert 0 < u2 - u1 <= 5
+        needed = set(partner_unit_indices[u1:u2].ravel().tolist()) | set(range(u1, u2))
+        # only a single unit may be larger than the limit
+        assert sum(unit_counts[v] for v in needed) <= 400 or u2 - u1 == 1
@@ -0,0 +1,44 @@
+import json
+import numpy as np
+import pytest
+from compressed_videos.helpers.dataset_chunks import DatasetChunks
+
+zarr = pytest.importorskip('zarr')
+numcodecs = pytest.importorskip('numcodecs')
+
+
+def _create_array(store: dict, **kwargs):
+    return zarr.open_array(store=store, path='acquisition/series/data', mode='w', shape=(23, 6, 5), chunks=(10, 6, 5), dtype=np.uint8, **kwargs)
+
+
+@pytest.mark.parametrize('compressor', [None, 'zlib'])
+def test_chunks_match_zarr(compressor):
+    store: dict = {}
+    a = _create_array(store, compressor=numcodecs.Zlib(level=5) if compressor == 'zlib' else None)
+    data = np.random.default_rng(0).integers(0, 256, size=a.shape, dtype=np.uint8)
+    a[:] = data
+    chunks = DatasetChunks(store=store, path='/acquisition/series/data')
+    for i in range(3):
+        # the chunks encoded here are those written by zarr, including the
+        # partial last one
+        expected = chunks.get((i, 0, 0))
+        assert expected is not None
+        encoded = chunks.encode(data[i * 10:(i + 1) * 10])
+        assert encoded == expected
+        # and zarr reads the chunks written here
+        chunks.put((i, 0, 0), encoded)
+    np.testing.assert_array_equal(zarr.open_array(store=store, path='acquisition/series/data', mode='r')[:], data)
+    assert chunks.get((5, 0, 0)) is None
+
+
+def test_unsupported_layout():
+    store: dict = {}
+    _create_array(store, filters=[numcodecs.Delta(dtype=np.uint8)])
+    with pytest.raises(ValueError):
+        DatasetChunks(store=store, path='acquisition/series/data')
+    zarray = json.loads(store['acquisition/series/data/.zarray'])
+    zarray['filters'] = None
+    zarray['zarr_format'] = 3
+    store['acquisition/series/data/.zarray'] = json.dumps(zarray).encode()
+    with pytest.raises(ValueError):
+        DatasetChunks(store=store, path='acquisition/series/data')
@@ -0,0 +1,69 @@
+import base64
+import json
+import numpy as np
+import pytest
+from common.nwb_index import NwbIndex
+
+
+def _make_rfs():
+    spike_times = np.array([0.1, 0.2, 0.35], dtype='<f8')
+    return {
+        'version': 1,
+        'refs': {
+            '.zgroup': {'zarr_format': 2},
+            '.zattrs': {'neurodata_type': 'NWBFile'},
+            'units/.zgroup': {'zarr_format': 2},
+            'units/.zattrs': json.dumps({'neurodata_type': 'Units', 'colnames': ['spike_times']}),
+            'units/spike_times/.zarray': {
+                'zarr_format': 2, 'shape': [3], 'chunks': [3], 'dtype': '<f8', 'compressor': None,
+                'fill_value': 0, 'filters': None, 'order': 'C'
+            },
+            'units/spike_times/.zattrs': 'base64:' + base64.b64encode(json.dumps({'neurodata_type': 'VectorData'}).encode()).decode(),
+            'units/spike_times/0': 'base64:' + base64.b64encode(spike_times.tobytes()).decode()
+        }
+    }
+
+
+def test_index():
+    index = NwbIndex(_make_rfs())
+    assert [obj.path for obj in index.find('Units')] == ['units']
+    spike_times = index.get_child(index.get('/units'), 'spike_times')
+    assert spike_times is not None
+    assert spike_times.neurodata_type == 'VectorData'
+    assert spike_times.shape == [3]
+    assert spike_times.nbytes == 24
+    assert spike_times.num_chunks == 1
+    assert index.get('units').is_group
+
+
+def test_malformed_metadata_skipped():
+    rfs = _make_rfs()
+    rfs['refs']['units/.zattrs'] = 'base64:not base64!'
+    rfs['refs']['units/spike_times/.zattrs'] = 'base64:' + base64.b64encode(b'\xff\xfe').decode()
+    index = NwbIndex(rfs)
+    assert index.find('Units') == []
+    assert index.get('units/spike_times').neurodata_type is None
+    assert index.get('units/spike_times').shape == [3]
+
+
+def test_from_lindi_file_with_staging_area(tmp_path):
+    # requires a lindi with staging areas (lindi.StagingArea), which the
+    # Dockerfile installs from the dev branch; released versions up to 0.4.6
+    # do not have them
+    lindi = pytest.importorskip('lindi')
+    if not hasattr(lindi, 'StagingArea'):
+        pytest.skip('lindi.StagingArea is not available in this version of lindi')
+    from common.lindi_inputs import open_lindi_input
+    path = str(tmp_path / 'input.nwb.lindi.json')
+    with open(path, 'w') as f:
+        json.dump(_make_rfs(), f)
+    # opened as the processors do: for writing, with a staging area
+    with lindi.StagingArea.create(dir=str(tmp_path / 'staging')) as staging_area:
+        client = open_lindi_input(path, staging_area=staging_area)
+        index = NwbIndex.from_lindi_file(client)
+        assert [obj.path for obj in index.find('Units')] == ['units']
+        assert index.get('units/spike_times').shape == [3]
+        # groups created after opening are in the same reference file system
+        G = client.create_group('processing')
+        G.attrs['neurodata_type'] = 'ProcessingModule'
+        assert [obj.path for obj in NwbIndex.from_lindi_file(client).find('ProcessingModule')] == ['processing']
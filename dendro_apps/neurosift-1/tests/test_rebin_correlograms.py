@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from autocorrelograms.helpers.compute_autocorrelograms_batch import compute_autocorrelograms_batch
+from autocorrelograms.helpers.compute_correlogram_data import compute_correlogram_data
+from autocorrelograms.helpers.rebin_correlograms import get_finest_resolution, rebin_correlograms
+from spike_trains import make_trains, to_ragged
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('resolutions', [
+    [(100, 1), (100, 3), (50, 5)],
+    [(20, 0.5), (60, 1.5), (100, 2.5)],
+    [(10, 1), (1000, 9)]
+])
+def test_rebinned_matches_direct(seed, resolutions):
+    # includes quantized trains, with lags on the bin edges
+    trains = make_trains(seed)
+    spike_times, spike_times_index = to_ragged(trains)
+    fine_window_size_msec, fine_bin_size_msec = get_finest_resolution(resolutions)
+    fine = compute_autocorrelograms_batch(spike_times=spike_times, spike_times_index=spike_times_index, window_size_msec=fine_window_size_msec, bin_size_msec=fine_bin_size_msec)
+    for window_size_msec, bin_size_msec in resolutions:
+        r = rebin_correlograms(bin_counts=fine['bin_counts'], bin_edges_sec=fine['bin_edges_sec'], window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+        for i, train in enumerate(trains):
+            expected = compute_correlogram_data(spike_train_1=train, window_size_msec=window_size_msec, bin_size_msec=bin_size_msec, method='reference')
+            np.testing.assert_array_equal(r['bin_counts'][i], expected['bin_counts'])
+            np.testing.assert_array_equal(r['bin_edges_sec'], expected['bin_edges_sec'])
+
+
+@pytest.mark.parametrize('resolutions', [
+    [(100, 1), (100, 2)],
+    [(50, 0.5), (50, 1.25)],
+    [(50, 3), (50, 1.5)]
+])
+def test_not_odd_multiple(resolutions):
+    with pytest.raises(ValueError):
+        get_finest_resolution(resolutions)
+
+
+def test_not_derivable():
+    fine_window_size_msec, fine_bin_size_msec = get_finest_resolution([(50, 1)])
+    r = compute_correlogram_data(spike_train_1=np.array([0.1, 0.2]), window_size_msec=fine_window_size_msec, bin_size_msec=fine_bin_size_msec)
+    # a wider window, and a bin size that is not an odd multiple
+    for window_size_msec, bin_size_msec in [(100, 1), (50, 2)]:
+        with pytest.raises(ValueError):
+            rebin_correlograms(bin_counts=r['bin_counts'], bin_edges_sec=r['bin_edges_sec'], window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
@@ -1,7 +1,15 @@
-from typing import Any, List, Set
+from typing import Any, Callable, Dict, Iterable, List, Union
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pydantic import BaseModel
-import dendro.client as dc
+import hashlib
+import itertools
+import json
+import os
 import random
+import sqlite3
+import tempfile
+import threading
+import time
 
 
 class PipelineImportedFile(BaseModel):
@@ -43,11 +51,19 @@ class PipelineJob(BaseModel):
 
 
 class Pipeline:
-    def __init__(self, *, project_id: str):
+    def __init__(self, *, project_id: str, client: Any = None, state_file: Union[str, None] = None):
         self.project_id = project_id
+        # local record of what has already been submitted, so that reruns
+        # only send new or changed files and jobs
+        self.state_file = state_file
         self.jobs: List[PipelineJob] = []
         self.imported_files: List[PipelineImportedFile] = []
         self.validator = PipelineValidator()
+        # dendro.client, or a stand-in with the same functions (as in the
+        # tests)
+        if client is None:
+            import dendro.client as client
+        self.client = client
 
     def add_imported_file(self, imported_file: PipelineImportedFile):
         self.validator.add_imported_file(imported_file)
@@ -57,20 +73,87 @@ class Pipeline:
         self.validator.add_job(job)
         self.jobs.append(job)
 
-    def submit(self):
-        project = dc.load_project(self.project_id)
-        for file in self.imported_files:
-            dc.set_file(
+    def submit(self, *, num_threads: int = 8, max_retries: int = 5):
+        """Register the imported files and submit the jobs concurrently.
+
+        Requests run on a pool of num_threads threads and are retried with
+        exponential backoff. A job is only submitted once all of its input
+        files exist in the project, that is, once the imported file has been
+        registered or the job producing it has been submitted. The metadata of
+        the outputs of a job is set once the job has been submitted.
+
+        If the pipeline has a state_file, files, jobs and output metadata
+        that were already submitted with identical content are skipped, and
+        the batch id of the first submission is reused.
+        """
+        self._submit_items(
+            itertools.chain(self.imported_files, self.jobs),
+            validator=None,
+            num_threads=num_threads,
+            max_retries=max_retries
+        )
+
+    def submit_stream(
+        self,
+        items: Iterable[Union[PipelineImportedFile, PipelineJob]],
+        *,
+        num_threads: int = 8,
+        max_retries: int = 5,
+        max_pending: int = 1000
+    ):
+        """Validate and submit imported files and jobs as they are generated.
+
+        Same as calling add_imported_file/add_job for each item and then
+        submit(), except that the items are not kept: each one is validated
+        and scheduled as soon as it is produced, and consuming the iterable
+        pauses while more than max_pending requests are unfinished. This lets
+        a pipeline with a very large number of jobs be built lazily. The file
+        names seen by the validator are kept in a temporary database on disk,
+        so memory does not grow with the number of items.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            validator = PipelineValidator(path=os.path.join(tmpdir, 'files.db'))
+            try:
+                self._submit_items(
+                    items,
+                    validator=validator,
+                    num_threads=num_threads,
+                    max_retries=max_retries,
+                    max_pending=max_pending
+                )
+            finally:
+                validator.close()
+
+    def _submit_items(
+        self,
+        items: Iterable[Union[PipelineImportedFile, PipelineJob]],
+        *,
+        validator: Union['PipelineValidator', None],
+        num_threads: int,
+        max_retries: int,
+        max_pending: Union[int, None] = None
+    ):
+        client = self.client
+        state = PipelineSubmissionState(path=self.state_file, project_id=self.project_id)
+        project = client.load_project(self.project_id)
+        batch_id = state.batch_id
+
+        def call(fn, **kwargs):
+            return _call_with_retries(lambda: fn(**kwargs), max_retries=max_retries)
+
+        def set_file(file: PipelineImportedFile):
+            call(
+                client.set_file,
                 project=project,
                 file_name=file.fname,
                 url=file.url,
                 metadata=file.metadata
             )
+            state.record('files', file.fname, _content_hash(file))
 
-        batch_id = _random_batch_id()
-        for job in self.jobs:
+        def submit_job(job: PipelineJob):
             input_files = [
-                dc.SubmitJobInputFile(
+                client.SubmitJobInputFile(
                     name=ff.name,
                     file_name=ff.fname,
                     is_folder=False
@@ -78,7 +161,7 @@ class Pipeline:
                 for ff in job.inputs
             ]
             output_files = [
-                dc.SubmitJobOutputFile(
+                client.SubmitJobOutputFile(
                     name=ff.name,
                     file_name=ff.fname,
                     is_folder=False,
@@ -87,19 +170,20 @@ class Pipeline:
                 for ff in job.outputs
             ]
             parameters = [
-                dc.SubmitJobParameter(
+                client.SubmitJobParameter(
                     name=pp.name,
                     value=pp.value
                 )
                 for pp in job.parameters
             ]
-            required_resources = dc.DendroJobRequiredResources(
+            required_resources = client.DendroJobRequiredResources(
                 numCpus=job.required_resources.num_cpus,
                 numGpus=job.required_resources.num_gpus,
                 memoryGb=job.required_resources.memory_gb,
                 timeSec=job.required_resources.time_sec
             )
-            dc.submit_job(
+            submitted_job = call(
+                client.submit_job,
                 project=project,
                 processor_name=job.processor_name,
                 input_files=input_files,
@@ -110,17 +194,230 @@ class Pipeline:
                 required_resources=required_resources,
                 run_method=job.run_method  # type: ignore
             )
-            for ff in job.outputs:
-                dc.set_file_metadata(
-                    project=project,
-                    file_name=ff.fname,
-                    metadata=ff.metadata
-                )
+            state.record('jobs', _content_hash(job), {
+                'batch_id': batch_id,
+                'job_id': getattr(submitted_job, 'jobId', None)
+            })
+
+        def set_file_metadata(ff: PipelineJobOutput):
+            # dendro.client has no bulk metadata endpoint, so these are
+            # sent concurrently instead
+            call(
+                client.set_file_metadata,
+                project=project,
+                file_name=ff.fname,
+                metadata=ff.metadata
+            )
+            state.record('file_metadata', ff.fname, _content_hash(ff))
+
+        num_skipped = 0
+        try:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                scheduler = _DependencyScheduler(executor)
+                for item in items:
+                    if isinstance(item, PipelineImportedFile):
+                        if validator is not None:
+                            validator.add_imported_file(item)
+                        done = state.get('files', item.fname) == _content_hash(item)
+                        scheduler.add(set_file, item, provides=[item.fname], requires=[], done=done)
+                        num_skipped += done
+                    elif isinstance(item, PipelineJob):
+                        if validator is not None:
+                            validator.add_job(item)
+                        done = state.get('jobs', _content_hash(item)) is not None
+                        job_outputs = [ff.fname for ff in item.outputs]
+                        scheduler.add(submit_job, item, provides=job_outputs, requires=[ff.fname for ff in item.inputs], done=done)
+                        num_skipped += done
+                        for ff in item.outputs:
+                            done = state.get('file_metadata', ff.fname) == _content_hash(ff)
+                            scheduler.add(set_file_metadata, ff, provides=[], requires=[ff.fname], done=done)
+                            num_skipped += done
+                    else:
+                        raise ValueError(f'Unexpected pipeline item: {item}')
+                    if max_pending is not None:
+                        scheduler.wait(max_pending=max_pending)
+                scheduler.wait()
+        finally:
+            state.close()
+        if num_skipped > 0:
+            print(f'Skipped {num_skipped} files, jobs and metadata updates that were already submitted')
+
+
+class _DependencyScheduler:
+    """Runs tasks on an executor, each one as soon as the unfinished tasks
+    providing the names it requires have completed. A required name that is
+    not provided by an unfinished task is taken to exist already, so tasks
+    must be added after the tasks providing their inputs. Only unfinished
+    tasks are kept."""
+    def __init__(self, executor: Executor):
+        self._executor = executor
+        self._next_task_id = 0
+        self._tasks: Dict[int, tuple] = {}
+        self._num_waiting_on: Dict[int, int] = {}
+        self._dependents: Dict[int, List[int]] = {}
+        self._pending_providers: Dict[str, int] = {}
+        self._futures: Dict[Future, int] = {}
+
+    def add(self, fn: Callable[[Any], None], arg: Any, *, provides: List[str], requires: List[str], done: bool = False):
+        """Add a task. A task with done=True is not run (its names are taken
+        to exist already)."""
+        if done:
+            return
+        i = self._next_task_id
+        self._next_task_id += 1
+        deps = set(self._pending_providers[name] for name in requires if name in self._pending_providers)
+        self._tasks[i] = (fn, arg, provides)
+        self._num_waiting_on[i] = len(deps)
+        for d in deps:
+            self._dependents.setdefault(d, []).append(i)
+        for name in provides:
+            self._pending_providers[name] = i
+        if len(deps) == 0:
+            self._start(i)
+
+    @property
+    def num_pending(self):
+        return len(self._tasks)
+
+    def wait(self, *, max_pending: int = 0):
+        """Wait until at most max_pending tasks are unfinished. Re-raises the
+        exception of a failed task."""
+        while len(self._tasks) > max_pending:
+            done, _ = wait(list(self._futures.keys()), return_when=FIRST_COMPLETED)
+            for future in done:
+                i = self._futures.pop(future)
+                future.result()
+                self._complete(i)
+
+    def _start(self, i: int):
+        fn, arg, _ = self._tasks[i]
+        self._futures[self._executor.submit(fn, arg)] = i
+
+    def _complete(self, i: int):
+        _, _, provides = self._tasks.pop(i)
+        del self._num_waiting_on[i]
+        for name in provides:
+            if self._pending_providers.get(name) == i:
+                del self._pending_providers[name]
+        for j in self._dependents.pop(i, []):
+            self._num_waiting_on[j] -= 1
+            if self._num_waiting_on[j] == 0:
+                self._start(j)
+
+
+class PipelineSubmissionState:
+    """Local JSON record of what a pipeline has submitted to a project.
+
+    Imported files and output metadata are recorded by file name with a hash
+    of their content, and jobs by a hash of their full specification. The
+    batch id is kept so that all submissions of a pipeline share one batch.
+    With path=None nothing is recorded.
+
+    Each record is appended as a line to <path>.journal, so recording costs
+    the same however large the state is. The state at path is a snapshot
+    that the journal is replayed onto when loading; it is rewritten (and the
+    journal emptied) when the journal has grown as large as the state, and
+    on close. A line cut short by a killed process is ignored.
+    """
+    def __init__(self, *, path: Union[str, None], project_id: str, min_compaction_records: int = 10000):
+        self.path = path
+        self.min_compaction_records = min_compaction_records
+        self._lock = threading.Lock()
+        self._state: Dict[str, Any] = {}
+        self._num_records = 0
+        self._num_journal_records = 0
+        self._journal: Any = None
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self._state = json.load(f)
+        if self._state.get('project_id') != project_id:
+            self._state = {'project_id': project_id, 'batch_id': _random_batch_id()}
+            # the journal of another project (or of no snapshot) is dropped
+            # by writing the new snapshot
+            self._write_snapshot()
+        for section in ['files', 'jobs', 'file_metadata']:
+            self._state.setdefault(section, {})
+        if path is not None:
+            self._replay_journal()
+            self._journal = open(self._journal_path, 'a')
+        self._num_records = sum(len(self._state[section]) for section in ['files', 'jobs', 'file_metadata'])
+
+    @property
+    def batch_id(self) -> str:
+        return self._state['batch_id']
+
+    def get(self, section: str, key: str):
+        with self._lock:
+            return self._state[section].get(key, None)
+
+    def record(self, section: str, key: str, value: Any):
+        with self._lock:
+            if key not in self._state[section]:
+                self._num_records += 1
+            self._state[section][key] = value
+            if self._journal is None:
+                return
+            self._journal.write(json.dumps({'section': section, 'key': key, 'value': value}) + '\n')
+            self._journal.flush()
+            self._num_journal_records += 1
+            if self._num_journal_records >= max(self.min_compaction_records, self._num_records):
+                self._compact()
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            self._compact()
+
+    def close(self):
+        self.save()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    @property
+    def _journal_path(self) -> str:
+        return f'{self.path}.journal'
+
+    def _compact(self):
+        # called with the lock held
+        self._write_snapshot()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = open(self._journal_path, 'a')
+
+    def _write_snapshot(self):
+        if self.path is None:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._state, f)
+        os.replace(tmp_path, self.path)
+        # the records of the journal are all in the snapshot now
+        with open(self._journal_path, 'w'):
+            pass
+        self._num_journal_records = 0
+
+    def _replay_journal(self):
+        if not os.path.exists(self._journal_path):
+            return
+        with open(self._journal_path) as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue
+                self._state[r['section']][r['key']] = r['value']
+                self._num_journal_records += 1
 
 
 class PipelineValidator:
-    def __init__(self):
-        self.files: Set[str] = set()
+    """Checks that each imported file and job output is a new file name and
+    that the inputs of each job exist. The file names are kept in memory,
+    or, with a path, in an SQLite database at that path."""
+    def __init__(self, *, path: Union[str, None] = None):
+        self.files: Any = set() if path is None else _SqliteFileSet(path)
 
     def add_imported_file(self, imported_file: PipelineImportedFile):
         if imported_file.fname in self.files:
@@ -136,6 +433,47 @@ class PipelineValidator:
                 raise ValueError(f'Cannot add job {job.processor_name}. Output file {output.fname} already exists in pipeline.')
             self.files.add(output.fname)
 
+    def close(self):
+        if isinstance(self.files, _SqliteFileSet):
+            self.files.close()
+
+
+class _SqliteFileSet:
+    # set of strings in an SQLite table; it is scratch data, so there is no
+    # rollback journal and nothing is synced to disk
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode = OFF')
+        self._conn.execute('PRAGMA synchronous = OFF')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS files (fname TEXT PRIMARY KEY)')
+
+    def __contains__(self, fname: str) -> bool:
+        return self._conn.execute('SELECT 1 FROM files WHERE fname = ?', (fname,)).fetchone() is not None
+
+    def add(self, fname: str):
+        self._conn.execute('INSERT OR IGNORE INTO files (fname) VALUES (?)', (fname,))
+
+    def close(self):
+        self._conn.close()
+
+
+def _content_hash(model: BaseModel) -> str:
+    data = model.model_dump() if hasattr(model, 'model_dump') else model.dict()
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def _call_with_retries(fn: Callable[[], Any], *, max_retries: int, initial_delay_sec: float = 1):
+    delay_sec = initial_delay_sec
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            print(f'Request failed ({e}); retrying in {delay_sec:.1f} seconds')
+            time.sleep(delay_sec * (1 + random.random()))
+            delay_sec = delay_sec * 2
+
 
 def _random_batch_id(num_chars: int = 12) -> str:
     choices = 'abcdefghijklmnopqrstuvwxyz0123456789'
@@ -0,0 +1,30 @@
+from typing import Iterator, Union
+import json
+
+
+def iter_asset_index(path: str, *, dandiset_id: Union[str, None] = None) -> Iterator[dict]:
+    """Yield the assets listed in a local snapshot of lindi URLs.
+
+    The snapshot is either a .jsonl file with one asset per line (read
+    lazily) or a .json file containing a list of assets. Each asset has
+    dandiset_id, dandiset_version, asset_id and path, and optionally url
+    (defaults to the lindi.neurosift.org URL of the asset).
+    """
+    for asset in _iter_records(path):
+        if dandiset_id is not None and asset['dandiset_id'] != dandiset_id:
+            continue
+        if 'url' not in asset:
+            asset['url'] = f'https://lindi.neurosift.org/dandi/dandisets/{asset["dandiset_id"]}/assets/{asset["asset_id"]}/zarr.json'
+        yield asset
+
+
+def _iter_records(path: str):
+    if path.endswith('.jsonl'):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    else:
+        with open(path) as f:
+            yield from json.load(f)
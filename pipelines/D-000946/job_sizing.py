@@ -0,0 +1,205 @@
+from typing import Any, Iterable, Iterator, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel
+import argparse
+import collections
+import json
+import math
+import os
+import sys
+import urllib.request
+from Pipeline import PipelineJobRequiredResources
+
+# the reference file systems are indexed as in the neurosift-1 processors
+neurosift_app_directory = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'dendro_apps', 'neurosift-1'))
+sys.path.insert(0, neurosift_app_directory)
+
+from common.nwb_index import NwbIndex  # noqa: E402
+
+
+class AssetStatistics(BaseModel):
+    num_units: int
+    num_spikes: int
+
+
+class CostModel(BaseModel):
+    """Coefficients for predicting job resources. The defaults are rough
+    estimates with a large safety factor. calibrate_cost_model derives the
+    per-spike times from the results of the neurosift-1 benchmarks
+    (benchmarks/run_benchmarks.py), and the calibrated model is saved as JSON
+    and loaded with load_cost_model:
+
+        python job_sizing.py calibrate results.json --output cost_model.json
+    """
+    # overall
+    base_memory_gb: float = 1
+    base_time_sec: float = 300
+    time_safety_factor: float = 4
+    min_time_sec: int = 60 * 15
+    max_time_sec: int = 60 * 60 * 24
+    max_num_cpus: int = 4
+    max_memory_gb: int = 16
+    # autocorrelograms
+    autocorrelograms_read_sec_per_spike: float = 4e-7
+    autocorrelograms_compute_sec_per_spike: float = 2e-6
+    autocorrelograms_bytes_per_spike: float = 72
+    autocorrelograms_spikes_per_cpu: float = 5e6
+
+
+def load_cost_model(path: str) -> CostModel:
+    with open(path) as f:
+        return CostModel(**json.load(f))
+
+
+def calibrate_cost_model(benchmark_results: dict, *, cost_model: CostModel = CostModel()) -> CostModel:
+    """Set the per-spike read and compute times of the autocorrelograms from
+    benchmark results (the output of run_benchmarks.py run). The
+    single-worker runs of the autocorrelograms_processor benchmark that load
+    all spike times at once are used, with the wall time of the read and
+    compute stages of the run_metrics the processor emitted
+    (common/instrumentation.py), and the slowest per-spike time of them is
+    kept. Without them, the compute time falls back to the
+    autocorrelograms_batch benchmark and the read time is unchanged."""
+    read_sec_per_spike = []
+    compute_sec_per_spike = []
+    batch_compute_sec_per_spike = []
+    for result in benchmark_results['results']:
+        if 'skipped' in result:
+            continue
+        params = result['params']
+        num_spikes = params.get('num_spikes', 0)
+        if num_spikes == 0:
+            continue
+        if result['name'] == 'autocorrelograms_processor':
+            if params.get('num_workers') != 1 or 'memory_budget_mb' in params:
+                continue
+            stages = (result.get('run_metrics') or {}).get('stages', {})
+            if 'read' in stages:
+                read_sec_per_spike.append(stages['read']['wall_sec'] / num_spikes)
+            if 'compute' in stages:
+                compute_sec_per_spike.append(stages['compute']['wall_sec'] / num_spikes)
+        elif result['name'] == 'autocorrelograms_batch':
+            batch_compute_sec_per_spike.append(result['min_sec'] / num_spikes)
+    if len(compute_sec_per_spike) == 0:
+        compute_sec_per_spike = batch_compute_sec_per_spike
+    updates = {}
+    if len(read_sec_per_spike) > 0:
+        updates['autocorrelograms_read_sec_per_spike'] = max(read_sec_per_spike)
+    if len(compute_sec_per_spike) > 0:
+        updates['autocorrelograms_compute_sec_per_spike'] = max(compute_sec_per_spike)
+    if len(updates) == 0:
+        raise ValueError('No autocorrelograms benchmark results to calibrate from')
+    return CostModel(**{**_model_dict(cost_model), **updates})
+
+
+def load_asset_statistics(url: str, *, timeout_sec: float = 60) -> AssetStatistics:
+    """Get the unit and spike counts of an asset from its lindi reference
+    file system JSON, without reading any array data."""
+    with urllib.request.urlopen(url, timeout=timeout_sec) as response:
+        rfs = json.loads(response.read())
+    return get_asset_statistics_from_rfs(rfs)
+
+
+def get_asset_statistics_from_rfs(rfs: dict) -> AssetStatistics:
+    """Sum the unit and spike counts of the units tables (wherever they are
+    in the file) from the shapes of their spike_times and spike_times_index
+    datasets."""
+    index = NwbIndex(rfs)
+    num_units = 0
+    num_spikes = 0
+    for units in index.find('Units'):
+        spike_times = index.get_child(units, 'spike_times')
+        spike_times_index = index.get_child(units, 'spike_times_index')
+        if spike_times is None or spike_times_index is None or not spike_times.shape or not spike_times_index.shape:
+            continue
+        num_spikes += spike_times.shape[0]
+        num_units += spike_times_index.shape[0]
+    return AssetStatistics(num_units=num_units, num_spikes=num_spikes)
+
+
+def iter_asset_statistics(
+    assets: Iterable[dict],
+    *,
+    num_threads: int = 8
+) -> Iterator[Tuple[dict, Union[AssetStatistics, None]]]:
+    """Yield (asset, statistics) in order, loading the statistics of up to
+    2 * num_threads assets ahead on a thread pool. The statistics are None if
+    they could not be loaded."""
+    def load(asset: dict):
+        try:
+            return load_asset_statistics(asset['url'])
+        except Exception as e:
+            print(f'Unable to load statistics for {asset["url"]}: {e}')
+            return None
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        pending: Any = collections.deque()
+        for asset in assets:
+            pending.append((asset, executor.submit(load, asset)))
+            if len(pending) >= 2 * num_threads:
+                a, f = pending.popleft()
+                yield a, f.result()
+        while pending:
+            a, f = pending.popleft()
+            yield a, f.result()
+
+
+def estimate_autocorrelograms_resources(
+    statistics: AssetStatistics,
+    *,
+    memory_budget_mb: Union[int, None] = None,
+    cost_model: CostModel = CostModel()
+) -> PipelineJobRequiredResources:
+    """If memory_budget_mb is given the spike times are assumed to be
+    streamed within that budget (see the memory_budget_mb parameter of the
+    processor)."""
+    m = cost_model
+    num_cpus = _clamp(math.ceil(statistics.num_spikes / m.autocorrelograms_spikes_per_cpu), 1, m.max_num_cpus)
+    spike_memory_gb = statistics.num_spikes * m.autocorrelograms_bytes_per_spike / 1e9
+    if memory_budget_mb is not None:
+        spike_memory_gb = min(spike_memory_gb, memory_budget_mb / 1024)
+    memory_gb = _clamp(math.ceil(m.base_memory_gb + spike_memory_gb), 1, m.max_memory_gb)
+    time_sec = m.base_time_sec + statistics.num_spikes * (
+        m.autocorrelograms_read_sec_per_spike + m.autocorrelograms_compute_sec_per_spike / num_cpus
+    )
+    return PipelineJobRequiredResources(
+        num_cpus=num_cpus,
+        num_gpus=0,
+        memory_gb=memory_gb,
+        time_sec=_clamp(int(time_sec * m.time_safety_factor), m.min_time_sec, m.max_time_sec)
+    )
+
+
+def _clamp(x, lo, hi):
+    return max(lo, min(hi, x))
+
+
+def _model_dict(model: BaseModel) -> dict:
+    return model.model_dump() if hasattr(model, 'model_dump') else model.dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Job sizing for the D-000946 pipeline')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    calibrate_parser = subparsers.add_parser('calibrate', help='Calibrate the cost model from neurosift-1 benchmark results')
+    calibrate_parser.add_argument('benchmark_results', help='Output of benchmarks/run_benchmarks.py run')
+    calibrate_parser.add_argument('--base', default=None, help='Cost model to start from (default: the built-in one)')
+    calibrate_parser.add_argument('--output', default=None, help='Cost model file (default: print only)')
+    args = parser.parse_args()
+
+    if args.command == 'calibrate':
+        with open(args.benchmark_results) as f:
+            benchmark_results = json.load(f)
+        base = load_cost_model(args.base) if args.base is not None else CostModel()
+        cost_model = calibrate_cost_model(benchmark_results, cost_model=base)
+        text = json.dumps(_model_dict(cost_model), indent=2)
+        if args.output is not None:
+            with open(args.output, 'w') as f:
+                f.write(text + '\n')
+            print(f'Wrote {args.output}')
+        else:
+            print(text)
+
+
+if __name__ == '__main__':
+    main()
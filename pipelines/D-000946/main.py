@@ -1,47 +1,88 @@
-from Pipeline import Pipeline, PipelineJob, PipelineJobInput, PipelineJobOutput, PipelineJobRequiredResources, PipelineImportedFile
+import os
+import sys
+from typing import Iterable, Iterator, Union
+from Pipeline import Pipeline, PipelineJob, PipelineJobInput, PipelineJobOutput, PipelineJobParameter, PipelineJobRequiredResources, PipelineImportedFile
+from asset_index import iter_asset_index
+from job_sizing import AssetStatistics, CostModel, estimate_autocorrelograms_resources, iter_asset_statistics, load_cost_model
+
+
+# parameter of the autocorrelograms processor, also used for sizing the jobs
+autocorrelograms_memory_budget_mb = 2048
+# written by python job_sizing.py calibrate; the built-in cost model is used
+# if it does not exist
+cost_model_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cost_model.json')
 
 
 def main():
     # 000946 (draft): Neural Pathways Modulation in the Anesthetized Rat Elicited by Trials of Transcranial Focused Ultrasound Stimulation
     dandiset_id = '000946'
-    dandiset_version = 'draft'
     # project: D-000946
-    pipeline = Pipeline(project_id='20607ea8')
-    files = [
-        {
-            'name': '000946/sub-BH494/sub-BH494_ses-20230820T131000_ecephys.nwb.lindi.json',
-            'url': 'https://lindi.neurosift.org/dandi/dandisets/000946/assets/c566ed9d-f27a-4e52-b47d-4408611f80ed/zarr.json',
-            'asset_id': 'c566ed9d-f27a-4e52-b47d-4408611f80ed'
-        }
-    ]
-    for file in files:
-        name = file['name']
-        url = file['url']
-        pipeline.add_imported_file(PipelineImportedFile(
+    pipeline = Pipeline(
+        project_id='20607ea8',
+        state_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), '.pipeline_state.json')
+    )
+    if len(sys.argv) > 1:
+        # python main.py <asset index .json/.jsonl>: all assets of the dandiset in the index
+        assets: Iterable[dict] = iter_asset_index(sys.argv[1], dandiset_id=dandiset_id)
+    else:
+        assets = [
+            {
+                'dandiset_id': dandiset_id,
+                'dandiset_version': 'draft',
+                'asset_id': 'c566ed9d-f27a-4e52-b47d-4408611f80ed',
+                'path': 'sub-BH494/sub-BH494_ses-20230820T131000_ecephys.nwb',
+                'url': 'https://lindi.neurosift.org/dandi/dandisets/000946/assets/c566ed9d-f27a-4e52-b47d-4408611f80ed/zarr.json'
+            }
+        ]
+    cost_model = load_cost_model(cost_model_file) if os.path.exists(cost_model_file) else CostModel()
+    # the files and jobs are generated lazily and submitted as they come
+    pipeline.submit_stream(iter_pipeline_items(assets, cost_model=cost_model))
+
+
+def iter_pipeline_items(assets: Iterable[dict], *, cost_model: CostModel) -> Iterator[Union[PipelineImportedFile, PipelineJob]]:
+    # the sizes of the units tables are read from the lindi reference file
+    # systems (no array data) to size each job
+    for asset, statistics in iter_asset_statistics(assets):
+        if statistics is not None and statistics.num_units == 0:
+            print(f'Skipping {asset["path"]}: no units')
+            continue
+        dandiset_id = asset['dandiset_id']
+        dandiset_version = asset.get('dandiset_version', 'draft')
+        name = f'{dandiset_id}/{asset["path"]}.lindi.json'
+        yield PipelineImportedFile(
             fname=f'imported/{name}',
-            url=url,
+            url=asset['url'],
             metadata={
                 'dandisetId': dandiset_id,
                 'dandisetVersion': dandiset_version,
-                'dandiAssetId': file['asset_id']
+                'dandiAssetId': asset['asset_id']
             }
-        ))
-        create_autocorrelograms(
-            pipeline=pipeline,
+        )
+        yield create_autocorrelograms_job(
             input=f'imported/{name}',
             output=f'generated/{name}/autocorrelograms.nwb.lindi.json',
             metadata={
                 'dandisetId': dandiset_id,
                 'dandisetVersion': dandiset_version,
-                'dandiAssetId': file['asset_id'],
+                'dandiAssetId': asset['asset_id'],
                 'supplemental': True
-            }
+            },
+            statistics=statistics,
+            cost_model=cost_model
         )
-    pipeline.submit()
 
 
-def create_autocorrelograms(*, pipeline: Pipeline, input: str, output: str, metadata: dict):
-    pipeline.add_job(PipelineJob(
+def create_autocorrelograms_job(*, input: str, output: str, metadata: dict, statistics: Union[AssetStatistics, None], cost_model: CostModel):
+    if statistics is not None:
+        required_resources = estimate_autocorrelograms_resources(statistics, memory_budget_mb=autocorrelograms_memory_budget_mb, cost_model=cost_model)
+    else:
+        required_resources = PipelineJobRequiredResources(
+            num_cpus=4,
+            num_gpus=0,
+            memory_gb=4,
+            time_sec=60 * 60 * 24
+        )
+    return PipelineJob(
         processor_name='neurosift-1.autocorrelograms',
         inputs=[
             PipelineJobInput(name='input', fname=input)
@@ -49,15 +90,15 @@ def create_autocorrelograms(*, pipeline: Pipeline, input: str, output: str, meta
         outputs=[
             PipelineJobOutput(name='output', fname=output, metadata=metadata)
         ],
-        parameters=[],
-        required_resources=PipelineJobRequiredResources(
-            num_cpus=4,
-            num_gpus=0,
-            memory_gb=16,
-            time_sec=60 * 60 * 24
-        ),
+        parameters=[
+            # use all the CPUs allocated to the job
+            PipelineJobParameter(name='num_workers', value=0),
+            # stream the spike times so that the job fits in memory_gb
+            PipelineJobParameter(name='memory_budget_mb', value=autocorrelograms_memory_budget_mb)
+        ],
+        required_resources=required_resources,
         run_method='local'
-    ))
+    )
 
 
 if __name__ == '__main__':
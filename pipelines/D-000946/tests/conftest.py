@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the pipeline modules are imported relative to the pipeline directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,64 @@
+from typing import Any, Dict, List, Tuple
+import threading
+import types
+
+
+class TransientError(Exception):
+    pass
+
+
+class FakeDendroClient:
+    """Stand-in for dendro.client recording the requests made to one
+    project. A job can only be submitted once its input files exist, and the
+    metadata of a file can only be set once it exists; the outputs of a job
+    exist once it is submitted. transient_failures maps (function name, file
+    name) to the number of calls that fail before one succeeds (jobs are
+    identified by their first output file)."""
+    SubmitJobInputFile = types.SimpleNamespace
+    SubmitJobOutputFile = types.SimpleNamespace
+    SubmitJobParameter = types.SimpleNamespace
+    DendroJobRequiredResources = types.SimpleNamespace
+
+    def __init__(self):
+        self.transient_failures: Dict[Tuple[str, str], int] = {}
+        # successful requests, in order, as (function name, file name)
+        self.calls: List[Tuple[str, str]] = []
+        self.num_failed_calls = 0
+        self.files: Dict[str, dict] = {}
+        self.jobs: List[dict] = []
+        self._lock = threading.Lock()
+
+    def load_project(self, project_id: str):
+        return types.SimpleNamespace(projectId=project_id)
+
+    def set_file(self, *, project: Any, file_name: str, url: str, metadata: dict):
+        with self._lock:
+            self._fail_if_requested('set_file', file_name)
+            self.files[file_name] = {'url': url, 'metadata': metadata}
+            self.calls.append(('set_file', file_name))
+
+    def submit_job(self, *, project: Any, processor_name: str, input_files: list, output_files: list, parameters: list, batch_id: str, rerun_policy: str, required_resources: Any, run_method: str):
+        with self._lock:
+            self._fail_if_requested('submit_job', output_files[0].file_name)
+            for ff in input_files:
+                assert ff.file_name in self.files, f'Job {processor_name} submitted before its input {ff.file_name} exists'
+            job_id = f'job-{len(self.jobs)}'
+            self.jobs.append({'job_id': job_id, 'processor_name': processor_name, 'batch_id': batch_id, 'outputs': [ff.file_name for ff in output_files]})
+            for ff in output_files:
+                self.files[ff.file_name] = {'job_id': job_id, 'metadata': {}}
+            self.calls.append(('submit_job', output_files[0].file_name))
+            return types.SimpleNamespace(jobId=job_id)
+
+    def set_file_metadata(self, *, project: Any, file_name: str, metadata: dict):
+        with self._lock:
+            self._fail_if_requested('set_file_metadata', file_name)
+            assert file_name in self.files, f'Metadata of {file_name} set before the file exists'
+            self.files[file_name]['metadata'] = metadata
+            self.calls.append(('set_file_metadata', file_name))
+
+    def _fail_if_requested(self, name: str, file_name: str):
+        n = self.transient_failures.get((name, file_name), 0)
+        if n > 0:
+            self.transient_failures[(name, file_name)] = n - 1
+            self.num_failed_calls += 1
+            raise TransientError(f'{name} {file_name} failed')
@@ -0,0 +1,122 @@
+import json
+import pytest
+import Pipeline as pipeline_module
+from Pipeline import Pipeline, PipelineImportedFile, PipelineJob, PipelineJobInput, PipelineJobOutput, PipelineJobRequiredResources
+from fake_dendro_client import FakeDendroClient, TransientError
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(pipeline_module.time, 'sleep', lambda sec: None)
+
+
+def _job(name: str, inputs, outputs):
+    return PipelineJob(
+        processor_name=name,
+        inputs=[PipelineJobInput(name='input', fname=fname) for fname in inputs],
+        outputs=[PipelineJobOutput(name='output', fname=fname, metadata={'produced_by': name}) for fname in outputs],
+        parameters=[],
+        required_resources=PipelineJobRequiredResources(num_cpus=1, num_gpus=0, memory_gb=1, time_sec=60),
+        run_method='local'
+    )
+
+
+def _make_items(num_assets: int):
+    # for each asset: an imported file, a job on it and a job on the output
+    # of the first job and the imported file
+    items = []
+    for i in range(num_assets):
+        items.append(PipelineImportedFile(fname=f'imported/{i}.nwb.lindi.json', url=f'https://example.org/{i}', metadata={'i': i}))
+        items.append(_job('first', [f'imported/{i}.nwb.lindi.json'], [f'first/{i}.nwb.lindi.json']))
+        items.append(_job('second', [f'imported/{i}.nwb.lindi.json', f'first/{i}.nwb.lindi.json'], [f'second/{i}.nwb.lindi.json']))
+    return items
+
+
+def _submit(pipeline: Pipeline, items, *, stream: bool, **kwargs):
+    if stream:
+        pipeline.submit_stream(iter(items), **kwargs)
+        return
+    for item in items:
+        if isinstance(item, PipelineImportedFile):
+            pipeline.add_imported_file(item)
+        else:
+            pipeline.add_job(item)
+    pipeline.submit(**kwargs)
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_jobs_after_their_inputs(stream):
+    client = FakeDendroClient()
+    _submit(Pipeline(project_id='p', client=client), _make_items(20), stream=stream, num_threads=8)
+    assert len(client.jobs) == 40
+    # each request happened after those creating the files it uses (the
+    # fake client also checks it when the request is made)
+    position = {call: k for k, call in enumerate(client.calls)}
+    for i in range(20):
+        assert position[('set_file', f'imported/{i}.nwb.lindi.json')] < position[('submit_job', f'first/{i}.nwb.lindi.json')]
+        assert position[('submit_job', f'first/{i}.nwb.lindi.json')] < position[('submit_job', f'second/{i}.nwb.lindi.json')]
+    assert len(set(job['batch_id'] for job in client.jobs)) == 1
+
+
+def test_metadata_set_after_job():
+    client = FakeDendroClient()
+    _submit(Pipeline(project_id='p', client=client), _make_items(10), stream=True, num_threads=8)
+    position = {call: k for k, call in enumerate(client.calls)}
+    for i in range(10):
+        for name in ['first', 'second']:
+            fname = f'{name}/{i}.nwb.lindi.json'
+            assert position[('submit_job', fname)] < position[('set_file_metadata', fname)]
+            assert client.files[fname]['metadata'] == {'produced_by': name}
+
+
+def test_retry_after_transient_failures():
+    client = FakeDendroClient()
+    client.transient_failures = {
+        ('set_file', 'imported/0.nwb.lindi.json'): 2,
+        ('submit_job', 'first/1.nwb.lindi.json'): 3,
+        ('set_file_metadata', 'second/2.nwb.lindi.json'): 1
+    }
+    _submit(Pipeline(project_id='p', client=client), _make_items(3), stream=False, max_retries=3)
+    assert client.num_failed_calls == 6
+    assert len(client.jobs) == 6
+    # each request succeeded once
+    assert len(client.calls) == len(set(client.calls)) == 3 + 6 + 6
+
+
+def test_failure_after_max_retries():
+    client = FakeDendroClient()
+    client.transient_failures = {('submit_job', 'first/0.nwb.lindi.json'): 3}
+    with pytest.raises(TransientError):
+        _submit(Pipeline(project_id='p', client=client), _make_items(1), stream=True, max_retries=2)
+    # the job depending on the failed one was not submitted
+    assert [call for call in client.calls if call[0] == 'submit_job'] == []
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_resume_from_state_file(tmp_path, stream):
+    state_file = str(tmp_path / 'state.json')
+    client = FakeDendroClient()
+    # the second job of asset 1 keeps failing, so the first run stops there
+    client.transient_failures = {('submit_job', 'second/1.nwb.lindi.json'): 100}
+    items = _make_items(3)
+    with pytest.raises(TransientError):
+        _submit(Pipeline(project_id='p', client=client, state_file=state_file), items, stream=stream, num_threads=1, max_retries=1)
+    calls_before = list(client.calls)
+    assert ('submit_job', 'first/0.nwb.lindi.json') in calls_before
+    assert ('submit_job', 'second/1.nwb.lindi.json') not in calls_before
+    with open(state_file) as f:
+        batch_id = json.load(f)['batch_id']
+
+    client.transient_failures = {}
+    _submit(Pipeline(project_id='p', client=client, state_file=state_file), items, stream=stream, num_threads=4)
+    new_calls = client.calls[len(calls_before):]
+    # nothing that finished in the first run is sent again
+    assert set(new_calls).isdisjoint(calls_before)
+    assert ('submit_job', 'second/1.nwb.lindi.json') in new_calls
+    assert len(client.jobs) == 6
+    assert all(job['batch_id'] == batch_id for job in client.jobs)
+
+    # a third run has nothing left to do
+    num_calls = len(client.calls)
+    _submit(Pipeline(project_id='p', client=client, state_file=state_file), items, stream=stream)
+    assert len(client.calls) == num_calls